@@ -0,0 +1,22 @@
+import time
+
+from django.core.cache import cache
+
+
+def get_version(key):
+    """
+    Returns a version stamp from the shared cache, seeding it with a fresh
+    stamp if it is missing (first start, eviction).
+    """
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), timeout=None)
@@ -1,19 +1,12 @@
-from django.shortcuts import get_list_or_404, render
+from django.shortcuts import render
 
-from category.models import Category
-from store.models import Product, ReviewRating
+from store.feed import get_home_feed
+from store.page_cache import cache_anonymous_page
 
 
+@cache_anonymous_page
 def home(request):
-    products = Product.objects.all().filter(is_available=True).order_by("-date_created")
-    product_reviews = {}
-
-    for product in products:
-        reviews = ReviewRating.objects.filter(product=product, status=True)
-        product_reviews[product.id] = reviews
-
     context = {
-        "products": products,
-        "product_reviews": product_reviews,
+        "feed": get_home_feed(),
     }
     return render(request, "home.html", context)
@@ -1,3 +1,4 @@
+import logging
 import os
 
 import requests
@@ -5,14 +6,17 @@ from django.conf import settings
 from django.contrib.auth.tokens import default_token_generator
 from django.contrib.sites.shortcuts import get_current_site
 from django.core.mail import EmailMessage
+from django.db import DatabaseError, transaction
 from django.shortcuts import redirect
 from django.template.loader import render_to_string
 from django.utils.encoding import force_bytes
 from django.utils.http import urlsafe_base64_encode
 from PIL import Image
 
-from carts.models import Cart, CartItem
-from carts.views import get_cart_id
+from carts.counter import forget_cart_item_count
+from carts.stores import DatabaseCartStore, get_guest_cart_store
+
+logger = logging.getLogger(__name__)
 
 
 def send_email(user, subject, template, context):
@@ -32,43 +36,23 @@ def send_email(user, subject, template, context):
 
 
 def merge_cart_items(request, user):
+    """
+    Merges the guest cart into the user's cart at login, in one transaction
+    and a fixed number of queries. A failed merge changes nothing: it is
+    logged, the guest cart is kept and False is returned.
+    """
+    # The guest cart's badge count doesn't apply to the merged cart
+    forget_cart_item_count(request)
+    # The guest cart may be kept elsewhere (the session by default) than the
+    # user's CartItem rows
+    guest_cart = get_guest_cart_store(request.session)
     try:
-        cart_id = get_cart_id(request)
-        cart, created = Cart.objects.get_or_create(cart_id=cart_id)
-
-        guest_cart_items = CartItem.objects.filter(cart=cart)
-        if not guest_cart_items.exists():
-            return True  # No items to merge
-
-        for guest_item in guest_cart_items:
-            # Get the variations of the guest item
-            product_variations = set(guest_item.variations.all())
-
-            # Try to find a matching cart item for the user
-            matching_item = None
-            user_cart_items = CartItem.objects.filter(
-                user=user, product=guest_item.product
-            )
-            for item in user_cart_items:
-                if product_variations == set(item.variations.all()):
-                    matching_item = item
-                    break
-
-            if matching_item:
-                # If a matching item is found, increment its quantity
-                matching_item.quantity += guest_item.quantity
-                matching_item.save()
-                guest_item.delete()  # Remove the guest item after merging
-            else:
-                # If no matching item is found, reassign the guest item to the user
-                guest_item.user = user
-                guest_item.cart = None  # Remove the guest cart association
-                guest_item.save()
-
-        return True
-    except Exception as e:
-        # Log the exception for debugging purposes
+        with transaction.atomic():
+            guest_cart.merge_into(DatabaseCartStore(request.session, user=user))
+    except DatabaseError:
+        logger.exception("Could not merge the guest cart of user %s", user.pk)
         return False
+    return True
 
 
 def redirect_to_next_page(request):
@@ -10,8 +10,6 @@ from django.utils.encoding import force_bytes
 from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
 from PIL import Image
 
-from carts.models import Cart, CartItem
-from carts.views import get_cart_id
 from orders.models import Order, OrderProduct
 
 from .config import (
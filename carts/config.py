@@ -0,0 +1,22 @@
+from decimal import Decimal
+
+# Stand-in rendered into cached pages, replaced per visitor by store.page_cache
+CART_ITEM_COUNT_PLACEHOLDER = "[[page-cache:cart-item-count]]"
+
+# Sales tax charged on cart lines, in percent
+CART_TAX_RATE = Decimal("3")
+
+# Session key holding the denormalized quantity shown on the navbar cart badge
+CART_ITEM_COUNT_SESSION_KEY = "cart_item_count"
+
+# Where guest carts are kept; carts.stores.DatabaseCartStore keeps them in
+# Cart/CartItem rows like user carts
+DEFAULT_GUEST_CART_STORE = "carts.stores.SessionCartStore"
+CART_SESSION_KEY = "cart"
+
+# Guest carts older than this whose session has expired are purged
+STALE_CART_AGE_DAYS = 30
+CART_PURGE_BATCH_SIZE = 1000
+
+# Largest batch of operations the cart update API accepts in one request
+CART_MAX_OPERATIONS = 50
@@ -0,0 +1,73 @@
+from .config import CART_ITEM_COUNT_SESSION_KEY
+from .stores import get_cart_store
+
+
+def count_cart_items(request):
+    return get_cart_store(request).count()
+
+
+def has_session(request):
+    return request.user.is_authenticated or bool(request.session.session_key)
+
+
+def keeps_count(request):
+    """
+    Whether the badge count is kept in the session. Only a guest's cart can't
+    change behind the session's back; a user's cart also changes from their
+    other sessions, so it is counted afresh.
+    """
+    return not request.user.is_authenticated
+
+
+def get_cart_item_count(request):
+    """
+    Returns the cart badge count. A guest's count is kept in the session,
+    and only stored when counting took a query, so rendering the badge
+    doesn't write the session. Guests without a session have an empty cart.
+    """
+    if not has_session(request):
+        return 0
+    if not keeps_count(request):
+        return count_cart_items(request)
+    count = request.session.get(CART_ITEM_COUNT_SESSION_KEY)
+    if count is None:
+        store = get_cart_store(request)
+        count = store.count()
+        # An expired session loads empty without a key; don't recreate it
+        if not store.count_is_free and has_session(request):
+            request.session[CART_ITEM_COUNT_SESSION_KEY] = count
+    return count
+
+
+def set_cart_item_count(request, count):
+    if not keeps_count(request):
+        return
+    count = max(count, 0)
+    # Unchanged values aren't set, that would save the session again
+    if request.session.get(CART_ITEM_COUNT_SESSION_KEY) != count:
+        request.session[CART_ITEM_COUNT_SESSION_KEY] = count
+
+
+def sync_cart_item_count(request, count):
+    """
+    Corrects the badge count from a page that counted the cart anyway, but
+    never creates a session for it.
+    """
+    if has_session(request):
+        set_cart_item_count(request, count)
+
+
+def adjust_cart_item_count(request, delta):
+    """
+    Applies a cart mutation to the badge count. When the session has no
+    count yet the cart, which already includes the change, is counted.
+    """
+    count = request.session.get(CART_ITEM_COUNT_SESSION_KEY)
+    if count is None:
+        set_cart_item_count(request, count_cart_items(request))
+    else:
+        set_cart_item_count(request, count + delta)
+
+
+def forget_cart_item_count(request):
+    request.session.pop(CART_ITEM_COUNT_SESSION_KEY, None)
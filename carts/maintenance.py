@@ -0,0 +1,105 @@
+import time
+from dataclasses import dataclass, field
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.db import connection, transaction
+from django.db.models import Exists, Max, Min, OuterRef
+from django.utils import timezone
+
+from .config import CART_PURGE_BATCH_SIZE, STALE_CART_AGE_DAYS
+from .models import Cart, CartItem
+
+DB_SESSION_ENGINES = (
+    "django.contrib.sessions.backends.db",
+    "django.contrib.sessions.backends.cached_db",
+)
+PURGED_MODELS = (Cart, CartItem, CartItem.variations.through, Session)
+
+
+@dataclass
+class PurgeStats:
+    carts: int = 0
+    rows: int = 0
+    sessions: int = 0
+    started: float = field(default_factory=time.monotonic)
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0
+
+
+def stale_carts(cutoff, now):
+    """
+    Guest carts created before ``cutoff`` whose session has expired (or, when
+    sessions aren't kept in the database, regardless of the session).
+    """
+    carts = Cart.objects.filter(date_added__lt=cutoff)
+    if settings.SESSION_ENGINE in DB_SESSION_ENGINES:
+        live = Session.objects.filter(
+            session_key=OuterRef("cart_id"), expire_date__gt=now
+        )
+        carts = carts.filter(~Exists(live))
+    return carts
+
+
+def purge_stale_carts(
+    days=STALE_CART_AGE_DAYS,
+    batch_size=CART_PURGE_BATCH_SIZE,
+    sessions=False,
+    now=None,
+    progress=None,
+):
+    """
+    Deletes abandoned guest carts with their items and item variations,
+    walking the cart ids in ranges of ``batch_size`` so each transaction
+    only locks a bounded slice of the tables. With ``sessions`` the expired
+    database sessions are deleted too, in batches as well. ``progress`` is
+    called with the stats after every batch.
+    """
+    now = now or timezone.now()
+    stats = PurgeStats()
+    carts = stale_carts((now - timedelta(days=days)).date(), now)
+    bounds = carts.aggregate(low=Min("pk"), high=Max("pk"))
+    if bounds["low"] is not None:
+        for start in range(bounds["low"], bounds["high"] + 1, batch_size):
+            batch = carts.filter(pk__gte=start, pk__lt=start + batch_size)
+            with transaction.atomic():
+                rows, per_model = batch.delete()
+            stats.rows += rows
+            stats.carts += per_model.get(Cart._meta.label, 0)
+            if progress and rows:
+                progress(stats)
+
+    if sessions and settings.SESSION_ENGINE in DB_SESSION_ENGINES:
+        expired = Session.objects.filter(expire_date__lte=now).order_by("pk")
+        while keys := list(expired.values_list("pk", flat=True)[:batch_size]):
+            deleted, _ = Session.objects.filter(pk__in=keys).delete()
+            stats.sessions += deleted
+            stats.rows += deleted
+            if progress:
+                progress(stats)
+    return stats
+
+
+def vacuum_tables(models):
+    """
+    Reclaims the space of deleted rows and refreshes the planner statistics
+    of the given models' tables, where the database supports it.
+    """
+    tables = [model._meta.db_table for model in models]
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            for table in tables:
+                cursor.execute(f"VACUUM ANALYZE {connection.ops.quote_name(table)}")
+        elif connection.vendor == "sqlite":
+            cursor.execute("VACUUM")
+            cursor.execute("ANALYZE")
+        elif connection.vendor == "mysql":
+            quoted = ", ".join(connection.ops.quote_name(table) for table in tables)
+            cursor.execute(f"OPTIMIZE TABLE {quoted}")
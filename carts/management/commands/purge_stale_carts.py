@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+
+from carts.config import CART_PURGE_BATCH_SIZE, STALE_CART_AGE_DAYS
+from carts.maintenance import PURGED_MODELS, purge_stale_carts, vacuum_tables
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete abandoned guest carts, their items and optionally expired "
+        "sessions in small batches. Safe to run daily from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=STALE_CART_AGE_DAYS,
+            help="Purge carts created more than this many days ago.",
+        )
+        parser.add_argument("--batch-size", type=int, default=CART_PURGE_BATCH_SIZE)
+        parser.add_argument(
+            "--sessions", action="store_true", help="Delete expired sessions too."
+        )
+        parser.add_argument(
+            "--vacuum",
+            action="store_true",
+            help="Vacuum and analyze the purged tables afterwards.",
+        )
+
+    def handle(self, *args, days, batch_size, sessions, vacuum, **options):
+        def progress(stats):
+            if options["verbosity"] > 1:
+                self.stdout.write(
+                    f"{stats.rows} rows deleted, {stats.rows_per_second:.0f} rows/s"
+                )
+
+        stats = purge_stale_carts(
+            days=days, batch_size=batch_size, sessions=sessions, progress=progress
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Purged {stats.carts} carts and {stats.sessions} sessions "
+                f"({stats.rows} rows) in {stats.elapsed:.2f}s, "
+                f"{stats.rows_per_second:.0f} rows/s."
+            )
+        )
+        if vacuum:
+            vacuum_tables(PURGED_MODELS)
+            self.stdout.write("Vacuumed and analyzed the cart and session tables.")
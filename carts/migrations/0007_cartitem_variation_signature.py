@@ -0,0 +1,78 @@
+# Generated by Django 5.0.1 on 2026-10-18 08:56
+
+import hashlib
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_variation_signatures(apps, schema_editor):
+    """
+    Fills the signatures (like store.models.variation_signature) of cart
+    lines with variations, then merges lines of the same cart holding the
+    same product and variations, which the new constraints don't allow.
+    """
+    CartItem = apps.get_model("carts", "CartItem")
+    ids = defaultdict(set)
+    rows = CartItem.variations.through.objects.values_list(
+        "cartitem_id", "variation_id"
+    )
+    for line, variation in rows.iterator():
+        ids[line].add(variation)
+    for line, variations in ids.items():
+        signature = ",".join(map(str, sorted(variations)))
+        CartItem.objects.filter(pk=line).update(
+            variation_signature=hashlib.md5(signature.encode()).hexdigest()
+        )
+
+    kept = {}
+    lines = CartItem.objects.exclude(user=None, cart=None).order_by("id")
+    for item in lines:
+        owner = ("user", item.user_id) if item.user_id else ("cart", item.cart_id)
+        key = owner + (item.product_id, item.variation_signature)
+        if key not in kept:
+            kept[key] = item.pk
+            continue
+        CartItem.objects.filter(pk=kept[key]).update(
+            quantity=models.F("quantity") + item.quantity
+        )
+        item.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("carts", "0006_cartitem_user_alter_cartitem_cart"),
+        ("store", "0015_variation_keys"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="cartitem",
+            name="variation_signature",
+            field=models.CharField(
+                default="d41d8cd98f00b204e9800998ecf8427e",
+                editable=False,
+                max_length=32,
+            ),
+        ),
+        migrations.RunPython(backfill_variation_signatures, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="cartitem",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("user__isnull", False)),
+                fields=("user", "product", "variation_signature"),
+                name="unique_user_cart_line",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="cartitem",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("cart__isnull", False), ("user__isnull", True)),
+                fields=("cart", "product", "variation_signature"),
+                name="unique_guest_cart_line",
+            ),
+        ),
+    ]
@@ -1,9 +1,17 @@
-from decimal import ROUND_HALF_UP, Decimal
+from decimal import Decimal
 
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
 
 from accounts.models import Account
-from store.models import Product, Variation
+from store.models import (
+    EMPTY_VARIATION_SIGNATURE,
+    Product,
+    Variation,
+    variation_signature,
+)
+
+from .pricing import line_tax
 
 
 class Cart(models.Model):
@@ -14,18 +22,65 @@ class Cart(models.Model):
         return self.cart_id
 
 
+class CartItemManager(models.Manager):
+    def add_line(self, product_id, variation_ids, quantity=1, **owner):
+        """
+        Adds ``quantity`` of a product with the given variations to a cart,
+        ``owner`` being user= or cart=. The matching line is found through
+        its variation signature, so this is an indexed UPDATE, or an INSERT
+        when the cart has no such line yet.
+        """
+        signature = variation_signature(variation_ids)
+        line = self.filter(
+            product_id=product_id, variation_signature=signature, **owner
+        )
+        if line.update(quantity=F("quantity") + quantity):
+            return
+        try:
+            with transaction.atomic():
+                item = self.create(
+                    product_id=product_id,
+                    quantity=quantity,
+                    variation_signature=signature,
+                    **owner,
+                )
+                item.variations.add(*variation_ids)
+        except IntegrityError:
+            # A concurrent request created the line first
+            line.update(quantity=F("quantity") + quantity)
+
+
 class CartItem(models.Model):
     user = models.ForeignKey(Account, on_delete=models.CASCADE, null=True)
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     variations = models.ManyToManyField(Variation, blank=True)
+    # store.models.variation_signature of the variations, see store.variations
+    variation_signature = models.CharField(
+        max_length=32, default=EMPTY_VARIATION_SIGNATURE, editable=False
+    )
     cart = models.ForeignKey(Cart, on_delete=models.CASCADE, null=True)
     quantity = models.IntegerField()
     is_active = models.BooleanField(default=True)
 
+    objects = CartItemManager()
+
+    class Meta:
+        # One line per product and variation selection in each cart
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "product", "variation_signature"],
+                condition=models.Q(user__isnull=False),
+                name="unique_user_cart_line",
+            ),
+            models.UniqueConstraint(
+                fields=["cart", "product", "variation_signature"],
+                condition=models.Q(user__isnull=True, cart__isnull=False),
+                name="unique_guest_cart_line",
+            ),
+        ]
+
     def get_tax(self, tax_rate: float) -> Decimal:
-        tax_amount = (self.product.price * (Decimal(tax_rate) / 100)) * self.quantity
-        # Round to 2 decimal places
-        return tax_amount.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+        return line_tax(self.product.price, self.quantity, tax_rate)
 
     def sub_total(self):
         return self.product.price * self.quantity
@@ -0,0 +1,89 @@
+from django.db import transaction
+
+from store.models import Product
+from store.variations import resolve_variation_ids
+
+from .config import CART_MAX_OPERATIONS
+
+
+class CartOperationError(ValueError):
+    pass
+
+
+def positive_int(value, name, minimum=0):
+    if isinstance(value, bool) or not isinstance(value, int) or value < minimum:
+        raise CartOperationError(f"{name} must be an integer of at least {minimum}")
+    return value
+
+
+def parse_operations(payload):
+    """
+    Validates a batch of cart operations, given as
+    {"operations": [...]} with each operation one of:
+
+        {"op": "add", "product": id, "variations": {"color": "Red"}, "quantity": 1}
+        {"op": "set", "line": id, "quantity": n}
+        {"op": "remove", "line": id}
+
+    and returns them as (op, id, variations, quantity) tuples.
+    """
+    operations = payload.get("operations") if isinstance(payload, dict) else None
+    if not isinstance(operations, list) or not operations:
+        raise CartOperationError("operations must be a non-empty list")
+    if len(operations) > CART_MAX_OPERATIONS:
+        raise CartOperationError(f"At most {CART_MAX_OPERATIONS} operations at once")
+
+    parsed = []
+    for operation in operations:
+        op = operation.get("op") if isinstance(operation, dict) else None
+        if op == "add":
+            variations = operation.get("variations") or {}
+            if not isinstance(variations, dict):
+                raise CartOperationError("variations must be an object")
+            parsed.append(
+                (
+                    op,
+                    positive_int(operation.get("product"), "product", 1),
+                    [(str(k), str(v)) for k, v in variations.items()],
+                    positive_int(operation.get("quantity", 1), "quantity", 1),
+                )
+            )
+        elif op in ("set", "remove"):
+            quantity = operation.get("quantity") if op == "set" else 0
+            parsed.append(
+                (
+                    op,
+                    positive_int(operation.get("line"), "line", 1),
+                    None,
+                    positive_int(quantity, "quantity"),
+                )
+            )
+        else:
+            raise CartOperationError(f"Unknown cart operation {op!r}")
+    return parsed
+
+
+def apply_operations(store, operations):
+    """
+    Applies parsed operations to a cart store in one transaction: products
+    to add are checked with one query up front, every add is one indexed
+    upsert, and all set and remove operations, which apply to the lines the
+    cart had before the batch, become a single bulk update and delete.
+    """
+    added = {pk for op, pk, variations, quantity in operations if op == "add"}
+    available = set(
+        Product.objects.filter(pk__in=added, is_available=True).values_list(
+            "pk", flat=True
+        )
+    )
+    if added - available:
+        raise CartOperationError(f"Unknown products {sorted(added - available)}")
+
+    quantities = {}
+    with transaction.atomic():
+        for op, pk, variations, quantity in operations:
+            if op == "add":
+                store.add(pk, resolve_variation_ids(pk, variations), quantity)
+            else:
+                quantities[pk] = quantity
+        store.update(quantities)
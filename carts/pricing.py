@@ -0,0 +1,67 @@
+from decimal import ROUND_HALF_UP, Decimal
+
+from .config import CART_TAX_RATE
+
+CENT = Decimal("0.01")
+
+
+def line_tax(price, quantity, tax_rate=CART_TAX_RATE):
+    """
+    Tax of one cart line, rounded half up to cents. ``tax_rate`` is a
+    percentage; floats are converted through str so they stay exact.
+    """
+    rate = Decimal(str(tax_rate)) / 100
+    return (price * rate * quantity).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+class CartPricer:
+    """
+    Prices a cart in one pass over its items, as loaded by CartStore.items
+    with their products (and variations) in a fixed number of queries.
+    ``items`` holds them for the templates to render.
+    """
+
+    def __init__(self, cart_items, tax_rate=CART_TAX_RATE):
+        self.items = list(cart_items)
+        self.total = Decimal(0)
+        self.tax = Decimal(0)
+        self.quantity = 0
+        for item in self.items:
+            self.total += item.product.price * item.quantity
+            self.tax += line_tax(item.product.price, item.quantity, tax_rate)
+            self.quantity += item.quantity
+
+    @property
+    def grand_total(self):
+        return self.total + self.tax
+
+    def __bool__(self):
+        return bool(self.items)
+
+    def as_context(self):
+        return {
+            "cart_items": self.items,
+            "total": self.total,
+            "quantity": self.quantity,
+            "total_tax": self.tax,
+            "true_total": self.grand_total,
+            "grand_total": self.grand_total,
+        }
+
+    def as_dict(self):
+        """The lines and totals as JSON-ready data, amounts as strings."""
+        return {
+            "lines": [
+                {
+                    "id": item.id,
+                    "product": item.product_id,
+                    "quantity": item.quantity,
+                    "sub_total": str(item.sub_total()),
+                }
+                for item in self.items
+            ],
+            "quantity": self.quantity,
+            "total": str(self.total),
+            "tax": str(self.tax),
+            "grand_total": str(self.grand_total),
+        }
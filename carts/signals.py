@@ -0,0 +1,16 @@
+from django.db.models.signals import m2m_changed
+from django.dispatch import receiver
+
+from store.variations import refresh_variation_signature
+
+from .models import CartItem
+
+
+@receiver(m2m_changed, sender=CartItem.variations.through)
+def update_variation_signature(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    # Changed from the variation's side, pk_set holds the affected lines
+    lines = CartItem.objects.filter(pk__in=pk_set or ()) if reverse else [instance]
+    for line in lines:
+        refresh_variation_signature(line)
@@ -0,0 +1,443 @@
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import (
+    BooleanField,
+    Exists,
+    ExpressionWrapper,
+    OuterRef,
+    Q,
+    Sum,
+    Value,
+)
+from django.utils.module_loading import import_string
+
+from store.models import Product, Variation, variation_signature
+
+from .config import CART_SESSION_KEY, DEFAULT_GUEST_CART_STORE
+from .models import Cart, CartItem
+
+
+class CartStore:
+    """
+    Interface of the places a cart can be kept in.
+
+    ``items`` returns the cart lines ready to price and render: each has an
+    int ``id``, ``product`` (with its category loaded), ``product_id``,
+    ``quantity``, ``variations.all()`` and ``sub_total()``. ``lines``
+    returns the same lines as plain (product_id, variation_ids, quantity)
+    tuples without loading anything else.
+    """
+
+    # Whether count() is cheap enough (no query on the cart's own rows) not
+    # to be kept in the session
+    count_is_free = False
+
+    def items(self):
+        raise NotImplementedError
+
+    def lines(self):
+        raise NotImplementedError
+
+    def add(self, product_id, variation_ids, quantity=1):
+        raise NotImplementedError
+
+    def decrement(self, line_id, product_id):
+        """Takes one off a line, returns whether the line existed."""
+        raise NotImplementedError
+
+    def remove(self, line_id, product_id):
+        """Removes a line, returns the quantity it held."""
+        raise NotImplementedError
+
+    def update(self, quantities):
+        """
+        Sets the quantities of several lines at once from {line id:
+        quantity}; lines set to zero are removed, unknown lines ignored.
+        """
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def count(self):
+        raise NotImplementedError
+
+    def in_cart(self):
+        """
+        A boolean expression telling, per Product row, whether the product
+        is in this cart.
+        """
+        raise NotImplementedError
+
+    def add_lines(self, lines):
+        """
+        Adds (product_id, variation_ids, quantity) lines, like add for each.
+        """
+        for product_id, variation_ids, quantity in lines:
+            self.add(product_id, variation_ids, quantity)
+
+    def merge_into(self, other):
+        """
+        Moves every line of this cart into ``other``, adding quantities up
+        where ``other`` already holds the same product and variations. This
+        cart is only emptied once the surrounding transaction commits.
+        """
+        other.add_lines(self.lines())
+        transaction.on_commit(self.clear)
+
+
+class DatabaseCartStore(CartStore):
+    """
+    CartItem rows, of the user when given, else of the Cart row named after
+    the session key (created with the first line).
+    """
+
+    def __init__(self, session, user=None):
+        self.session = session
+        self.user = user
+
+    def queryset(self):
+        if self.user is not None:
+            return CartItem.objects.filter(user=self.user, is_active=True)
+        if not self.session.session_key:
+            return CartItem.objects.none()
+        return CartItem.objects.filter(
+            cart__cart_id=self.session.session_key, is_active=True
+        )
+
+    def items(self):
+        return list(
+            self.queryset()
+            .select_related("product__category")
+            .prefetch_related("variations")
+        )
+
+    def lines(self):
+        items = self.queryset()
+        variations = defaultdict(list)
+        rows = CartItem.variations.through.objects.filter(
+            cartitem__in=items
+        ).values_list("cartitem_id", "variation_id")
+        for item_id, variation_id in rows:
+            variations[item_id].append(variation_id)
+        return [
+            (product_id, variations[pk], quantity)
+            for pk, product_id, quantity in items.values_list(
+                "pk", "product_id", "quantity"
+            )
+        ]
+
+    def owner(self):
+        if self.user is not None:
+            return {"user": self.user}
+        if not self.session.session_key:
+            self.session.create()
+        cart, created = Cart.objects.get_or_create(cart_id=self.session.session_key)
+        return {"cart": cart}
+
+    def add(self, product_id, variation_ids, quantity=1):
+        CartItem.objects.add_line(product_id, variation_ids, quantity, **self.owner())
+
+    def add_lines(self, lines):
+        """
+        Adds many lines in a fixed number of queries: one finding the lines
+        the cart already has (matched on variation signature), a bulk
+        update of their quantities and bulk inserts of the new lines and
+        their variations.
+        """
+        wanted = {}
+        for product_id, variation_ids, quantity in lines:
+            key = (product_id, variation_signature(variation_ids))
+            if key in wanted:
+                wanted[key][1] += quantity
+            else:
+                wanted[key] = [variation_ids, quantity]
+        if not wanted:
+            return
+
+        owner = self.owner()
+        with transaction.atomic():
+            existing = CartItem.objects.filter(
+                product_id__in={product_id for product_id, signature in wanted},
+                **owner,
+            ).only("pk", "product_id", "variation_signature", "quantity")
+            changed = []
+            for item in existing.select_for_update():
+                key = (item.product_id, item.variation_signature)
+                if key in wanted:
+                    item.quantity += wanted.pop(key)[1]
+                    changed.append(item)
+            CartItem.objects.bulk_update(changed, ["quantity"])
+
+            created = CartItem.objects.bulk_create(
+                [
+                    CartItem(
+                        product_id=product_id,
+                        variation_signature=signature,
+                        quantity=quantity,
+                        **owner,
+                    )
+                    for (product_id, signature), (_, quantity) in wanted.items()
+                ]
+            )
+            if created and created[0].pk is None:
+                # Backends that can't return the ids of bulk inserted rows;
+                # evaluating ``existing`` again includes the new lines
+                ids = {
+                    (item.product_id, item.variation_signature): item.pk
+                    for item in existing
+                }
+                for item in created:
+                    item.pk = ids[(item.product_id, item.variation_signature)]
+            through = CartItem.variations.through
+            through.objects.bulk_create(
+                [
+                    through(cartitem_id=item.pk, variation_id=variation_id)
+                    for item, (variation_ids, _) in zip(created, wanted.values())
+                    for variation_id in set(variation_ids)
+                ]
+            )
+
+    def decrement(self, line_id, product_id):
+        item = self.queryset().filter(pk=line_id, product_id=product_id).first()
+        if item is None:
+            return False
+        if item.quantity > 1:
+            item.quantity -= 1
+            item.save()
+        else:
+            item.delete()
+        return True
+
+    def remove(self, line_id, product_id):
+        item = self.queryset().filter(pk=line_id, product_id=product_id).first()
+        if item is None:
+            return 0
+        item.delete()
+        return item.quantity
+
+    def update(self, quantities):
+        if not quantities:
+            return
+        items = self.queryset().filter(pk__in=quantities)
+        changed = []
+        for item in items.only("pk", "quantity"):
+            if quantities[item.pk] > 0 and quantities[item.pk] != item.quantity:
+                item.quantity = quantities[item.pk]
+                changed.append(item)
+        CartItem.objects.bulk_update(changed, ["quantity"])
+        removed = [pk for pk, quantity in quantities.items() if quantity <= 0]
+        if removed:
+            items.filter(pk__in=removed).delete()
+
+    def clear(self):
+        self.queryset().delete()
+
+    def count(self):
+        return self.queryset().aggregate(quantity=Sum("quantity"))["quantity"] or 0
+
+    def in_cart(self):
+        return Exists(self.queryset().filter(product=OuterRef("pk")))
+
+    def merge_into(self, other):
+        if not isinstance(other, DatabaseCartStore) or other.user is None:
+            return super().merge_into(other)
+        # Between CartItem rows, lines the user already has absorb the guest
+        # line's quantity and the other lines are handed over as they are
+        guest = list(
+            self.queryset().values_list(
+                "pk", "product_id", "variation_signature", "quantity"
+            )
+        )
+        if not guest:
+            return
+        with transaction.atomic():
+            existing = {
+                (item.product_id, item.variation_signature): item
+                for item in CartItem.objects.filter(
+                    user=other.user, product_id__in={row[1] for row in guest}
+                )
+                .only("pk", "product_id", "variation_signature", "quantity")
+                .select_for_update()
+            }
+            changed, merged, moved = [], [], []
+            for pk, product_id, signature, quantity in guest:
+                item = existing.get((product_id, signature))
+                if item is None:
+                    moved.append(pk)
+                else:
+                    item.quantity += quantity
+                    changed.append(item)
+                    merged.append(pk)
+            CartItem.objects.bulk_update(changed, ["quantity"])
+            CartItem.objects.filter(pk__in=merged).delete()
+            CartItem.objects.filter(pk__in=moved).update(user=other.user, cart=None)
+
+
+class LineVariations(list):
+    # Lets templates treat session lines like CartItems: item.variations.all
+    def all(self):
+        return self
+
+
+@dataclass
+class SessionCartLine:
+    id: int
+    product: Product
+    quantity: int
+    variations: LineVariations = field(default_factory=LineVariations)
+
+    @property
+    def product_id(self):
+        return self.product.pk
+
+    def sub_total(self):
+        return self.product.price * self.quantity
+
+
+class SessionCartStore(CartStore):
+    """
+    A guest cart kept in the session as compact [line id, product id,
+    sorted variation ids, quantity] lists, so browsing guests write no cart
+    rows at all. Lines of products or variations deleted since are dropped
+    when the cart is loaded or counted.
+    """
+
+    count_is_free = True
+
+    def __init__(self, session):
+        self.session = session
+
+    def data(self):
+        return self.session.get(CART_SESSION_KEY) or {"next": 1, "lines": []}
+
+    def save(self, data):
+        # Assigned anew so the session notices the change
+        self.session[CART_SESSION_KEY] = data
+
+    def items(self):
+        data = self.data()
+        if not data["lines"]:
+            return []
+        products = Product.objects.select_related("category").in_bulk(
+            {line[1] for line in data["lines"]}
+        )
+        variations = Variation.objects.in_bulk(
+            {pk for line in data["lines"] for pk in line[2]}
+        )
+        items = []
+        for line_id, product_id, variation_ids, quantity in data["lines"]:
+            if product_id in products:
+                items.append(
+                    SessionCartLine(
+                        id=line_id,
+                        product=products[product_id],
+                        quantity=quantity,
+                        variations=LineVariations(
+                            variations[pk] for pk in variation_ids if pk in variations
+                        ),
+                    )
+                )
+        return items
+
+    def lines(self):
+        data = self.data()
+        if not data["lines"]:
+            return []
+        # Like items, drops what was deleted since, so the lines can be
+        # written to the database
+        products = set(
+            Product.objects.filter(
+                pk__in={line[1] for line in data["lines"]}
+            ).values_list("pk", flat=True)
+        )
+        variations = set(
+            Variation.objects.filter(
+                pk__in={pk for line in data["lines"] for pk in line[2]}
+            ).values_list("pk", flat=True)
+        )
+        return [
+            (product_id, [pk for pk in variation_ids if pk in variations], quantity)
+            for line_id, product_id, variation_ids, quantity in data["lines"]
+            if product_id in products
+        ]
+
+    def add(self, product_id, variation_ids, quantity=1):
+        data = self.data()
+        variation_ids = sorted(set(variation_ids))
+        for line in data["lines"]:
+            if line[1] == product_id and line[2] == variation_ids:
+                line[3] += quantity
+                break
+        else:
+            data["lines"].append([data["next"], product_id, variation_ids, quantity])
+            data["next"] += 1
+        self.save(data)
+
+    def update_line(self, line_id, product_id, change):
+        data = self.data()
+        for i, line in enumerate(data["lines"]):
+            if line[0] == line_id and line[1] == product_id:
+                quantity = line[3]
+                line[3] = change(quantity)
+                if line[3] <= 0:
+                    del data["lines"][i]
+                self.save(data)
+                return quantity
+        return 0
+
+    def decrement(self, line_id, product_id):
+        return bool(
+            self.update_line(line_id, product_id, lambda quantity: quantity - 1)
+        )
+
+    def remove(self, line_id, product_id):
+        return self.update_line(line_id, product_id, lambda quantity: 0)
+
+    def update(self, quantities):
+        data = self.data()
+        lines = [
+            line[:3] + [quantities.get(line[0], line[3])] for line in data["lines"]
+        ]
+        lines = [line for line in lines if line[3] > 0]
+        if lines != data["lines"]:
+            data["lines"] = lines
+            self.save(data)
+
+    def clear(self):
+        self.session.pop(CART_SESSION_KEY, None)
+
+    def count(self):
+        lines = self.data()["lines"]
+        if not lines:
+            return 0
+        products = set(
+            Product.objects.filter(pk__in={line[1] for line in lines}).values_list(
+                "pk", flat=True
+            )
+        )
+        return sum(line[3] for line in lines if line[1] in products)
+
+    def in_cart(self):
+        product_ids = [line[1] for line in self.data()["lines"]]
+        if not product_ids:
+            return Value(False)
+        return ExpressionWrapper(Q(pk__in=product_ids), output_field=BooleanField())
+
+
+def get_guest_cart_store(session):
+    path = getattr(settings, "GUEST_CART_STORE", DEFAULT_GUEST_CART_STORE)
+    return import_string(path)(session)
+
+
+def get_cart_store(request):
+    """
+    The cart of the current visitor: CartItem rows for users, the configured
+    GUEST_CART_STORE (the session by default) for guests.
+    """
+    if request.user.is_authenticated:
+        return DatabaseCartStore(request.session, user=request.user)
+    return get_guest_cart_store(request.session)
@@ -1,3 +1,515 @@
-from django.test import TestCase
+import json
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
 
-# Create your tests here.
+from django.contrib.sessions.backends.db import SessionStore
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.utils import merge_cart_items
+from orders.tests import ORDER_FORM, create_shopper
+from store.models import Variation, variation_signature
+from store.tests import create_product
+
+from .context_processors import menu_links
+from .maintenance import purge_stale_carts
+from .models import Cart, CartItem
+from .pricing import CartPricer, line_tax
+from .stores import DatabaseCartStore, SessionCartStore, get_guest_cart_store
+
+
+@override_settings(GUEST_CART_STORE="carts.stores.DatabaseCartStore")
+class AddToCartTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.product = create_product("Shirt")
+        self.red, self.large = [
+            Variation.objects.create(
+                product=self.product, variation_category=category, variation_value=value
+            )
+            for category, value in (("color", "Red"), ("size", "L"))
+        ]
+        self.url = reverse("add_cart", args=[self.product.id])
+
+    def test_variations_resolved_case_insensitively(self):
+        self.client.post(self.url, {"color": "red", "size": "l"})
+        self.client.post(self.url, {"color": "RED", "size": "L"})
+        self.client.post(self.url, {"color": "Red"})
+
+        items = CartItem.objects.order_by("id")
+        self.assertEqual([item.quantity for item in items], [2, 1])
+        self.assertEqual(list(items[0].variations.all()), [self.red, self.large])
+        self.assertEqual(list(items[1].variations.all()), [self.red])
+
+    def test_lines_are_matched_by_variation_signature(self):
+        self.client.post(self.url, {"size": "L", "color": "Red"})
+        item = CartItem.objects.get()
+        self.assertEqual(
+            item.variation_signature, variation_signature([self.large, self.red])
+        )
+        # Bumping an existing line is a single indexed UPDATE
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(self.url, {"color": "Red", "size": "L"})
+        writes = [q["sql"] for q in queries if "carts_cartitem" in q["sql"]]
+        self.assertEqual(len(writes), 1)
+        self.assertTrue(writes[0].startswith("UPDATE"))
+
+        # Variations changed elsewhere (e.g. in the admin) keep it in sync
+        item.variations.remove(self.large)
+        item.refresh_from_db()
+        self.assertEqual(item.variation_signature, variation_signature([self.red]))
+
+    def test_guest_cart_is_merged_at_login(self):
+        user = create_shopper()
+        CartItem.objects.add_line(self.product.id, [self.red.id], user=user)
+        self.client.post(self.url, {"color": "Red"})
+        self.client.post(self.url)
+
+        request = RequestFactory().get("/")
+        request.session = self.client.session
+        self.assertTrue(merge_cart_items(request, user))
+        items = CartItem.objects.order_by("id")
+        self.assertEqual(
+            [(item.user, item.cart, item.quantity) for item in items],
+            [(user, None, 2), (user, None, 1)],
+        )
+
+
+class SessionCartTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.product = create_product("Shirt", price=Decimal("12.50"))
+        self.red = Variation.objects.create(
+            product=self.product, variation_category="color", variation_value="Red"
+        )
+        self.url = reverse("add_cart", args=[self.product.id])
+
+    def test_guest_cart_writes_no_rows(self):
+        self.client.post(self.url, {"color": "red"})
+        self.client.post(self.url, {"color": "Red"})
+        self.client.post(self.url)
+        self.assertFalse(Cart.objects.exists())
+        self.assertFalse(CartItem.objects.exists())
+
+        response = self.client.get(reverse("cart"))
+        items = response.context["cart_items"]
+        self.assertEqual([(item.id, item.quantity) for item in items], [(1, 2), (2, 1)])
+        self.assertEqual(list(items[0].variations.all()), [self.red])
+        self.assertEqual(response.context["total"], Decimal("37.50"))
+        self.assertContains(
+            response, reverse("remove_product", args=[self.product.id, 2])
+        )
+
+        self.client.get(reverse("remove_product", args=[self.product.id, 2]))
+        self.client.get(reverse("remove_from_cart", args=[self.product.id, 1]))
+        store = SessionCartStore(self.client.session)
+        self.assertEqual(store.lines(), [(self.product.id, [self.red.id], 1)])
+
+    def test_product_page_knows_what_is_in_the_cart(self):
+        response = self.client.get(self.product.get_url())
+        self.assertFalse(response.context["in_cart"])
+        self.client.post(self.url)
+        response = self.client.get(self.product.get_url())
+        self.assertTrue(response.context["in_cart"])
+
+    def test_session_cart_is_merged_at_login(self):
+        user = create_shopper()
+        CartItem.objects.add_line(self.product.id, [self.red.id], user=user)
+        self.client.post(self.url, {"color": "Red"})
+        self.client.post(self.url)
+
+        request = RequestFactory().get("/")
+        request.session = self.client.session
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(merge_cart_items(request, user))
+        items = CartItem.objects.order_by("id")
+        self.assertEqual(
+            [(item.user, item.quantity, list(item.variations.all())) for item in items],
+            [(user, 2, [self.red]), (user, 1, [])],
+        )
+        self.assertEqual(SessionCartStore(request.session).lines(), [])
+
+
+class LoginMergeTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = create_shopper()
+        self.products = [create_product(f"Shirt {i}") for i in range(8)]
+        self.sizes = [
+            Variation.objects.create(
+                product=product, variation_category="size", variation_value="L"
+            )
+            for product in self.products
+        ]
+
+    def merge(self, guest_lines):
+        """
+        Fills a guest cart, owning half of its lines already, and returns
+        the number of queries merging it took.
+        """
+        CartItem.objects.all().delete()
+        request = RequestFactory().get("/")
+        request.session = SessionStore()
+        request.session.create()
+        guest = get_guest_cart_store(request.session)
+        user_cart = DatabaseCartStore(request.session, user=self.user)
+        for i, (product, size) in enumerate(
+            zip(self.products[:guest_lines], self.sizes)
+        ):
+            guest.add(product.id, [size.id], 2)
+            if i % 2:
+                user_cart.add(product.id, [size.id])
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(merge_cart_items(request, self.user))
+        self.assertEqual(user_cart.count(), 2 * guest_lines + guest_lines // 2)
+        self.assertEqual(
+            [item.variations.get() for item in user_cart.items()],
+            self.sizes[:guest_lines],
+        )
+        return len(queries)
+
+    def test_session_cart_merge_takes_fixed_queries(self):
+        self.assertEqual(self.merge(2), self.merge(8))
+
+    @override_settings(GUEST_CART_STORE="carts.stores.DatabaseCartStore")
+    def test_database_cart_merge_takes_fixed_queries(self):
+        self.assertEqual(self.merge(2), self.merge(8))
+
+    def test_deleted_products_and_variations_are_not_merged(self):
+        request = RequestFactory().get("/")
+        request.session = SessionStore()
+        guest = SessionCartStore(request.session)
+        color = Variation.objects.create(
+            product=self.products[0], variation_category="color", variation_value="Red"
+        )
+        guest.add(self.products[0].id, [self.sizes[0].id, color.id], 2)
+        guest.add(self.products[1].id, [self.sizes[1].id])
+        color.delete()
+        self.products[1].delete()
+        self.assertEqual(guest.lines(), [(self.products[0].id, [self.sizes[0].id], 2)])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(merge_cart_items(request, self.user))
+        item = CartItem.objects.get(user=self.user)
+        self.assertEqual((item.product, item.quantity), (self.products[0], 2))
+        self.assertEqual(list(item.variations.all()), [self.sizes[0]])
+
+
+class CartPricerTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = create_shopper()
+        self.client.force_login(self.user)
+
+    def fill_cart(self, size):
+        start = CartItem.objects.count()
+        for i in range(start, start + size):
+            product = create_product(f"Shirt {i}", price=Decimal("10.05"))
+            item = CartItem.objects.create(user=self.user, product=product, quantity=2)
+            item.variations.add(
+                Variation.objects.create(
+                    product=product, variation_category="size", variation_value="L"
+                )
+            )
+
+    def count_queries(self, request):
+        request()  # warm up the caches first
+        with CaptureQueriesContext(connection) as queries:
+            response = request()
+        self.assertIn(response.status_code, (200, 302))
+        return len(queries)
+
+    def test_totals_are_exact(self):
+        self.fill_cart(3)
+        store = DatabaseCartStore(self.client.session, user=self.user)
+        with self.assertNumQueries(2):
+            pricer = CartPricer(store.items())
+        self.assertEqual(pricer.quantity, 6)
+        self.assertEqual(pricer.total, Decimal("60.30"))
+        # 3% of 20.10 is 0.603, rounded per line
+        self.assertEqual(pricer.tax, Decimal("1.80"))
+        self.assertEqual(pricer.grand_total, Decimal("62.10"))
+        self.assertEqual(line_tax(Decimal("10.05"), 2, 0.5), Decimal("0.10"))
+
+    def test_queries_do_not_grow_with_the_cart(self):
+        requests = {
+            "cart": lambda: self.client.get(reverse("cart")),
+            "checkout": lambda: self.client.get(reverse("checkout")),
+        }
+        self.fill_cart(1)
+        small = {
+            name: self.count_queries(request) for name, request in requests.items()
+        }
+        self.fill_cart(5)
+        large = {
+            name: self.count_queries(request) for name, request in requests.items()
+        }
+        self.assertEqual(small, large)
+
+    def test_place_order_pricing(self):
+        def place_order():
+            return self.client.post(reverse("place_order"), ORDER_FORM)
+
+        self.fill_cart(1)
+        small = self.count_queries(place_order)
+        self.fill_cart(5)
+        large = self.count_queries(place_order)
+        # Only the stock reservation takes a conditional UPDATE per product
+        self.assertEqual(large - small, 5)
+
+        response = place_order()
+        self.assertEqual(response.context["grand_total"], Decimal("124.20"))
+        self.assertEqual(response.context["order"].tax, Decimal("3.60"))
+
+
+class CartBadgeTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.product = create_product("Shirt")
+
+    def cart_queries(self, path):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path)
+        return response, [q["sql"] for q in queries if "carts_" in q["sql"]]
+
+    def badge(self, response):
+        return response.context["cart_item_count"]
+
+    def test_count_follows_cart_mutations(self):
+        add_url = reverse("add_cart", args=[self.product.id])
+        self.client.post(add_url)
+        self.client.post(add_url)
+        response, queries = self.cart_queries(reverse("store"))
+        self.assertContains(
+            response, '<span class="badge badge-pill badge-danger notify">2</span>'
+        )
+        self.assertEqual(queries, [])
+
+        line_id = 1  # the first line of the guest's session cart
+        self.client.get(reverse("remove_from_cart", args=[self.product.id, line_id]))
+        self.assertEqual(self.client.session["cart_item_count"], 1)
+        self.client.get(reverse("remove_product", args=[self.product.id, line_id]))
+        self.assertEqual(self.client.session["cart_item_count"], 0)
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_count_is_lazy_and_users_are_counted_afresh(self):
+        user = create_shopper()
+        CartItem.objects.create(user=user, product=self.product, quantity=3)
+        request = RequestFactory().get("/")
+        request.user, request.session = user, SessionStore()
+        with self.assertNumQueries(0):
+            count = menu_links(request)["cart_item_count"]
+        self.assertEqual(count, 3)
+
+        self.client.force_login(user)
+        response, queries = self.cart_queries(reverse("store"))
+        self.assertEqual((len(queries), self.badge(response)), (1, 3))
+        # e.g. added from the user's other device
+        CartItem.objects.filter(user=user).update(quantity=4)
+        response, queries = self.cart_queries(reverse("store"))
+        self.assertEqual((len(queries), self.badge(response)), (1, 4))
+        self.assertNotIn("cart_item_count", self.client.session)
+
+    def test_deleted_products_are_not_counted(self):
+        other = create_product("Tie")
+        self.client.post(reverse("add_cart", args=[self.product.id]))
+        self.client.post(reverse("add_cart", args=[other.id]))
+        other.delete()
+        session = self.client.session
+        del session["cart_item_count"]
+        session.save()
+        response = self.client.get(reverse("store"))
+        self.assertContains(
+            response, '<span class="badge badge-pill badge-danger notify">1</span>'
+        )
+
+    def test_guests_without_session_have_empty_cart(self):
+        response, queries = self.cart_queries(reverse("store"))
+        self.assertEqual(queries, [])
+        self.assertNotIn("sessionid", response.cookies)
+
+
+class LazySessionTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.product = create_product("Shirt")
+        self.pages = [
+            reverse("home"),
+            reverse("store"),
+            self.product.get_url(),
+            reverse("cart"),
+        ]
+
+    def session_writes(self, request):
+        with CaptureQueriesContext(connection) as queries:
+            response = request()
+        writes = [
+            q["sql"]
+            for q in queries
+            if "django_session" in q["sql"] and not q["sql"].startswith("SELECT")
+        ]
+        return response, writes
+
+    def test_browsing_creates_no_session(self):
+        for path in self.pages:
+            response, writes = self.session_writes(lambda: self.client.get(path))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(writes, [])
+            self.assertNotIn("sessionid", response.cookies)
+
+        # Removing from an empty cart doesn't need one either
+        response, writes = self.session_writes(
+            lambda: self.client.get(
+                reverse("remove_from_cart", args=[self.product.id, 1])
+            )
+        )
+        self.assertEqual(writes, [])
+        self.assertNotIn("sessionid", response.cookies)
+
+    def test_session_is_created_by_first_cart_mutation(self):
+        add_url = reverse("add_cart", args=[self.product.id])
+        response, writes = self.session_writes(lambda: self.client.post(add_url))
+        self.assertIn("sessionid", response.cookies)
+        self.assertEqual(len(writes), 1)
+
+        for path in self.pages:
+            response, writes = self.session_writes(lambda: self.client.get(path))
+            self.assertEqual(writes, [])
+
+
+class PurgeStaleCartsTest(TestCase):
+    def setUp(self):
+        self.product = create_product("Shirt")
+        self.size = Variation.objects.create(
+            product=self.product, variation_category="size", variation_value="L"
+        )
+        self.now = timezone.now()
+
+    def create_cart(self, cart_id, days_old):
+        cart = Cart.objects.create(cart_id=cart_id)
+        Cart.objects.filter(pk=cart.pk).update(
+            date_added=(self.now - timedelta(days=days_old)).date()
+        )
+        CartItem.objects.add_line(self.product.id, [self.size.id], cart=cart)
+        return cart
+
+    def create_session(self, key, expires_in_days):
+        Session.objects.create(
+            session_key=key,
+            session_data="",
+            expire_date=self.now + timedelta(days=expires_in_days),
+        )
+
+    def test_purges_old_carts_of_expired_sessions(self):
+        self.create_cart("abandoned", days_old=40)
+        self.create_cart("abandoned-too", days_old=60)
+        self.create_cart("recent", days_old=2)
+        self.create_cart("live", days_old=40)
+        self.create_session("live", expires_in_days=1)
+        self.create_session("expired", expires_in_days=-1)
+
+        progress = []
+        stats = purge_stale_carts(
+            days=30, batch_size=1, sessions=True, now=self.now, progress=progress.append
+        )
+        self.assertEqual((stats.carts, stats.sessions), (2, 1))
+        # Two carts with one item and one item variation each, one session
+        self.assertEqual(stats.rows, 7)
+        self.assertEqual(len(progress), 3)
+        self.assertEqual(
+            set(Cart.objects.values_list("cart_id", flat=True)), {"recent", "live"}
+        )
+        self.assertEqual(CartItem.objects.count(), 2)
+        self.assertEqual(list(Session.objects.values_list("pk", flat=True)), ["live"])
+
+    def test_command(self):
+        self.create_cart("abandoned", days_old=40)
+        out = StringIO()
+        call_command("purge_stale_carts", "--days", "30", stdout=out)
+        self.assertIn("Purged 1 carts and 0 sessions (3 rows)", out.getvalue())
+
+
+class UpdateCartTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.shirt = create_product("Shirt", price=Decimal("10.00"))
+        self.tie = create_product("Tie", price=Decimal("5.50"))
+        Variation.objects.create(
+            product=self.shirt, variation_category="color", variation_value="Red"
+        )
+
+    def update(self, *operations):
+        return self.client.post(
+            reverse("update_cart"),
+            json.dumps({"operations": list(operations)}),
+            content_type="application/json",
+        )
+
+    def test_batch_is_applied_and_priced(self):
+        response = self.update(
+            {"op": "add", "product": self.shirt.id, "variations": {"color": "red"}},
+            {"op": "add", "product": self.tie.id, "quantity": 2},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["total"], "21.00")
+        shirt, tie = [line["id"] for line in response.json()["lines"]]
+
+        response = self.update(
+            {"op": "set", "line": shirt, "quantity": 3},
+            {"op": "remove", "line": tie},
+        )
+        self.assertEqual(
+            response.json(),
+            {
+                "lines": [
+                    {
+                        "id": shirt,
+                        "product": self.shirt.id,
+                        "quantity": 3,
+                        "sub_total": "30.00",
+                    }
+                ],
+                "quantity": 3,
+                "total": "30.00",
+                "tax": "0.90",
+                "grand_total": "30.90",
+            },
+        )
+        self.assertEqual(self.client.session["cart_item_count"], 3)
+
+    def test_invalid_batches_change_nothing(self):
+        self.update({"op": "add", "product": self.tie.id})
+        for operations in (
+            [{"op": "add", "product": self.tie.id}, {"op": "add", "product": 999}],
+            [{"op": "set", "line": 1, "quantity": -1}],
+            [{"op": "discount"}],
+            [],
+        ):
+            response = self.update(*operations)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("error", response.json())
+        self.assertEqual(SessionCartStore(self.client.session).count(), 1)
+        self.assertEqual(self.client.get(reverse("update_cart")).status_code, 405)
+
+    def test_queries_do_not_grow_with_the_batch(self):
+        user = create_shopper()
+        self.client.force_login(user)
+        products = [create_product(f"Sock {i}") for i in range(6)]
+        for product in products:
+            CartItem.objects.add_line(product.id, [], user=user)
+        lines = list(CartItem.objects.order_by("id").values_list("pk", flat=True))
+
+        def batch(lines):
+            operations = [{"op": "set", "line": pk, "quantity": 2} for pk in lines]
+            with CaptureQueriesContext(connection) as queries:
+                self.update(*operations, {"op": "remove", "line": lines[-1]})
+            return len(queries)
+
+        self.assertEqual(batch(lines[:2]), batch(lines[2:]))
@@ -15,5 +15,6 @@ urlpatterns = [
         views.remove_product,
         name="remove_product",
     ),
+    path("update/", views.update_cart, name="update_cart"),
     path("checkout/", views.checkout, name="checkout"),
 ]
@@ -1,270 +1,88 @@
-from django.contrib.auth.decorators import login_required
-from django.shortcuts import get_object_or_404, redirect, render
-
-from carts.models import Cart, CartItem
-from store.models import Product, Variation
-
-
-def get_cart_id(request):
-    if not request.session.session_key:
-        request.session.create()
-    return request.session.session_key
-
-
-def cart(request, total=0, quantity=0, cart_items=None):
-    total_tax = 0
-    cart_id = get_cart_id(request)
-
-    if request.user.is_authenticated:
-        # cart_, created = Cart.objects.get_or_create(cart_id=cart_id)
-        cart_items = CartItem.objects.filter(user=request.user, is_active=True)
-    else:
-        cart_, created = Cart.objects.get_or_create(cart_id=cart_id)
-        cart_items = CartItem.objects.filter(cart=cart_, is_active=True)
-
-    for cart_item in cart_items:
-        # Calculate total
-        total += cart_item.product.price * cart_item.quantity
-        quantity += cart_item.quantity
-
-        # Calculate tax
-        tax = cart_item.get_tax(3)  # Assuming get_tax is a method of CartItem
-        total_tax += tax
+import json
 
+from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse
+from django.shortcuts import redirect, render
+from django.views.decorators.http import require_POST
+
+from carts.counter import adjust_cart_item_count, sync_cart_item_count
+from carts.operations import apply_operations, parse_operations
+from carts.pricing import CartPricer
+from carts.stores import get_cart_store
+from store.models import Product
+from store.recommendations import recommendations_for
+from store.variations import resolve_variation_ids
+
+
+def cart(request):
+    pricer = CartPricer(get_cart_store(request).items())
+    # The cart page counts the items anyway, so it resyncs the badge count
+    sync_cart_item_count(request, pricer.quantity)
     context = {
-        "total": total,
-        "quantity": quantity,
-        "cart_items": cart_items,
-        "total_tax": total_tax,
-        "true_total": total + total_tax,
+        **pricer.as_context(),
+        "recommendations": recommendations_for(
+            list({cart_item.product_id for cart_item in pricer.items})
+        ),
     }
     return render(request, "store/cart.html", context)
 
 
-def add_to_cart(request, product_id):
-    current_user = request.user
-    product = Product.objects.get(id=product_id)
-
-    # If user is authenticated
-    if current_user.is_authenticated:
-        variations = []
-
-        if request.method == "POST":
-            # Initialize an empty dictionary to hold variation data
-
-            # Iterate over request.POST items
-            for key, value in request.POST.items():
-                if (
-                    key != "csrfmiddlewaretoken" and value
-                ):  # Exclude CSRF token and empty fields
-                    try:
-                        variation = Variation.objects.get(
-                            product=product,
-                            variation_category__iexact=key,
-                            variation_value__iexact=value,
-                        )
-                        variations.append(variation)
-                    except:
-                        pass
-
-        cart_item_exists = CartItem.objects.filter(
-            product=product, user=current_user
-        ).exists()
-
-        if cart_item_exists:
-            cart_item = CartItem.objects.filter(product=product, user=current_user)
-            existing_variations_list = []
-            id_list = []
-
-            for item in cart_item:
-                existing_variation = item.variations.all()
-                existing_variations_list.append(list(existing_variation))
-                id_list.append(item.id)
-
-            if variations in existing_variations_list:
-                index = existing_variations_list.index(variations)
-                item_id = id_list[index]
-                item = CartItem.objects.get(product=product, id=item_id)
-                item.quantity += 1
-                item.save()
-            else:
-                item = CartItem.objects.create(
-                    product=product, quantity=1, user=current_user
-                )
-                if len(variations) > 0:
-                    item.variations.clear()
-                    item.variations.add(*variations)
-                item.save()
-        else:
-            cart_item = CartItem.objects.create(
-                product=product,
-                quantity=1,
-                user=current_user,
-            )
-            if len(variations) > 0:
-                cart_item.variations.clear()
-                cart_item.variations.add(*variations)
-            cart_item.save()
-
-        return redirect("cart")
-
-    # If user is not authenticated
-    else:
-        variations = []
-
-        if request.method == "POST":
-            # Initialize an empty dictionary to hold variation data
+def selected_variations(request):
+    return [
+        (key, value)
+        for key, value in request.POST.items()
+        if key != "csrfmiddlewaretoken" and value
+    ]
 
-            # Iterate over request.POST items
-            for key, value in request.POST.items():
-                if (
-                    key != "csrfmiddlewaretoken" and value
-                ):  # Exclude CSRF token and empty fields
-                    try:
-                        variation = Variation.objects.get(
-                            product=product,
-                            variation_category__iexact=key,
-                            variation_value__iexact=value,
-                        )
-                        variations.append(variation)
-                    except:
-                        pass
 
-        try:
-            cart = Cart.objects.get(cart_id=get_cart_id(request))
-        except Cart.DoesNotExist:
-            cart = Cart.objects.create(
-                cart_id=get_cart_id(request),
-            )
-        cart.save()
-
-        cart_item_exists = CartItem.objects.filter(product=product, cart=cart).exists()
-
-        if cart_item_exists:
-            cart_item = CartItem.objects.filter(product=product, cart=cart)
-            existing_variations_list = []
-            id_list = []
-
-            for item in cart_item:
-                existing_variations = item.variations.all()
-                existing_variations_list.append(list(existing_variations))
-                id_list.append(item.id)
+def add_to_cart(request, product_id):
+    product = Product.objects.get(id=product_id)
 
-            if variations in existing_variations_list:
-                index = existing_variations_list.index(variations)
-                item_id = id_list[index]
-                item = CartItem.objects.get(product=product, id=item_id)
-                item.quantity += 1
-                item.save()
-            else:
-                item = CartItem.objects.create(product=product, quantity=1, cart=cart)
-                if len(variations) > 0:
-                    item.variations.clear()
-                    item.variations.add(*variations)
-                item.save()
-        else:
-            cart_item = CartItem.objects.create(
-                product=product,
-                quantity=1,
-                cart=cart,
-            )
-            if len(variations) > 0:
-                cart_item.variations.clear()
-                cart_item.variations.add(*variations)
-            cart_item.save()
+    variation_ids = []
+    if request.method == "POST":
+        # Resolve the selected variations through the product's cached
+        # variation map instead of one query per form field
+        variation_ids = resolve_variation_ids(product.id, selected_variations(request))
 
-        return redirect("cart")
+    get_cart_store(request).add(product.id, variation_ids)
+    adjust_cart_item_count(request, 1)
+    return redirect("cart")
 
 
 def remove_from_cart(request, product_id, cart_item_id):
-    product = Product.objects.get(id=product_id)
-
-    # Determine whether to use the cart associated with the session or the user
-    if request.user.is_authenticated:
-        # For authenticated users, look for cart items associated with the user
-        try:
-            cart_item = CartItem.objects.get(
-                product=product, user=request.user, id=cart_item_id, is_active=True
-            )
-        except CartItem.DoesNotExist:
-            pass  # Handle the case where the cart item does not exist
-    else:
-        # For guest users, use the session-based cart
-        cart = Cart.objects.get(cart_id=get_cart_id(request))
-        try:
-            cart_item = CartItem.objects.get(
-                product=product, cart=cart, id=cart_item_id
-            )
-        except CartItem.DoesNotExist:
-            pass  # Handle the case where the cart item does not exist
-
-    # Decrement the quantity of the cart item or remove it if the quantity is 1
-    try:
-        if cart_item.quantity > 1:
-            cart_item.quantity -= 1
-            cart_item.save()
-        else:
-            cart_item.delete()
-    except NameError:
-        pass  # Handle the case where cart_item is not defined due to the try-except blocks above
-
+    # Takes one off the quantity, removing the line once it reaches zero
+    if get_cart_store(request).decrement(cart_item_id, product_id):
+        adjust_cart_item_count(request, -1)
     return redirect("cart")
 
 
 def remove_product(request, product_id, cart_item_id):
-    product = Product.objects.get(id=product_id)
-
-    # Determine if the operation should be based on the user or the session cart
-    if request.user.is_authenticated:
-        # For authenticated users, directly target the cart item associated with the user
-        try:
-            cart_item = CartItem.objects.get(
-                product=product, user=request.user, id=cart_item_id
-            )
-        except CartItem.DoesNotExist:
-            return redirect("cart")
-    else:
-        # For guests, use the session-based cart
-        cart = Cart.objects.get(cart_id=get_cart_id(request))
-        try:
-            cart_item = CartItem.objects.get(
-                product=product, cart=cart, id=cart_item_id
-            )
-        except CartItem.DoesNotExist:
-            return redirect("cart")
-
-    # Delete the cart item
-    cart_item.delete()
-
+    removed = get_cart_store(request).remove(cart_item_id, product_id)
+    if removed:
+        adjust_cart_item_count(request, -removed)
     return redirect("cart")
 
 
-@login_required(login_url="login")
-def checkout(request, total=0, quantity=0):
-    total_tax = 0
-    cart_id = get_cart_id(request)
-    if request.user.is_authenticated:
-        # cart_, created = Cart.objects.get_or_create(cart_id=cart_id)
-        cart_items = CartItem.objects.filter(user=request.user, is_active=True)
-    else:
-        cart_, created = Cart.objects.get_or_create(cart_id=cart_id)
-        cart_items = CartItem.objects.filter(cart=cart_, is_active=True)
-
-    for cart_item in cart_items:
-        # Calculate total
-        total += cart_item.product.price * cart_item.quantity
-        quantity += cart_item.quantity
+@require_POST
+def update_cart(request):
+    """
+    JSON endpoint applying a batch of cart operations (see
+    carts.operations.parse_operations) and answering with the updated lines
+    and totals, so the cart page can redraw in place.
+    """
+    store = get_cart_store(request)
+    try:
+        apply_operations(store, parse_operations(json.loads(request.body)))
+    except ValueError as error:
+        return JsonResponse({"error": str(error)}, status=400)
 
-        # Calculate tax
-        tax = cart_item.get_tax(3)  # Assuming get_tax is a method of CartItem
-        total_tax += tax
+    pricer = CartPricer(store.items())
+    sync_cart_item_count(request, pricer.quantity)
+    return JsonResponse(pricer.as_dict())
 
-    context = {
-        "total": total,
-        "quantity": quantity,
-        "cart_items": cart_items,
-        "total_tax": total_tax,
-        "true_total": total + total_tax,
-    }
 
-    return render(request, "store/checkout.html", context)
+@login_required(login_url="login")
+def checkout(request):
+    pricer = CartPricer(get_cart_store(request).items())
+    sync_cart_item_count(request, pricer.quantity)
+    return render(request, "store/checkout.html", pricer.as_context())
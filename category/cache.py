@@ -0,0 +1,74 @@
+import threading
+from dataclasses import dataclass
+
+from django.db.models import Count, Q
+
+from abatua.versions import bump_version, get_version
+
+from .config import CATEGORY_VERSION_KEY
+from .models import Category
+
+
+@dataclass(frozen=True)
+class CategoryEntry:
+    id: int
+    category_name: str
+    slug: str
+    url: str
+    product_count: int
+
+    def get_url(self):
+        return self.url
+
+    def __str__(self):
+        return self.category_name
+
+
+@dataclass(frozen=True)
+class CategorySnapshot:
+    version: int
+    categories: tuple
+
+
+_snapshot = CategorySnapshot(version=None, categories=())
+_lock = threading.Lock()
+
+
+def get_category_version():
+    return get_version(CATEGORY_VERSION_KEY)
+
+
+def bump_category_version():
+    bump_version(CATEGORY_VERSION_KEY)
+
+
+def load_categories():
+    categories = Category.objects.annotate(
+        product_count=Count("product", filter=Q(product__is_available=True))
+    ).order_by("id")
+    return tuple(
+        CategoryEntry(
+            id=category.id,
+            category_name=category.category_name,
+            slug=category.slug,
+            url=category.get_url(),
+            product_count=category.product_count,
+        )
+        for category in categories
+    )
+
+
+def get_categories():
+    """
+    Returns the in-process category snapshot, reloading it only when another
+    process has bumped the shared version since it was taken.
+    """
+    global _snapshot
+    version = get_category_version()
+    if _snapshot.version == version:
+        return _snapshot.categories
+
+    with _lock:
+        if _snapshot.version != version:
+            _snapshot = CategorySnapshot(version=version, categories=load_categories())
+        return _snapshot.categories
@@ -0,0 +1 @@
+CATEGORY_VERSION_KEY = "category:version"
@@ -1,6 +1,5 @@
-from category.models import Category
+from category.cache import get_categories
 
 
 def menu_links(request):
-    categories = Category.objects.all()
-    return dict(categories=categories)
+    return dict(categories=get_categories())
@@ -1,3 +1,49 @@
-from django.test import TestCase
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase
 
-# Create your tests here.
+from store.models import Product
+
+from .cache import get_categories
+from .context_processors import menu_links
+from .models import Category
+
+
+class CategoryMenuCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.shirts = Category.objects.create(category_name="Shirts", slug="shirts")
+            self.product = Product.objects.create(
+                product_name="Blue Shirt",
+                slug="blue-shirt",
+                image="photos/products/test.jpg",
+                stock=1,
+                category=self.shirts,
+            )
+
+    def test_snapshot_is_reused_until_version_changes(self):
+        categories = get_categories()
+        self.assertEqual([c.category_name for c in categories], ["Shirts"])
+        self.assertEqual(categories[0].product_count, 1)
+        self.assertEqual(categories[0].get_url(), "/store/category/shirts/")
+
+        with self.assertNumQueries(0):
+            menu_links(RequestFactory().get("/"))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(category_name="Shoes", slug="shoes")
+        self.assertEqual(len(get_categories()), 2)
+
+    def test_product_counts_follow_availability(self):
+        get_categories()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.stock = 5
+            self.product.save()
+        with self.assertNumQueries(0):
+            get_categories()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.is_available = False
+            self.product.save()
+        self.assertEqual(get_categories()[0].product_count, 0)
@@ -1,6 +1,15 @@
 STATUS = (
     ("New", "New"),
     ("Accepted", "Accepted"),
+    ("Backorder", "Backorder"),
     ("Completed", "Completed"),
     ("Cancelled", "Cancelled"),
 )
+# Status of paid orders that the stock left couldn't cover
+BACKORDER_STATUS = "Backorder"
+
+# Seconds an unpaid order holds its stock before the sweeper releases it
+STOCK_RESERVATION_TTL = 60 * 15
+STOCK_SHARDS = 8
+
+OUT_OF_STOCK_MESSAGE = "Sorry, we don't have enough of {product} left in stock. Please update your cart and try again."
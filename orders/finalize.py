@@ -0,0 +1,97 @@
+from collections import defaultdict
+
+from django.db import transaction
+
+from carts.models import CartItem
+
+from .inventory import confirm_order
+from .models import Order, OrderProduct
+
+
+def load_cart_items(user):
+    """
+    The user's cart lines with their product and variation ids, in two
+    queries: the lines joined to their products, and their variation rows.
+    """
+    cart_items = list(CartItem.objects.filter(user=user).select_related("product"))
+    variations = defaultdict(list)
+    rows = CartItem.variations.through.objects.filter(
+        cartitem__in=[cart_item.pk for cart_item in cart_items]
+    ).values_list("cartitem_id", "variation_id")
+    for item_id, variation_id in rows:
+        variations[item_id].append(variation_id)
+    for cart_item in cart_items:
+        cart_item.variation_ids = variations[cart_item.pk]
+    return cart_items
+
+
+def create_order_products(order, payment, cart_items):
+    """
+    Copies cart lines (as loaded by load_cart_items) into the order, with one
+    bulk insert of the OrderProduct rows and one of their variations.
+    """
+    order_products = OrderProduct.objects.bulk_create(
+        [
+            OrderProduct(
+                order=order,
+                payment=payment,
+                user_id=order.user_id,
+                product_id=cart_item.product_id,
+                quantity=cart_item.quantity,
+                product_price=cart_item.product.price,
+                variation_signature=cart_item.variation_signature,
+                ordered=True,
+            )
+            for cart_item in cart_items
+        ]
+    )
+    if order_products and order_products[0].pk is None:
+        # Backends that can't return the ids of bulk inserted rows; a cart
+        # holds one line per product and variation signature
+        ids = {
+            (product_id, signature): pk
+            for pk, product_id, signature in OrderProduct.objects.filter(
+                order=order
+            ).values_list("pk", "product_id", "variation_signature")
+        }
+        for order_product in order_products:
+            order_product.pk = ids[
+                (order_product.product_id, order_product.variation_signature)
+            ]
+    through = OrderProduct.variations.through
+    through.objects.bulk_create(
+        [
+            through(orderproduct_id=order_product.pk, variation_id=variation_id)
+            for order_product, cart_item in zip(order_products, cart_items)
+            for variation_id in set(cart_item.variation_ids)
+        ]
+    )
+    return order_products
+
+
+def finalize_order(request, order, payment):
+    """
+    Records a paid order in one transaction: saves the payment, marks the
+    order as ordered, copies the cart into OrderProduct rows, consumes the
+    order's stock reservations and empties the cart. The number of queries
+    doesn't depend on the number of cart lines.
+
+    Returns the order, or None when it had been finalized already (e.g. a
+    payment callback submitted twice), in which case nothing is changed.
+    """
+    with transaction.atomic():
+        # Locking the order makes a concurrent second callback wait here and
+        # then see the order as already paid
+        order = Order.objects.select_for_update().get(pk=order.pk)
+        if order.is_ordered:
+            return None
+        payment.save()
+        order.payment = payment
+        order.is_ordered = True
+        order.save()
+
+        cart_items = load_cart_items(request.user)
+        create_order_products(order, payment, cart_items)
+        confirm_order(order, cart_items)
+        CartItem.objects.filter(pk__in=[item.pk for item in cart_items]).delete()
+    return order
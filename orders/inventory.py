@@ -0,0 +1,336 @@
+import logging
+import random
+from collections import Counter
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Case, F, Sum, Value, When
+from django.utils import timezone
+
+from store.models import Product
+from store.page_cache import bump_catalog_version
+
+from .config import BACKORDER_STATUS, STOCK_RESERVATION_TTL, STOCK_SHARDS
+from .models import Order, StockReservation, StockShard
+
+logger = logging.getLogger(__name__)
+
+RELEASE_BATCH_SIZE = 500
+
+
+class InsufficientStock(Exception):
+    def __init__(self, product):
+        super().__init__(f"Not enough stock left for {product}")
+        self.product = product
+
+
+def _take_from_shards(product, quantity):
+    shards = list(range(product.stock_shards))
+    random.shuffle(shards)
+    # Usually a single shard covers the whole quantity; trying them in random
+    # order spreads concurrent checkouts over different rows.
+    for shard in shards:
+        taken = StockShard.objects.filter(
+            product_id=product.pk, shard=shard, stock__gte=quantity
+        ).update(stock=F("stock") - quantity)
+        if taken:
+            return [(shard, quantity)]
+
+    # Otherwise collect the quantity from several shards, locked in order
+    levels = (
+        StockShard.objects.select_for_update()
+        .filter(product_id=product.pk, stock__gt=0)
+        .order_by("shard")
+        .values_list("shard", "stock")
+    )
+    levels = list(levels)
+    if sum(stock for shard, stock in levels) < quantity:
+        raise InsufficientStock(product)
+    parts, needed = [], quantity
+    for shard, stock in levels:
+        take = min(stock, needed)
+        StockShard.objects.filter(product_id=product.pk, shard=shard).update(
+            stock=F("stock") - take
+        )
+        parts.append((shard, take))
+        needed -= take
+        if not needed:
+            break
+    return parts
+
+
+def take_stock(product, quantity):
+    """
+    Takes ``quantity`` off a product's stock with conditional UPDATEs that
+    never let it go negative, and returns the [(shard, quantity)] parts taken
+    (shard is None for unsharded products). Raises InsufficientStock. Must
+    run inside a transaction when the product is sharded.
+    """
+    if product.stock_shards:
+        return _take_from_shards(product, quantity)
+    taken = Product.objects.filter(pk=product.pk, stock__gte=quantity).update(
+        stock=F("stock") - quantity
+    )
+    if not taken:
+        raise InsufficientStock(product)
+    return [(None, quantity)]
+
+
+def give_back(product_id, shard, quantity):
+    # The product may have been sharded or merged since the stock was taken;
+    # shard 0 exists whenever a product is sharded.
+    for candidate in (shard, 0):
+        if candidate is not None:
+            updated = StockShard.objects.filter(
+                product_id=product_id, shard=candidate
+            ).update(stock=F("stock") + quantity)
+            if updated:
+                return
+    Product.objects.filter(pk=product_id).update(stock=F("stock") + quantity)
+
+
+def give_back_all(reservations):
+    """
+    Gives back the stock of several reservations. Products that are not
+    sharded get theirs back in one UPDATE; the others go through give_back.
+    """
+    returned = Counter()
+    for reservation in reservations:
+        if reservation.shard is None:
+            returned[reservation.product_id] += reservation.quantity
+        else:
+            give_back(reservation.product_id, reservation.shard, reservation.quantity)
+    if not returned:
+        return
+    updated = Product.objects.filter(pk__in=returned, stock_shards=0).update(
+        stock=F("stock")
+        + Case(
+            *(When(pk=pk, then=Value(quantity)) for pk, quantity in returned.items()),
+            default=Value(0),
+        )
+    )
+    if updated < len(returned):
+        # Sharded since the stock was taken
+        for pk in Product.objects.filter(
+            pk__in=returned, stock_shards__gt=0
+        ).values_list("pk", flat=True):
+            give_back(pk, 0, returned[pk])
+
+
+def ordered_quantities(cart_items):
+    quantities, products = Counter(), {}
+    for cart_item in cart_items:
+        quantities[cart_item.product_id] += cart_item.quantity
+        products[cart_item.product_id] = cart_item.product
+    return quantities, products
+
+
+def reserve_order(order, cart_items, ttl=STOCK_RESERVATION_TTL):
+    """
+    Holds the stock of an order's cart items until it is paid or ``ttl``
+    seconds have passed. Either every item is reserved or, raising
+    InsufficientStock, none is.
+    """
+    quantities, products = ordered_quantities(cart_items)
+    expires_at = timezone.now() + timedelta(seconds=ttl)
+    reservations = []
+    with transaction.atomic():
+        # A fixed product order keeps concurrent checkouts from deadlocking
+        for product_id in sorted(quantities):
+            parts = take_stock(products[product_id], quantities[product_id])
+            reservations.extend(
+                StockReservation(
+                    order=order,
+                    product_id=product_id,
+                    shard=shard,
+                    quantity=quantity,
+                    expires_at=expires_at,
+                )
+                for shard, quantity in parts
+            )
+        StockReservation.objects.bulk_create(reservations)
+        check_sold_out(products.values())
+    return reservations
+
+
+def check_sold_out(products):
+    """
+    Expires the cached pages (on commit) when any of the given products ran
+    out of stock. Sharded products that ran out get their Product.stock
+    synced at once rather than by the next sweep; others are left to the
+    sweeper, so checkouts don't write the product rows sharding spreads.
+    """
+    sharded = [product.pk for product in products if product.stock_shards]
+    sold_out = Product.objects.filter(
+        pk__in=[product.pk for product in products], stock_shards=0, stock__lte=0
+    ).exists()
+    if sharded:
+        empty = list(
+            StockShard.objects.filter(product_id__in=sharded)
+            .values("product_id")
+            .annotate(total=Sum("stock"))
+            .filter(total__lte=0)
+            .values_list("product_id", flat=True)
+        )
+        if empty:
+            sync_sharded_stock(empty)
+            sold_out = True
+    if sold_out:
+        transaction.on_commit(bump_catalog_version)
+
+
+def _claim(reservation):
+    # Deleting first makes sure a reservation is consumed or released once,
+    # even when payment and the sweeper race for it
+    deleted, _ = StockReservation.objects.filter(pk=reservation.pk).delete()
+    return bool(deleted)
+
+
+def confirm_order(order, cart_items):
+    """
+    Consumes the reservations of a paid order. Quantities that are no longer
+    reserved (the reservation expired, or the cart grew) are taken from the
+    stock now; reserved quantities the order no longer needs are given back.
+    When the stock left can't cover them the order still goes through, as it
+    is paid for, but its status is set to BACKORDER_STATUS for staff to
+    follow up. Returns {product id: quantity short}.
+
+    The reservations are locked and claimed together with one delete, so
+    the sweeper can't release them meanwhile; where the database ignores
+    row locks (SQLite) the caller's transaction must have written already,
+    which holds the database write lock.
+    """
+    needed, products = ordered_quantities(cart_items)
+    with transaction.atomic():
+        reservations = list(order.reservations.select_for_update())
+        StockReservation.objects.filter(
+            pk__in=[reservation.pk for reservation in reservations]
+        ).delete()
+        for reservation in reservations:
+            used = min(reservation.quantity, needed[reservation.product_id])
+            needed[reservation.product_id] -= used
+            if reservation.quantity > used:
+                give_back(
+                    reservation.product_id,
+                    reservation.shard,
+                    reservation.quantity - used,
+                )
+
+        short = {}
+        for product_id, quantity in sorted(needed.items()):
+            if quantity <= 0:
+                continue
+            try:
+                with transaction.atomic():
+                    take_stock(products[product_id], quantity)
+            except InsufficientStock:
+                short[product_id] = quantity
+                logger.warning(
+                    "Order %s was paid for %s x product %s beyond the stock left",
+                    order.order_number,
+                    quantity,
+                    product_id,
+                )
+        if short:
+            order.status = BACKORDER_STATUS
+            Order.objects.filter(pk=order.pk).update(status=BACKORDER_STATUS)
+        check_sold_out(products.values())
+    return short
+
+
+def release_reservations(reservations):
+    released = 0
+    for reservation in reservations:
+        with transaction.atomic():
+            if _claim(reservation):
+                give_back(
+                    reservation.product_id, reservation.shard, reservation.quantity
+                )
+                released += 1
+    return released
+
+
+def release_unpaid_orders(user):
+    """
+    Gives back the stock held by the user's unpaid orders, e.g. before they
+    check out again. Paying such an order later takes its stock afresh.
+    Returns the number of reservations released.
+    """
+    with transaction.atomic():
+        # Claimed together like in confirm_order, then given back one by one
+        reservations = list(
+            StockReservation.objects.select_for_update().filter(
+                order__user=user, order__is_ordered=False
+            )
+        )
+        if not reservations:
+            return 0
+        StockReservation.objects.filter(
+            pk__in=[reservation.pk for reservation in reservations]
+        ).delete()
+        give_back_all(reservations)
+        transaction.on_commit(bump_catalog_version)
+    return len(reservations)
+
+
+def sync_sharded_stock(product_ids=None):
+    """
+    Copies the shard totals of sharded products (all of them, or the given
+    ones) into Product.stock, which the storefront reads to show
+    availability.
+    """
+    totals = StockShard.objects.values("product_id")
+    if product_ids is not None:
+        totals = totals.filter(product_id__in=product_ids)
+    totals = totals.annotate(total=Sum("stock")).order_by()
+    Product.objects.bulk_update(
+        [Product(pk=row["product_id"], stock=row["total"]) for row in totals],
+        ["stock"],
+    )
+
+
+def release_expired_reservations(now=None):
+    """
+    Sweeper: gives the stock of expired reservations back and refreshes the
+    stock shown for sharded products. Returns the number released.
+    """
+    expired = StockReservation.objects.filter(
+        expires_at__lte=now or timezone.now()
+    ).order_by("expires_at")
+    released = 0
+    while batch := list(expired[:RELEASE_BATCH_SIZE]):
+        released += release_reservations(batch)
+    sync_sharded_stock()
+    if released:
+        bump_catalog_version()
+    return released
+
+
+def shard_stock(product, shards=STOCK_SHARDS):
+    """
+    Spreads a product's stock evenly over ``shards`` StockShard rows, or with
+    shards=0 merges the shards back into Product.stock. While a product is
+    sharded its Product.stock is only a copy for display, so restock it by
+    merging, editing the stock and sharding again.
+    """
+    if shards < 0:
+        raise ValueError("The number of shards can't be negative.")
+    with transaction.atomic():
+        product = Product.objects.select_for_update().get(pk=product.pk)
+        current = StockShard.objects.filter(product=product)
+        if product.stock_shards:
+            total = current.aggregate(total=Sum("stock"))["total"] or 0
+        else:
+            total = max(product.stock, 0)
+        current.delete()
+        StockShard.objects.bulk_create(
+            [
+                StockShard(
+                    product=product,
+                    shard=shard,
+                    stock=total // shards + (shard < total % shards),
+                )
+                for shard in range(shards)
+            ]
+        )
+        Product.objects.filter(pk=product.pk).update(stock=total, stock_shards=shards)
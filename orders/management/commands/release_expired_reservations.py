@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from orders.inventory import release_expired_reservations
+
+
+class Command(BaseCommand):
+    help = (
+        "Give the stock held by expired reservations of unpaid orders back. "
+        "Run it every minute or so from cron."
+    )
+
+    def handle(self, *args, **options):
+        released = release_expired_reservations()
+        self.stdout.write(
+            self.style.SUCCESS(f"Released {released} expired stock reservations.")
+        )
@@ -0,0 +1,47 @@
+from argparse import ArgumentTypeError
+
+from django.core.management.base import BaseCommand, CommandError
+
+from orders.config import STOCK_SHARDS
+from orders.inventory import shard_stock
+from store.models import Product
+
+
+def shard_count(value):
+    shards = int(value)
+    if shards < 1:
+        raise ArgumentTypeError("must be at least 1 (use --merge to unshard)")
+    return shards
+
+
+class Command(BaseCommand):
+    help = (
+        "Spread the stock of hot products over several rows so concurrent "
+        "checkouts don't queue on a single product row."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("slugs", nargs="+", help="Product slugs.")
+        parser.add_argument(
+            "--shards",
+            type=shard_count,
+            default=STOCK_SHARDS,
+            help="Number of shards, at least 1.",
+        )
+        parser.add_argument(
+            "--merge",
+            action="store_true",
+            help="Merge the shards back into the product's stock.",
+        )
+
+    def handle(self, *args, slugs, shards, merge, **options):
+        if merge:
+            shards = 0
+        for slug in slugs:
+            try:
+                product = Product.objects.get(slug=slug)
+            except Product.DoesNotExist:
+                raise CommandError(f"No product with slug {slug!r}.")
+            shard_stock(product, shards)
+            self.stdout.write(f"{product}: {shards or 'no'} stock shards")
+        self.stdout.write(self.style.SUCCESS("Done."))
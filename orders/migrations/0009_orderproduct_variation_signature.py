@@ -0,0 +1,52 @@
+# Generated by Django 5.0.1 on 2026-10-18 08:56
+
+import hashlib
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_variation_signatures(apps, schema_editor):
+    # Like store.models.variation_signature, from the variations through table
+    OrderProduct = apps.get_model("orders", "OrderProduct")
+    ids = defaultdict(set)
+    rows = OrderProduct.variations.through.objects.values_list(
+        "orderproduct_id", "variation_id"
+    )
+    for line, variation in rows.iterator():
+        ids[line].add(variation)
+    for line, variations in ids.items():
+        signature = ",".join(map(str, sorted(variations)))
+        OrderProduct.objects.filter(pk=line).update(
+            variation_signature=hashlib.md5(signature.encode()).hexdigest()
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0008_stock_reservations"),
+        ("store", "0015_variation_keys"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="orderproduct",
+            name="variation_signature",
+            field=models.CharField(
+                default="d41d8cd98f00b204e9800998ecf8427e",
+                editable=False,
+                max_length=32,
+            ),
+        ),
+        migrations.RunPython(backfill_variation_signatures, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="orderproduct",
+            index=models.Index(
+                fields=["order", "product", "variation_signature"],
+                name="order_line_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.0.1 on 2026-10-18 09:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0009_orderproduct_variation_signature"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="order",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("New", "New"),
+                    ("Accepted", "Accepted"),
+                    ("Backorder", "Backorder"),
+                    ("Completed", "Completed"),
+                    ("Cancelled", "Cancelled"),
+                ],
+                default="New",
+                max_length=10,
+            ),
+        ),
+    ]
@@ -4,7 +4,7 @@ from django.db import models
 
 from accounts.models import Account
 from orders.config import STATUS
-from store.models import Product, Variation
+from store.models import EMPTY_VARIATION_SIGNATURE, Product, Variation
 
 
 class Payment(models.Model):
@@ -63,6 +63,9 @@ class OrderProduct(models.Model):
     user = models.ForeignKey(Account, on_delete=models.CASCADE)
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     variations = models.ManyToManyField(Variation, blank=True)
+    variation_signature = models.CharField(
+        max_length=32, default=EMPTY_VARIATION_SIGNATURE, editable=False
+    )
     quantity = models.IntegerField()
     product_price = models.DecimalField(
         max_digits=10, decimal_places=2, default=Decimal("0.00")
@@ -71,5 +74,56 @@ class OrderProduct(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["order", "product", "variation_signature"],
+                name="order_line_idx",
+            )
+        ]
+
     def __str__(self):
         return self.product.product_name
+
+
+class StockReservation(models.Model):
+    """
+    Stock held for an unpaid order. The quantity has already been taken off
+    the product's stock; paying for the order consumes the reservation, and
+    orders.inventory.release_expired_reservations gives it back once
+    ``expires_at`` has passed.
+    """
+
+    order = models.ForeignKey(
+        Order, on_delete=models.CASCADE, related_name="reservations"
+    )
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="+")
+    quantity = models.PositiveIntegerField()
+    shard = models.PositiveSmallIntegerField(null=True, blank=True)
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id} for order {self.order_id}"
+
+
+class StockShard(models.Model):
+    """
+    One slice of the stock of a hot product. Spreading a product's stock over
+    several rows lets concurrent checkouts decrement different rows instead
+    of queueing on one; see orders.inventory.shard_stock.
+    """
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="+")
+    shard = models.PositiveSmallIntegerField()
+    stock = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["product", "shard"], name="unique_stock_shard"
+            ),
+            models.CheckConstraint(
+                check=models.Q(stock__gte=0), name="stock_shard_not_negative"
+            ),
+        ]
@@ -1,3 +1,260 @@
-from django.test import TestCase
+import json
+from datetime import timedelta
+from io import StringIO
 
-# Create your tests here.
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from carts.models import CartItem
+from store.models import Product, Variation, variation_signature
+from store.page_cache import get_catalog_version
+from store.tests import create_product, create_user
+
+from .config import BACKORDER_STATUS
+from .finalize import finalize_order
+from .inventory import (
+    InsufficientStock,
+    confirm_order,
+    release_expired_reservations,
+    reserve_order,
+    shard_stock,
+    take_stock,
+)
+from .models import Order, OrderProduct, Payment, StockReservation, StockShard
+
+ORDER_FORM = {
+    "first_name": "Ada",
+    "last_name": "Test",
+    "phone": "123",
+    "email": "ada@example.com",
+    "address_line_1": "Street 1",
+    "country": "NL",
+    "state": "NH",
+    "city": "Amsterdam",
+}
+
+
+def create_shopper(username="shopper"):
+    user = create_user(username)
+    user.is_active = True
+    user.save()
+    return user
+
+
+def stock_of(product):
+    return Product.objects.get(pk=product.pk).stock
+
+
+def shard_levels(product):
+    return list(
+        StockShard.objects.filter(product=product)
+        .order_by("shard")
+        .values_list("stock", flat=True)
+    )
+
+
+class InventoryTest(TestCase):
+    def setUp(self):
+        self.user = create_shopper()
+        self.shirt = create_product("Shirt", stock=3)
+        self.tie = create_product("Tie", stock=1)
+
+    def add_to_cart(self, product, quantity):
+        return CartItem.objects.create(
+            user=self.user, product=product, quantity=quantity
+        )
+
+    def create_order(self):
+        return Order.objects.create(user=self.user, order_number="1", order_total=1)
+
+    def test_take_stock_never_goes_negative(self):
+        take_stock(self.shirt, 2)
+        with self.assertRaises(InsufficientStock):
+            take_stock(self.shirt, 2)
+        self.assertEqual(stock_of(self.shirt), 1)
+
+    def test_reservation_is_all_or_nothing(self):
+        items = [self.add_to_cart(self.shirt, 2), self.add_to_cart(self.tie, 2)]
+        with self.assertRaises(InsufficientStock) as raised:
+            reserve_order(self.create_order(), items)
+        self.assertEqual(raised.exception.product, self.tie)
+        self.assertEqual((stock_of(self.shirt), stock_of(self.tie)), (3, 1))
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_expired_reservations_are_released(self):
+        order = self.create_order()
+        reserve_order(order, [self.add_to_cart(self.shirt, 2)], ttl=60)
+        self.assertEqual(stock_of(self.shirt), 1)
+
+        self.assertEqual(release_expired_reservations(), 0)
+        later = timezone.now() + timedelta(seconds=61)
+        self.assertEqual(release_expired_reservations(now=later), 1)
+        self.assertEqual(stock_of(self.shirt), 3)
+        self.assertFalse(order.reservations.exists())
+
+    def test_sharded_stock(self):
+        self.shirt.stock = 10
+        self.shirt.save()
+        shard_stock(self.shirt, 4)
+        self.assertEqual(shard_levels(self.shirt), [3, 3, 2, 2])
+        self.shirt.refresh_from_db()
+
+        # 7 units need several shards once the quantity exceeds any one shard
+        reservations = reserve_order(
+            self.create_order(), [self.add_to_cart(self.shirt, 7)]
+        )
+        self.assertEqual(sum(r.quantity for r in reservations), 7)
+        self.assertEqual(sum(shard_levels(self.shirt)), 3)
+        with self.assertRaises(InsufficientStock):
+            take_stock(self.shirt, 4)
+
+        release_expired_reservations(now=timezone.now() + timedelta(days=1))
+        self.assertEqual(sum(shard_levels(self.shirt)), 10)
+        self.assertEqual(stock_of(self.shirt), 10)
+
+        shard_stock(self.shirt, 0)
+        self.assertEqual(shard_levels(self.shirt), [])
+        self.assertEqual(stock_of(self.shirt), 10)
+        with self.assertRaises(ValueError):
+            shard_stock(self.shirt, -1)
+
+    def test_sold_out_sharded_stock_is_synced(self):
+        shard_stock(self.shirt, 2)
+        self.shirt.refresh_from_db()
+        version = get_catalog_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            reserve_order(self.create_order(), [self.add_to_cart(self.shirt, 3)])
+        self.assertEqual(stock_of(self.shirt), 0)
+        self.assertNotEqual(get_catalog_version(), version)
+
+    def test_paid_orders_beyond_the_stock_are_backordered(self):
+        order = self.create_order()
+        items = [self.add_to_cart(self.shirt, 2)]
+        reserve_order(order, items, ttl=60)
+        release_expired_reservations(now=timezone.now() + timedelta(seconds=61))
+        take_stock(self.shirt, 2)
+        self.assertEqual(confirm_order(order, items), {self.shirt.pk: 2})
+        order.refresh_from_db()
+        self.assertEqual(order.status, BACKORDER_STATUS)
+        self.assertEqual(stock_of(self.shirt), 1)
+
+    def test_shard_command_rejects_negative_shards(self):
+        with self.assertRaises(CommandError):
+            call_command("shard_stock", "shirt", "--shards", "-1")
+        call_command("shard_stock", "shirt", "--shards", "2", stdout=StringIO())
+        self.assertEqual(shard_levels(self.shirt), [2, 1])
+        call_command("shard_stock", "shirt", "--merge", stdout=StringIO())
+        self.assertEqual(shard_levels(self.shirt), [])
+
+
+class CheckoutTest(TestCase):
+    def setUp(self):
+        self.user = create_shopper()
+        self.client.force_login(self.user)
+        self.shirt = create_product("Shirt", stock=3)
+        CartItem.objects.create(user=self.user, product=self.shirt, quantity=2)
+
+    def pay(self, order):
+        return self.client.post(
+            reverse("payments"),
+            json.dumps(
+                {
+                    "orderID": order.order_number,
+                    "transactionID": "T1",
+                    "paymentMethod": "PayPal",
+                    "status": "COMPLETED",
+                }
+            ),
+            content_type="application/json",
+        )
+
+    def test_place_order_reserves_and_payment_consumes(self):
+        response = self.client.post(reverse("place_order"), ORDER_FORM)
+        self.assertEqual(response.status_code, 200)
+        order = response.context["order"]
+        self.assertEqual(stock_of(self.shirt), 1)
+        self.assertEqual(order.reservations.get().quantity, 2)
+
+        response = self.pay(order)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(stock_of(self.shirt), 1)
+        self.assertFalse(order.reservations.exists())
+        self.assertEqual(OrderProduct.objects.get().quantity, 2)
+
+    def test_order_is_finalized_once(self):
+        order = self.client.post(reverse("place_order"), ORDER_FORM).context["order"]
+        request = RequestFactory().post(reverse("payments"))
+        request.user, request.session = self.user, self.client.session
+
+        def finalize(transaction_id):
+            payment = Payment(
+                user=self.user,
+                payment_id=transaction_id,
+                payment_method="PayPal",
+                amount_paid=order.order_total,
+                status="COMPLETED",
+            )
+            return finalize_order(request, order, payment)
+
+        self.assertIsNotNone(finalize("T1"))
+        # A second callback for the same order, with the cart refilled
+        CartItem.objects.create(user=self.user, product=self.shirt, quantity=1)
+        self.assertIsNone(finalize("T2"))
+        self.assertEqual(stock_of(self.shirt), 1)
+        self.assertEqual(OrderProduct.objects.filter(order=order).count(), 1)
+        self.assertEqual(Payment.objects.count(), 1)
+        self.assertTrue(CartItem.objects.filter(user=self.user).exists())
+
+    def count_payment_queries(self, lines):
+        for i in range(lines):
+            product = create_product(f"Tie {lines} {i}", stock=5)
+            color = Variation.objects.create(
+                product=product, variation_category="color", variation_value="Red"
+            )
+            size = Variation.objects.create(
+                product=product, variation_category="size", variation_value="L"
+            )
+            CartItem.objects.add_line(product.pk, [color.pk, size.pk], user=self.user)
+        order = self.client.post(reverse("place_order"), ORDER_FORM).context["order"]
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.pay(order).status_code, 200)
+        return len(queries)
+
+    def test_payment_queries_do_not_grow_with_the_cart(self):
+        self.assertEqual(self.count_payment_queries(1), self.count_payment_queries(5))
+
+    def test_payment_copies_the_cart(self):
+        color = Variation.objects.create(
+            product=self.shirt, variation_category="color", variation_value="Red"
+        )
+        CartItem.objects.add_line(self.shirt.pk, [color.pk], user=self.user)
+        order = self.client.post(reverse("place_order"), ORDER_FORM).context["order"]
+        self.pay(order)
+
+        order.refresh_from_db()
+        lines = OrderProduct.objects.filter(order=order, payment=order.payment)
+        self.assertEqual(lines.get(variations=None).quantity, 2)
+        line = lines.get(variations=color)
+        self.assertEqual(line.quantity, 1)
+        self.assertEqual(line.variation_signature, variation_signature([color]))
+        self.assertFalse(CartItem.objects.filter(user=self.user).exists())
+        self.assertEqual(stock_of(self.shirt), 0)
+
+    def test_checking_out_again_releases_the_earlier_hold(self):
+        first = self.client.post(reverse("place_order"), ORDER_FORM).context["order"]
+        second = self.client.post(reverse("place_order"), ORDER_FORM).context["order"]
+        self.assertEqual(stock_of(self.shirt), 1)
+        self.assertFalse(first.reservations.exists())
+        self.assertEqual(second.reservations.get().quantity, 2)
+
+    def test_place_order_without_stock(self):
+        Product.objects.filter(pk=self.shirt.pk).update(stock=1)
+        response = self.client.post(reverse("place_order"), ORDER_FORM)
+        self.assertRedirects(response, reverse("cart"), fetch_redirect_response=False)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(stock_of(self.shirt), 1)
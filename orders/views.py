@@ -2,15 +2,19 @@ import datetime
 import json
 
 from django.conf import settings
+from django.contrib import messages
 from django.http import HttpResponse, JsonResponse
 from django.shortcuts import redirect, render
 
 from accounts.config import ORDER_CONFIRMATION_SUBJECT
 from accounts.utils import send_email
-from carts.models import CartItem
-from store.models import Product
+from carts.pricing import CartPricer
+from carts.stores import get_cart_store
 
+from .config import OUT_OF_STOCK_MESSAGE
+from .finalize import finalize_order
 from .forms import Order, OrderForm
+from .inventory import InsufficientStock, release_unpaid_orders, reserve_order
 from .models import OrderProduct, Payment
 
 
@@ -30,49 +34,18 @@ def payments(request):
         status=body["status"],
     )
 
-    payment.save()
+    # Record the order, consume its stock reservations and clear the cart
+    finalized = finalize_order(request, order, payment)
 
-    order.payment = payment
-    order.is_ordered = True
-    order.save()
+    # Send order confirmation email to customer, once
 
-    # Move ordered items into OrderProduct table
-    cart_items = CartItem.objects.filter(user=request.user)
-
-    for cart_item in cart_items:
-        order_product = OrderProduct()
-        order_product.order_id = order.id
-        order_product.payment = payment
-        order_product.user_id = request.user.id
-        order_product.product_id = cart_item.product_id
-        order_product.quantity = cart_item.quantity
-        order_product.product_price = cart_item.product.price
-        order_product.ordered = True
-
-        order_product.save()
-
-        cart_item = CartItem.objects.get(id=cart_item.id)
-        product_variation = cart_item.variations.all()
-        order_product = OrderProduct.objects.get(id=order_product.id)
-        order_product.variations.set(product_variation)
-        order_product.save()
-
-        # Reduce quantity of products in stock
-        product = Product.objects.get(id=cart_item.product_id)
-        product.stock -= cart_item.quantity
-        product.save()
-
-    # Clear cart
-    CartItem.objects.filter(user=request.user).delete()
-
-    # Send order confirmation email to customer
-
-    send_email(
-        user=request.user,
-        subject=ORDER_CONFIRMATION_SUBJECT,
-        template="orders/order_received_email.html",
-        context={"order": order},
-    )
+    if finalized is not None:
+        send_email(
+            user=request.user,
+            subject=ORDER_CONFIRMATION_SUBJECT,
+            template="orders/order_received_email.html",
+            context={"order": finalized},
+        )
 
     # Send order number and transaction id back to sendData method in frontend via JSON response
 
@@ -83,26 +56,17 @@ def payments(request):
     return JsonResponse(data)
 
 
-def place_order(request, total=0, quantity=0):
+def place_order(request):
     current_user = request.user
 
     # If user cart is empty, redirect back to shop
 
-    cart_items = CartItem.objects.filter(user=current_user)
-    cart_count = cart_items.count()
-
-    if cart_count <= 0:
+    pricer = CartPricer(get_cart_store(request).items())
+    if not pricer:
         return redirect("store")
 
-    total_tax = 0
-
-    for cart_item in cart_items:
-        total += cart_item.product.price * cart_item.quantity
-        quantity += cart_item.quantity
-        tax = cart_item.get_tax(3)
-        total_tax += tax
-
-    grand_total = total + total_tax
+    cart_items = pricer.items
+    total, total_tax, grand_total = pricer.total, pricer.tax, pricer.grand_total
 
     if request.method == "POST":
         form = OrderForm(request.POST)
@@ -140,6 +104,19 @@ def place_order(request, total=0, quantity=0):
             data.order_number = order_number
             data.save()
 
+            # Hold the stock until the order is paid; without enough stock
+            # the order is not placed at all. Checking out again replaces
+            # the user's earlier unpaid orders, so their holds are released
+            release_unpaid_orders(current_user)
+            try:
+                reserve_order(data, cart_items)
+            except InsufficientStock as error:
+                data.delete()
+                messages.error(
+                    request, OUT_OF_STOCK_MESSAGE.format(product=error.product)
+                )
+                return redirect("cart")
+
             order = Order.objects.get(
                 user=current_user, is_ordered=False, order_number=order_number
             )
@@ -1,18 +1,25 @@
-import admin_thumbnails
 from django.contrib import admin
 
 from .models import Product, ProductGallery, ReviewRating, Variation
+from .templatetags.store_images import responsive_image
+
+
+@admin.display(description="Thumbnail")
+def image_thumbnail(obj):
+    # Stored thumb rendition instead of resizing the original on every request
+    return responsive_image(obj, "thumb") if obj.image else ""
 
 
-@admin_thumbnails.thumbnail("image")
 class ProductGalleryInLine(admin.TabularInline):
     model = ProductGallery
     extra = 1
+    readonly_fields = (image_thumbnail,)
 
 
 class ProductAdmin(admin.ModelAdmin):
     prepopulated_fields = {"slug": ("product_name",)}
     list_display = (
+        image_thumbnail,
         "product_name",
         "price",
         "slug",
@@ -20,6 +27,7 @@ class ProductAdmin(admin.ModelAdmin):
         "date_modified",
         "is_available",
     )
+    readonly_fields = (image_thumbnail,)
     inlines = [ProductGalleryInLine]
 
 
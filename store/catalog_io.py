@@ -0,0 +1,416 @@
+import csv
+import hashlib
+import json
+import os
+import posixpath
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.core.files import File
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.text import slugify
+
+from category.cache import bump_category_version
+from category.models import Category
+
+from .config import (
+    CATALOG_IMAGE_WORKERS,
+    CATALOG_IMPORT_BATCH_SIZE,
+    CATALOG_LIST_SEPARATOR,
+)
+from .facets import index_product_facets
+from .feed import invalidate_home_feed
+from .models import Product, ProductGallery, Variation, variation_key
+from .page_cache import bump_catalog_version
+from .search import get_search_backend
+from .variations import bump_variation_versions
+
+# One record per product; the list fields are "|"-separated in CSV files
+CATALOG_FIELDS = (
+    "category",
+    "category_slug",
+    "product_name",
+    "slug",
+    "description",
+    "price",
+    "stock",
+    "is_available",
+    "image",
+    "gallery",
+    "colors",
+    "sizes",
+)
+LIST_FIELDS = ("gallery", "colors", "sizes")
+PRODUCT_UPDATE_FIELDS = (
+    "product_name",
+    "product_description",
+    "price",
+    "stock",
+    "is_available",
+    "category",
+    "image",
+    "date_modified",
+)
+
+
+class CatalogError(ValueError):
+    pass
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def read_records(stream, fmt):
+    """
+    Yields one normalized record dict per line of a CSV or JSONL stream,
+    without reading the whole file.
+    """
+    if fmt == "csv":
+        for record in csv.DictReader(stream):
+            for name in LIST_FIELDS:
+                value = record.get(name)
+                if value is not None:
+                    record[name] = [v for v in value.split(CATALOG_LIST_SEPARATOR) if v]
+            yield record
+    else:
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
+
+
+def write_records(stream, fmt, records):
+    if fmt == "csv":
+        writer = csv.DictWriter(stream, fieldnames=CATALOG_FIELDS)
+        writer.writeheader()
+        for record in records:
+            for name in LIST_FIELDS:
+                record[name] = CATALOG_LIST_SEPARATOR.join(record[name])
+            writer.writerow(record)
+    else:
+        for record in records:
+            stream.write(json.dumps(record) + "\n")
+
+
+def export_records(batch_size=CATALOG_IMPORT_BATCH_SIZE):
+    """
+    Yields the catalog as import records, reading products in chunks with
+    their variations and gallery prefetched per chunk.
+    """
+    products = (
+        Product.objects.select_related("category")
+        .prefetch_related("variation_set", "productgallery_set")
+        .order_by("id")
+    )
+    for product in products.iterator(chunk_size=batch_size):
+        variations = [v for v in product.variation_set.all() if v.is_active]
+        yield {
+            "category": product.category.category_name,
+            "category_slug": product.category.slug,
+            "product_name": product.product_name,
+            "slug": product.slug,
+            "description": product.product_description,
+            "price": str(product.price),
+            "stock": product.stock,
+            "is_available": product.is_available,
+            "image": product.image.name,
+            "gallery": [image.image.name for image in product.productgallery_set.all()],
+            "colors": [
+                v.variation_value for v in variations if v.variation_category == "color"
+            ],
+            "sizes": [
+                v.variation_value for v in variations if v.variation_category == "size"
+            ],
+        }
+
+
+TRUE_VALUES = ("1", "true", "yes", "y")
+FALSE_VALUES = ("0", "false", "no", "n")
+
+
+def parse_bool(value):
+    """
+    Returns None for a blank or missing value, so the product keeps its
+    current (or default) setting.
+    """
+    if value is None or isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if not text:
+        return None
+    if text in TRUE_VALUES:
+        return True
+    if text in FALSE_VALUES:
+        return False
+    raise CatalogError(f"yes/no value {value!r}")
+
+
+def file_digest(file):
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: file.read(64 * 1024), b""):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+@dataclass
+class ImportStats:
+    rows: int = 0
+    created: int = 0
+    updated: int = 0
+    images: int = 0
+    missing_images: list = field(default_factory=list)
+    started: float = field(default_factory=time.monotonic)
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0
+
+
+class CatalogImporter:
+    """
+    Upserts catalog records (see CATALOG_FIELDS) in batches: one transaction
+    and a handful of bulk queries per batch, keyed on category and product
+    slugs. Image files are copied into storage by a thread pool before each
+    batch's transaction starts.
+
+    Bulk writes bypass the model signals, so the derived search, facet and
+    cache data of the imported products is refreshed per batch instead.
+    """
+
+    def __init__(
+        self,
+        images_dir=None,
+        batch_size=CATALOG_IMPORT_BATCH_SIZE,
+        workers=CATALOG_IMAGE_WORKERS,
+    ):
+        self.images_dir = images_dir
+        self.batch_size = batch_size
+        self.workers = workers
+        self.stats = ImportStats()
+
+    def run(self, records):
+        with ThreadPoolExecutor(max_workers=self.workers) as self.pool:
+            for batch in chunked(records, self.batch_size):
+                self.import_batch(batch)
+        if self.stats.rows:
+            bump_category_version()
+            bump_catalog_version()
+            invalidate_home_feed()
+        return self.stats
+
+    def store_image(self, path, field_file):
+        """
+        Returns the storage name for an image path: paths already in storage
+        are kept, local files are copied in unless a file with the same name
+        and content is stored already.
+        """
+        storage = field_file.storage
+        if storage.exists(path):
+            return path
+        local = os.path.join(self.images_dir, path) if self.images_dir else path
+        if not os.path.isfile(local):
+            return None
+        name = posixpath.join(field_file.field.upload_to, os.path.basename(local))
+        with open(local, "rb") as source:
+            if storage.exists(name) and storage.size(name) == os.path.getsize(local):
+                with storage.open(name) as stored:
+                    if file_digest(stored) == file_digest(source):
+                        return name
+                source.seek(0)
+            name = storage.save(name, File(source))
+        self.stats.images += 1
+        return name
+
+    def store_images(self, records):
+        fields = {"image": Product().image, "gallery": ProductGallery().image}
+        jobs = []
+        for record in records:
+            if record.get("image"):
+                jobs.append((record, "image", None, record["image"]))
+            for i, path in enumerate(record.get("gallery") or ()):
+                jobs.append((record, "gallery", i, path))
+
+        # Each file is stored once, so concurrent copies of it can't race
+        files = list(dict.fromkeys((key, path) for record, key, index, path in jobs))
+        names = self.pool.map(
+            lambda file: self.store_image(file[1], fields[file[0]]), files
+        )
+        stored = dict(zip(files, names))
+        for record, key, index, path in jobs:
+            name = stored[(key, path)]
+            if name is None:
+                self.stats.missing_images.append(path)
+            if index is None:
+                record[key] = name
+            else:
+                record[key][index] = name
+        for record in records:
+            if record.get("gallery") is not None:
+                record["gallery"] = list(dict.fromkeys(filter(None, record["gallery"])))
+
+    def clean(self, record, line):
+        try:
+            name = record["product_name"].strip()
+            category = record["category"].strip()
+            return {
+                **record,
+                "product_name": name,
+                "slug": (record.get("slug") or slugify(name)).strip(),
+                "category": category,
+                "category_slug": record.get("category_slug") or slugify(category),
+                "description": record.get("description") or "",
+                "price": Decimal(str(record["price"])),
+                "stock": int(record.get("stock") or 0),
+                "is_available": parse_bool(record.get("is_available")),
+            }
+        except (KeyError, AttributeError, InvalidOperation, ValueError) as error:
+            raise CatalogError(f"Record {line}: invalid or missing {error}") from error
+
+    def import_batch(self, records):
+        first = self.stats.rows + 1
+        records = [self.clean(record, first + i) for i, record in enumerate(records)]
+        self.store_images(records)
+        try:
+            with transaction.atomic():
+                categories = self.upsert_categories(records)
+                products = self.upsert_products(records, categories)
+                self.sync_variations(records, products)
+                self.sync_gallery(records, products)
+        except IntegrityError as error:
+            # E.g. a product name already used by a product with another slug
+            last = first + len(records) - 1
+            raise CatalogError(f"Records {first}-{last}: {error}") from error
+        self.stats.rows += len(records)
+        self.refresh_derived_data([product.pk for product in products.values()])
+
+    def upsert_categories(self, records):
+        names = {record["category_slug"]: record["category"] for record in records}
+        categories = Category.objects.in_bulk(list(names), field_name="slug")
+        Category.objects.bulk_create(
+            [
+                Category(category_name=name, slug=slug)
+                for slug, name in names.items()
+                if slug not in categories
+            ]
+        )
+        changed = []
+        for slug, category in categories.items():
+            if category.category_name != names[slug]:
+                category.category_name = names[slug]
+                changed.append(category)
+        Category.objects.bulk_update(changed, ["category_name"])
+        return Category.objects.in_bulk(list(names), field_name="slug")
+
+    def upsert_products(self, records, categories):
+        by_slug = {record["slug"]: record for record in records}
+        existing = Product.objects.in_bulk(list(by_slug), field_name="slug")
+        created, changed = [], []
+        for slug, record in by_slug.items():
+            product = existing.get(slug) or Product(slug=slug)
+            product.product_name = record["product_name"]
+            product.product_description = record["description"]
+            product.price = record["price"]
+            if not product.stock_shards:
+                # Sharded stock is only changed through orders.inventory
+                product.stock = record["stock"]
+            if record["is_available"] is not None:
+                product.is_available = record["is_available"]
+            product.category = categories[record["category_slug"]]
+            if record.get("image"):
+                product.image = record["image"]
+            product.date_modified = timezone.now()
+            (changed if product.pk else created).append(product)
+
+        Product.objects.bulk_create(created)
+        Product.objects.bulk_update(changed, PRODUCT_UPDATE_FIELDS)
+        self.stats.created += len(created)
+        self.stats.updated += len(changed)
+        return Product.objects.in_bulk(list(by_slug), field_name="slug")
+
+    def sync_variations(self, records, products):
+        """
+        Makes the active colors and sizes of each product match its record.
+        Variations that are no longer listed are deactivated rather than
+        deleted, since cart items may still point at them.
+        """
+        wanted = {}
+        for record in records:
+            product = products[record["slug"]]
+            for category in ("color", "size"):
+                values = record.get(f"{category}s")
+                if values is not None:
+                    wanted[(product.pk, category)] = {
+                        variation_key(v): v.strip() for v in values if v.strip()
+                    }
+        if not wanted:
+            return
+
+        product_ids = {product_id for product_id, category in wanted}
+        current = Variation.objects.filter(product_id__in=product_ids)
+        seen, changed = set(), []
+        for variation in current:
+            key = (variation.product_id, variation.category_key)
+            if key not in wanted:
+                continue
+            active = variation.value_key in wanted[key]
+            seen.add(key + (variation.value_key,))
+            if variation.is_active != active:
+                variation.is_active = active
+                changed.append(variation)
+        Variation.objects.bulk_update(changed, ["is_active"])
+        Variation.objects.bulk_create(
+            [
+                Variation(
+                    product_id=product_id,
+                    variation_category=category,
+                    variation_value=value,
+                    category_key=category,
+                    value_key=key,
+                )
+                for (product_id, category), values in wanted.items()
+                for key, value in values.items()
+                if (product_id, category, key) not in seen
+            ]
+        )
+
+    def sync_gallery(self, records, products):
+        wanted = {
+            products[record["slug"]].pk: record["gallery"]
+            for record in records
+            if record.get("gallery") is not None
+        }
+        if not wanted:
+            return
+        current = ProductGallery.objects.filter(product_id__in=wanted)
+        stale, existing = [], set()
+        for image in current:
+            if image.image.name in wanted[image.product_id]:
+                existing.add((image.product_id, image.image.name))
+            else:
+                stale.append(image.pk)
+        ProductGallery.objects.filter(pk__in=stale).delete()
+        ProductGallery.objects.bulk_create(
+            [
+                ProductGallery(product_id=product_id, image=name)
+                for product_id, names in wanted.items()
+                for name in names
+                if (product_id, name) not in existing
+            ]
+        )
+
+    def refresh_derived_data(self, product_ids):
+        bump_variation_versions(product_ids)
+        get_search_backend().index_products(
+            Product.objects.filter(pk__in=product_ids).select_related("category")
+        )
+        index_product_facets(product_ids)
@@ -2,3 +2,104 @@ VARIATION_CATEGORY_CHOICES = (
     ("color", "color"),
     ("size", "size"),
 )
+
+HOME_FEED_CACHE_KEY = "store:home_feed"
+HOME_FEED_SECTION_SIZE = 8
+HOME_FEED_TIMEOUT = 60 * 15
+
+STORE_PRODUCTS_PER_PAGE = 3
+
+DEFAULT_SEARCH_BACKEND = "store.search.backends.inverted_index.InvertedIndexBackend"
+SEARCH_INDEX_BATCH_SIZE = 500
+# Search matches checked against the facet filters per query
+SEARCH_FILTER_BATCH_SIZE = 500
+SEARCH_STATS_CACHE_KEY = "store:search_stats"
+# Bounds of one inverted index search: the rarest query terms scored, the
+# highest-frequency postings read per query term, and the number of ranked
+# ids returned
+SEARCH_MAX_QUERY_TERMS = 8
+SEARCH_MAX_POSTINGS_PER_TERM = 5000
+SEARCH_MAX_RESULTS = 1000
+
+# Relative weight of each indexed field when scoring a match
+SEARCH_FIELD_WEIGHTS = {
+    "product_name": 3.0,
+    "category": 2.0,
+    "product_description": 1.0,
+}
+
+# Catalog listing sort options: name -> (label, ordering). The last column of
+# every ordering is unique so it can be used as a keyset pagination cursor.
+LISTING_SORTS = {
+    "id": ("Featured", ("id",)),
+    "-date_created": ("Newest", ("-date_created", "-id")),
+    "price": ("Price: low to high", ("price", "id")),
+    "-price": ("Price: high to low", ("-price", "-id")),
+}
+DEFAULT_LISTING_SORT = "id"
+# Listings count at most this many matches, anything above is shown as "N+"
+LISTING_COUNT_CAP = 1000
+
+# Facets shoppers can filter listings by, in display order
+FACETS = (
+    ("price", "Price range"),
+    ("color", "Colors"),
+    ("size", "Sizes"),
+    ("rating", "Customer rating"),
+)
+# (lower bound, upper bound) of each price facet value, None means unbounded
+PRICE_BANDS = ((0, 50), (50, 100), (100, 200), (200, 500), (500, 1000), (1000, None))
+RATING_THRESHOLDS = (4, 3, 2, 1)
+
+REVIEW_SORTS = {
+    "newest": ("Newest", ("-updated_at", "-id")),
+    "highest": ("Highest rated", ("-rating", "-updated_at", "-id")),
+    "lowest": ("Lowest rated", ("rating", "-updated_at", "-id")),
+}
+DEFAULT_REVIEW_SORT = "newest"
+REVIEWS_PER_PAGE = 10
+
+CATALOG_VERSION_KEY = "store:catalog_version"
+PAGE_CACHE_TIMEOUT = 60 * 5
+
+# Fixed-width image renditions generated for product and gallery images:
+# name -> (width in px, the "sizes" attribute used when rendering it)
+IMAGE_RENDITIONS = {
+    "thumb": (160, "80px"),
+    "card": (400, "(max-width: 576px) 100vw, 300px"),
+    "detail": (800, "(max-width: 768px) 100vw, 50vw"),
+}
+# Output formats in order of preference: format -> (Pillow format, extension)
+IMAGE_RENDITION_FORMATS = {
+    "webp": ("WEBP", "webp"),
+    "jpeg": ("JPEG", "jpg"),
+}
+IMAGE_RENDITION_QUALITY = 82
+IMAGE_RENDITION_DIRECTORY = "renditions"
+IMAGE_RENDITION_WORKERS = 2
+
+CATALOG_IMPORT_BATCH_SIZE = 1000
+CATALOG_IMAGE_WORKERS = 8
+CATALOG_LIST_SEPARATOR = "|"
+
+# Frequently bought together: products kept per product, and the minimum
+# number of shared orders before a pair is recommended
+RECOMMENDATIONS_PER_PRODUCT = 6
+RECOMMENDATION_MIN_ORDERS = 1
+RECOMMENDATION_BATCH_SIZE = 500
+
+TYPEAHEAD_RESULTS = 8
+# Prefixes up to this length have their results precomputed, longer ones are
+# looked up with a bisect over the sorted keys
+TYPEAHEAD_PRECOMPUTED_PREFIX = 2
+TYPEAHEAD_MAX_QUERIES = 1000
+TYPEAHEAD_MIN_QUERY_COUNT = 2
+# Popular queries change without a catalog version bump, so snapshots are
+# also rebuilt after this many seconds
+TYPEAHEAD_MAX_AGE = 60 * 10
+# Search query counts are buffered per process and written in one batch
+# after this many searches or seconds
+TYPEAHEAD_QUERY_FLUSH_SIZE = 100
+TYPEAHEAD_QUERY_FLUSH_INTERVAL = 60
+
+VARIATION_MAP_TIMEOUT = 60 * 60
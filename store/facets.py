@@ -0,0 +1,285 @@
+from collections import Counter, defaultdict
+from urllib.parse import urlencode
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Prefetch
+
+from .config import FACETS, PRICE_BANDS, RATING_THRESHOLDS
+from .models import FacetCount, Product, ProductFacet, Variation
+
+# Facets accepted as listing filters; category is filtered through the URL on
+# category pages but can be combined on the all-products page as well.
+FILTER_FACETS = ("category",) + tuple(facet for facet, title in FACETS)
+
+COUNT_BATCH_SIZE = 500
+
+
+def price_band(price):
+    for low, high in PRICE_BANDS:
+        if high is None or price < high:
+            return f"{low}-{high}" if high is not None else f"{low}+"
+    return None
+
+
+def price_band_label(value):
+    low, sep, high = value.partition("-")
+    return f"${low} - ${high}" if high else f"${low.rstrip('+')}+"
+
+
+def product_facets(product):
+    """
+    Returns the {(facet, value): label} postings of a product. The product
+    must come with its category and active variations (``active_variations``)
+    preloaded.
+    """
+    if not product.is_available:
+        return {}
+
+    postings = {
+        ("category", product.category.slug): product.category.category_name,
+    }
+    band = price_band(product.price)
+    postings[("price", band)] = price_band_label(band)
+    for variation in product.active_variations:
+        value = variation.variation_value.strip().lower()
+        if value:
+            postings[(variation.variation_category, value[:100])] = value.capitalize()
+    average = product.get_average_rating()
+    for threshold in RATING_THRESHOLDS:
+        if average >= threshold:
+            postings[("rating", str(threshold))] = f"{threshold}+ stars"
+    return postings
+
+
+def _products_with_variations(queryset):
+    return queryset.select_related("category").prefetch_related(
+        Prefetch(
+            "variation_set",
+            queryset=Variation.objects.filter(is_active=True),
+            to_attr="active_variations",
+        )
+    )
+
+
+def _adjust_counts(deltas, labels):
+    for (facet, value), delta in deltas.items():
+        if not delta:
+            continue
+        updated = FacetCount.objects.filter(facet=facet, value=value).update(
+            count=F("count") + delta
+        )
+        if not updated:
+            try:
+                with transaction.atomic():
+                    FacetCount.objects.create(
+                        facet=facet,
+                        value=value,
+                        label=labels[(facet, value)],
+                        count=delta,
+                    )
+            except IntegrityError:
+                FacetCount.objects.filter(facet=facet, value=value).update(
+                    count=F("count") + delta
+                )
+
+
+def index_product_facets(product_ids):
+    """
+    Brings the facet postings and counts of the given products up to date,
+    touching only the postings that actually changed.
+    """
+    products = _products_with_variations(Product.objects.filter(pk__in=product_ids))
+    wanted = {product.pk: product_facets(product) for product in products}
+
+    current = defaultdict(set)
+    for product_id, facet, value in ProductFacet.objects.filter(
+        product_id__in=product_ids
+    ).values_list("product_id", "facet", "value"):
+        current[product_id].add((facet, value))
+
+    deltas, labels = Counter(), {}
+    added, removed = [], []
+    for product_id in product_ids:
+        new = wanted.get(product_id, {})
+        old = current[product_id]
+        labels.update(new)
+        for key in new.keys() - old:
+            added.append(
+                ProductFacet(facet=key[0], value=key[1], product_id=product_id)
+            )
+            deltas[key] += 1
+        for key in old - new.keys():
+            removed.append((product_id, key))
+            deltas[key] -= 1
+
+    if not deltas:
+        return
+
+    with transaction.atomic():
+        for product_id, (facet, value) in removed:
+            ProductFacet.objects.filter(
+                product_id=product_id, facet=facet, value=value
+            ).delete()
+        ProductFacet.objects.bulk_create(added, ignore_conflicts=True)
+        _adjust_counts(deltas, labels)
+
+
+def remove_product_facets(product_id):
+    postings = ProductFacet.objects.filter(product_id=product_id)
+    deltas = Counter({key: -1 for key in postings.values_list("facet", "value")})
+    with transaction.atomic():
+        postings.delete()
+        _adjust_counts(deltas, {})
+
+
+def rebuild_facet_index():
+    """
+    Recomputes every posting and count from the catalog. Returns the number
+    of postings written.
+    """
+    postings, counts, labels = [], Counter(), {}
+    products = _products_with_variations(Product.objects.filter(is_available=True))
+    for product in products.iterator(chunk_size=COUNT_BATCH_SIZE):
+        for key, label in product_facets(product).items():
+            postings.append(ProductFacet(facet=key[0], value=key[1], product=product))
+            counts[key] += 1
+            labels[key] = label
+
+    with transaction.atomic():
+        ProductFacet.objects.all().delete()
+        FacetCount.objects.all().delete()
+        ProductFacet.objects.bulk_create(postings, batch_size=COUNT_BATCH_SIZE)
+        FacetCount.objects.bulk_create(
+            [
+                FacetCount(
+                    facet=facet, value=value, label=labels[(facet, value)], count=n
+                )
+                for (facet, value), n in counts.items()
+            ],
+            batch_size=COUNT_BATCH_SIZE,
+        )
+    return len(postings)
+
+
+def parse_filters(params):
+    """
+    Reads the facet filters of a request's GET parameters into
+    {facet: [values]}, keeping only known facets.
+    """
+    filters = {}
+    for facet in FILTER_FACETS:
+        values = [value for value in params.getlist(facet) if value]
+        if values:
+            filters[facet] = sorted(set(values))
+    return filters
+
+
+def filter_query(filters):
+    return urlencode([(f, v) for f, values in filters.items() for v in values])
+
+
+def filter_products(queryset, filters):
+    """
+    Restricts a product queryset to the facet filters: values of one facet
+    are OR-ed, different facets are AND-ed, each through the posting index.
+    """
+    for facet, values in filters.items():
+        queryset = queryset.filter(
+            pk__in=ProductFacet.objects.filter(facet=facet, value__in=values).values(
+                "product_id"
+            )
+        )
+    return queryset
+
+
+def _count_postings(postings, queryset, product_ids, filters):
+    """
+    Counts ``postings`` per (facet, value) over the products of ``queryset``
+    (or ``product_ids``, in batches) that match ``filters``.
+    """
+    postings = postings.values("facet", "value").annotate(n=Count("id"))
+    if queryset is not None:
+        products = filter_products(queryset, filters)
+        batches = [postings.filter(product_id__in=products.values("pk"))]
+    else:
+        batches = []
+        for i in range(0, len(product_ids), COUNT_BATCH_SIZE):
+            batch = product_ids[i : i + COUNT_BATCH_SIZE]
+            if filters:
+                products = filter_products(
+                    Product.objects.filter(pk__in=batch), filters
+                )
+                batch = products.values("pk")
+            batches.append(postings.filter(product_id__in=batch))
+
+    counts = Counter()
+    for batch in batches:
+        for row in batch.order_by():
+            counts[(row["facet"], row["value"])] += row["n"]
+    return counts
+
+
+def facet_counts(queryset=None, product_ids=None, filters=None):
+    """
+    Returns [(facet, title, [{value, label, count, selected}])] for the
+    sidebar, ``selected`` reflecting the active ``filters``.
+
+    Without a restriction the precomputed FacetCount table is read. Given
+    the unfiltered ``queryset`` (or explicit ``product_ids``, e.g. search
+    results) the postings of just those products are grouped instead. Each
+    facet is counted over the products matching the filters of the other
+    facets, so the other values of a facet with a selection stay listed and
+    can be added to it.
+    """
+    filters = filters or {}
+    rows = FacetCount.objects.filter(count__gt=0).values_list(
+        "facet", "value", "label", "count"
+    )
+    labels = {(facet, value): label for facet, value, label, count in rows}
+    if queryset is None and product_ids is None and not filters:
+        counts = {(facet, value): count for facet, value, label, count in rows}
+    else:
+        if product_ids is not None:
+            product_ids = list(product_ids)
+        elif queryset is None:
+            queryset = Product.objects.filter(is_available=True)
+        # Facets without a selection all count over the fully filtered
+        # products; each selected facet ignores its own selection
+        counts = _count_postings(
+            ProductFacet.objects.exclude(facet__in=filters),
+            queryset,
+            product_ids,
+            filters,
+        )
+        for facet in filters:
+            others = {
+                other: values for other, values in filters.items() if other != facet
+            }
+            counts.update(
+                _count_postings(
+                    ProductFacet.objects.filter(facet=facet),
+                    queryset,
+                    product_ids,
+                    others,
+                )
+            )
+
+    grouped = defaultdict(list)
+    for (facet, value), count in counts.items():
+        if count > 0:
+            grouped[facet].append(
+                {
+                    "value": value,
+                    "label": labels.get((facet, value), value),
+                    "count": count,
+                    "selected": value in filters.get(facet, ()),
+                }
+            )
+    for facet, values in grouped.items():
+        if facet == "price":
+            values.sort(key=lambda item: int(item["value"].rstrip("+").split("-")[0]))
+        elif facet == "rating":
+            values.sort(key=lambda item: item["value"], reverse=True)
+        else:
+            values.sort(key=lambda item: item["label"])
+    return [(facet, title, grouped[facet]) for facet, title in FACETS]
@@ -0,0 +1,70 @@
+from django.core.cache import cache
+from django.db.models import F, FloatField, Q, Sum
+from django.db.models.functions import Cast
+
+from .config import HOME_FEED_CACHE_KEY, HOME_FEED_SECTION_SIZE, HOME_FEED_TIMEOUT
+from .images import image_sources
+from .models import Product
+
+
+def product_card(product):
+    """
+    Flattens a product into the plain data a product card needs, so cached
+    cards can be rendered without touching the ORM.
+    """
+    return {
+        "id": product.id,
+        "name": product.product_name,
+        "url": product.get_url(),
+        "image": image_sources(product.image, product.image_renditions, "card"),
+        "price": product.price,
+        "average_rating": product.get_average_rating(),
+        "review_count": product.count_review(),
+    }
+
+
+def build_home_feed(size=HOME_FEED_SECTION_SIZE):
+    available = Product.objects.filter(is_available=True).select_related("category")
+
+    newest = available.order_by("-date_created")[:size]
+    top_rated = (
+        available.filter(rating_count__gt=0)
+        .annotate(average=F("rating_sum") / Cast("rating_count", FloatField()))
+        .order_by("-average", "-rating_count", "-id")[:size]
+    )
+    best_selling = (
+        available.annotate(
+            units_sold=Sum(
+                "orderproduct__quantity", filter=Q(orderproduct__ordered=True)
+            )
+        )
+        .filter(units_sold__gt=0)
+        .order_by("-units_sold", "-id")[:size]
+    )
+
+    sections = [
+        ("newest", "New arrivals", newest),
+        ("top_rated", "Top rated", top_rated),
+        ("best_selling", "Best sellers", best_selling),
+    ]
+    return [
+        {"key": key, "title": title, "cards": [product_card(p) for p in products]}
+        for key, title, products in sections
+    ]
+
+
+def refresh_home_feed():
+    feed = build_home_feed()
+    cache.set(HOME_FEED_CACHE_KEY, feed, HOME_FEED_TIMEOUT)
+    return feed
+
+
+def get_home_feed():
+    feed = cache.get(HOME_FEED_CACHE_KEY)
+    if feed is None:
+        feed = refresh_home_feed()
+    return feed
+
+
+def invalidate_home_feed():
+    cache.delete(HOME_FEED_CACHE_KEY)
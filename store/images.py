@@ -0,0 +1,168 @@
+import logging
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps
+
+from .config import (
+    IMAGE_RENDITION_DIRECTORY,
+    IMAGE_RENDITION_FORMATS,
+    IMAGE_RENDITION_QUALITY,
+    IMAGE_RENDITION_WORKERS,
+    IMAGE_RENDITIONS,
+)
+from .page_cache import bump_catalog_version
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def rendition_name(name, rendition, fmt):
+    """
+    Storage path of one rendition, next to the original image:
+    photos/products/shirt.jpg -> photos/products/renditions/shirt.jpg-card.webp
+    The original's extension is kept, so shirt.png gets renditions of its own.
+    """
+    directory, filename = posixpath.split(name)
+    extension = IMAGE_RENDITION_FORMATS[fmt][1]
+    return posixpath.join(
+        directory, IMAGE_RENDITION_DIRECTORY, f"{filename}-{rendition}.{extension}"
+    )
+
+
+def encode(image, fmt):
+    pil_format = IMAGE_RENDITION_FORMATS[fmt][0]
+    buffer = BytesIO()
+    image.save(buffer, pil_format, quality=IMAGE_RENDITION_QUALITY, optimize=True)
+    return buffer.getvalue()
+
+
+def generate_renditions(field_file):
+    """
+    Writes every configured rendition of an image file in every output format
+    and returns the description stored in ``image_renditions``. Images are
+    never upscaled, so a small original yields renditions of its own width.
+    """
+    storage = field_file.storage
+    with field_file.open("rb") as source:
+        original = ImageOps.exif_transpose(Image.open(source))
+        original = original.convert("RGB")
+
+    renditions = {"source": field_file.name}
+    for rendition, (width, _) in IMAGE_RENDITIONS.items():
+        image = original.copy()
+        image.thumbnail((width, width * 4), Image.LANCZOS)
+        entry = {"width": image.width}
+        for fmt in IMAGE_RENDITION_FORMATS:
+            name = rendition_name(field_file.name, rendition, fmt)
+            if storage.exists(name):
+                storage.delete(name)
+            entry[fmt] = storage.save(name, ContentFile(encode(image, fmt)))
+        renditions[rendition] = entry
+    return renditions
+
+
+def render_image_renditions(model_label, pk):
+    """
+    Generates the renditions of one Product or ProductGallery image and stores
+    them on the row, unless the image was replaced in the meantime. Returns
+    True on success; runs in the background worker and the backfill pool.
+    """
+    model = apps.get_model(model_label)
+    instance = model.objects.filter(pk=pk).only("image").first()
+    if instance is None or not instance.image:
+        return False
+    try:
+        renditions = generate_renditions(instance.image)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        logger.warning("Cannot render %s %s (%s)", model_label, pk, instance.image)
+        return False
+    updated = model.objects.filter(pk=pk, image=instance.image.name).update(
+        image_renditions=renditions
+    )
+    if updated:
+        # The update sends no signals, so expire the cached pages and feed
+        # cards still pointing at the original image here (store.feed
+        # imports this module, hence the late import)
+        from .feed import invalidate_home_feed
+
+        transaction.on_commit(bump_catalog_version)
+        transaction.on_commit(invalidate_home_feed)
+    return True
+
+
+def needs_renditions(instance):
+    return bool(instance.image) and (
+        instance.image_renditions.get("source") != instance.image.name
+    )
+
+
+def _run_in_background(model_label, pk):
+    try:
+        render_image_renditions(model_label, pk)
+    finally:
+        close_old_connections()
+
+
+def schedule_renditions(instance):
+    """
+    Queues rendition generation for an instance once the current transaction
+    commits. Renditions are generated in a background thread unless
+    IMAGE_RENDITIONS_ASYNC is turned off.
+    """
+    model_label = instance._meta.label
+    pk = instance.pk
+
+    def submit():
+        global _executor
+        if not getattr(settings, "IMAGE_RENDITIONS_ASYNC", True):
+            render_image_renditions(model_label, pk)
+            return
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=IMAGE_RENDITION_WORKERS, thread_name_prefix="renditions"
+            )
+        _executor.submit(_run_in_background, model_label, pk)
+
+    transaction.on_commit(submit)
+
+
+def image_sources(field_file, renditions, rendition):
+    """
+    Returns {"src", "srcset", "webp_srcset", "sizes"} for rendering an image
+    at the given rendition. ``srcset`` lists every stored width up to the
+    requested one so browsers can pick a smaller copy; without renditions the
+    original file is used as is.
+    """
+    width, sizes = IMAGE_RENDITIONS[rendition]
+    storage = field_file.storage
+    source = field_file.name
+    if not renditions or renditions.get("source") != source:
+        return {"src": field_file.url if source else "", "sizes": ""}
+
+    candidates = [
+        renditions[name]
+        for name, (candidate_width, _) in IMAGE_RENDITIONS.items()
+        if name in renditions and candidate_width <= width
+    ]
+
+    def srcset(fmt):
+        seen, items = set(), []
+        for entry in candidates:
+            if entry["width"] not in seen:
+                seen.add(entry["width"])
+                items.append(f"{storage.url(entry[fmt])} {entry['width']}w")
+        return ", ".join(items)
+
+    return {
+        "src": storage.url(renditions[rendition]["jpeg"]),
+        "srcset": srcset("jpeg"),
+        "webp_srcset": srcset("webp"),
+        "sizes": sizes,
+    }
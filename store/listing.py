@@ -0,0 +1,142 @@
+from dataclasses import dataclass
+
+from django.core import signing
+from django.db.models import Q
+
+from .config import (
+    DEFAULT_LISTING_SORT,
+    LISTING_COUNT_CAP,
+    LISTING_SORTS,
+    STORE_PRODUCTS_PER_PAGE,
+)
+
+CURSOR_SALT = "store.listing.cursor"
+
+
+@dataclass(frozen=True)
+class ListingPage:
+    items: list
+    sort: str
+    next_token: str | None
+    prev_token: str | None
+    estimated_total: int | None = None
+    total_is_capped: bool = False
+
+    @property
+    def has_next(self):
+        return self.next_token is not None
+
+    @property
+    def has_previous(self):
+        return self.prev_token is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def resolve_sort(sort, sorts=LISTING_SORTS, default=DEFAULT_LISTING_SORT):
+    return sort if sort in sorts else default
+
+
+def encode_cursor(obj, ordering, sort, direction):
+    values = [str(getattr(obj, field.lstrip("-"))) for field in ordering]
+    return signing.dumps([sort, direction, values], salt=CURSOR_SALT, compress=True)
+
+
+def decode_cursor(token, model, ordering, sort):
+    """
+    Returns (direction, values) of a cursor token, or None if the token is
+    missing, tampered with or was issued for another sort order.
+    """
+    if not token:
+        return None
+    try:
+        token_sort, direction, raw_values = signing.loads(token, salt=CURSOR_SALT)
+    except (signing.BadSignature, TypeError, ValueError):
+        return None
+    if token_sort != sort or direction not in ("next", "prev"):
+        return None
+    if len(raw_values) != len(ordering):
+        return None
+    try:
+        values = [
+            model._meta.get_field(field.lstrip("-")).to_python(value)
+            for field, value in zip(ordering, raw_values)
+        ]
+    except Exception:
+        return None
+    return direction, values
+
+
+def after(ordering, values):
+    """
+    Builds the keyset condition selecting the rows strictly after ``values``
+    in ``ordering``, e.g. (price > p) OR (price = p AND id > i).
+    """
+    condition = Q()
+    for position in range(len(ordering) - 1, -1, -1):
+        field = ordering[position]
+        name = field.lstrip("-")
+        lookup = "lt" if field.startswith("-") else "gt"
+        step = Q(**{f"{name}__{lookup}": values[position]})
+        if position < len(ordering) - 1:
+            step |= Q(**{name: values[position]}) & condition
+        condition = step
+    return condition
+
+
+def reverse_ordering(ordering):
+    return tuple(
+        field[1:] if field.startswith("-") else f"-{field}" for field in ordering
+    )
+
+
+def paginate(
+    queryset,
+    sort=None,
+    token=None,
+    per_page=STORE_PRODUCTS_PER_PAGE,
+    sorts=LISTING_SORTS,
+    default_sort=DEFAULT_LISTING_SORT,
+    count=False,
+):
+    """
+    Keyset paginates ``queryset``. Every page costs one indexed range query
+    of ``per_page + 1`` rows, however deep the page is; ``count`` adds one
+    capped COUNT for an estimated total.
+    """
+    sort = resolve_sort(sort, sorts, default_sort)
+    ordering = sorts[sort][1]
+    cursor = decode_cursor(token, queryset.model, ordering, sort)
+    backwards = cursor is not None and cursor[0] == "prev"
+
+    page_ordering = reverse_ordering(ordering) if backwards else ordering
+    rows = queryset.order_by(*page_ordering)
+    if cursor is not None:
+        rows = rows.filter(after(page_ordering, cursor[1]))
+    rows = list(rows[: per_page + 1])
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+
+    if backwards:
+        rows.reverse()
+        has_previous, has_next = has_more, True
+    else:
+        has_previous, has_next = cursor is not None, has_more
+
+    next_token = prev_token = None
+    if rows and has_next:
+        next_token = encode_cursor(rows[-1], ordering, sort, "next")
+    if rows and has_previous:
+        prev_token = encode_cursor(rows[0], ordering, sort, "prev")
+
+    estimated_total, capped = None, False
+    if count:
+        estimated_total = queryset.order_by()[: LISTING_COUNT_CAP + 1].count()
+        capped = estimated_total > LISTING_COUNT_CAP
+        estimated_total = min(estimated_total, LISTING_COUNT_CAP)
+
+    return ListingPage(rows, sort, next_token, prev_token, estimated_total, capped)
@@ -0,0 +1,106 @@
+from dataclasses import dataclass
+
+from django.db.models import Exists, OuterRef, Prefetch, Value
+from django.shortcuts import get_object_or_404
+
+from carts.stores import get_cart_store
+from orders.models import OrderProduct
+
+from .config import DEFAULT_REVIEW_SORT, REVIEW_SORTS, REVIEWS_PER_PAGE
+from .listing import ListingPage, paginate
+from .models import Product, ProductGallery, ReviewRating, Variation
+from .recommendations import recommendations_for
+
+
+def load_reviews(product_id, sort=None, token=None, per_page=REVIEWS_PER_PAGE):
+    """
+    Returns one keyset page of a product's active reviews, with each
+    reviewer joined into the same query.
+    """
+    reviews = ReviewRating.objects.filter(
+        product_id=product_id, status=True
+    ).select_related("user")
+    return paginate(
+        reviews,
+        sort=sort,
+        token=token,
+        per_page=per_page,
+        sorts=REVIEW_SORTS,
+        default_sort=DEFAULT_REVIEW_SORT,
+    )
+
+
+@dataclass(frozen=True)
+class ProductDetail:
+    """
+    Everything the product detail page renders, fully loaded up front so the
+    template cannot trigger further queries.
+    """
+
+    product: Product
+    category: object
+    colors: tuple
+    sizes: tuple
+    gallery: tuple
+    reviews: ListingPage
+    recommendations: tuple
+    in_cart: bool
+    order_product: bool
+
+
+class ProductDetailLoader:
+    """
+    Loads a product page in a fixed number of queries: the product with its
+    category and cart/purchase flags, one prefetch each for variations and
+    gallery images, the first page of reviews (with their authors) and the
+    precomputed "frequently bought together" products.
+    """
+
+    def __init__(self, request):
+        self.request = request
+
+    def queryset(self):
+        user = self.request.user
+        if user.is_authenticated:
+            purchased = Exists(
+                OrderProduct.objects.filter(user=user, product=OuterRef("pk"))
+            )
+        else:
+            purchased = Value(False)
+
+        return (
+            Product.objects.select_related("category")
+            .annotate(
+                in_cart=get_cart_store(self.request).in_cart(),
+                purchased=purchased,
+            )
+            .prefetch_related(
+                Prefetch(
+                    "variation_set",
+                    queryset=Variation.objects.filter(is_active=True).order_by("id"),
+                    to_attr="active_variations",
+                ),
+                Prefetch(
+                    "productgallery_set",
+                    queryset=ProductGallery.objects.order_by("id"),
+                    to_attr="gallery",
+                ),
+            )
+        )
+
+    def load(self, category_slug, product_slug, review_sort=None):
+        product = get_object_or_404(
+            self.queryset(), slug=product_slug, category__slug=category_slug
+        )
+        variations = product.active_variations
+        return ProductDetail(
+            product=product,
+            category=product.category,
+            colors=tuple(v for v in variations if v.variation_category == "color"),
+            sizes=tuple(v for v in variations if v.variation_category == "size"),
+            gallery=tuple(product.gallery),
+            reviews=load_reviews(product.pk, sort=review_sort),
+            recommendations=tuple(recommendations_for([product.pk])),
+            in_cart=product.in_cart,
+            order_product=product.purchased,
+        )
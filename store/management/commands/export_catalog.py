@@ -0,0 +1,40 @@
+import sys
+import time
+from contextlib import nullcontext
+
+from django.core.management.base import BaseCommand
+
+from store.catalog_io import export_records, write_records
+from store.config import CATALOG_IMPORT_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = "Export the catalog as CSV or JSONL, in the import_catalog format."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="File to write, or - for stdout.")
+        parser.add_argument("--format", choices=("csv", "jsonl"))
+        parser.add_argument("--batch-size", type=int, default=CATALOG_IMPORT_BATCH_SIZE)
+
+    def handle(self, *args, path, format, batch_size, **options):
+        fmt = format or ("csv" if path.endswith(".csv") else "jsonl")
+        started = time.monotonic()
+        rows = 0
+
+        def counted(records):
+            nonlocal rows
+            for rows, record in enumerate(records, 1):
+                yield record
+
+        # Only a file opened here is closed afterwards, never stdout
+        opened = nullcontext(sys.stdout) if path == "-" else open(path, "w", newline="")
+        with opened as stream:
+            write_records(stream, fmt, counted(export_records(batch_size)))
+
+        elapsed = time.monotonic() - started
+        rate = rows / elapsed if elapsed else 0
+        self.stderr.write(
+            self.style.SUCCESS(
+                f"Exported {rows} rows in {elapsed:.2f}s, {rate:.0f} rows/s."
+            )
+        )
@@ -0,0 +1,56 @@
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from store.config import IMAGE_RENDITION_WORKERS
+from store.images import needs_renditions, render_image_renditions
+from store.models import Product, ProductGallery
+
+
+class Command(BaseCommand):
+    help = "Generate the missing image renditions of products and gallery images."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=IMAGE_RENDITION_WORKERS,
+            help="Number of worker processes (image resizing is CPU bound).",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Regenerate renditions that are already up to date.",
+        )
+
+    def pending(self, force):
+        for model in (Product, ProductGallery):
+            images = model.objects.exclude(image="").only("image", "image_renditions")
+            for instance in images.iterator(chunk_size=500):
+                if force or needs_renditions(instance):
+                    yield model._meta.label, instance.pk
+
+    def handle(self, *args, workers, force, **options):
+        started = time.monotonic()
+        jobs = list(self.pending(force))
+        # Worker processes open their own database connections
+        connections.close_all()
+
+        done = failed = 0
+        with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as pool:
+            futures = [pool.submit(render_image_renditions, *job) for job in jobs]
+            for future in as_completed(futures):
+                if future.result():
+                    done += 1
+                else:
+                    failed += 1
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Rendered {done} images in {elapsed:.2f}s ({failed} failed)."
+            )
+        )
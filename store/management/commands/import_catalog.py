@@ -0,0 +1,60 @@
+import sys
+from contextlib import nullcontext
+
+from django.core.management.base import BaseCommand, CommandError
+
+from store.catalog_io import CatalogImporter, read_records
+from store.config import CATALOG_IMAGE_WORKERS, CATALOG_IMPORT_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = (
+        "Create or update categories, products, variations and gallery images "
+        "from a CSV or JSONL file, one product per row."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="File to import, or - for stdin.")
+        parser.add_argument("--format", choices=("csv", "jsonl"))
+        parser.add_argument(
+            "--images-dir",
+            help="Directory that relative image paths are resolved against.",
+        )
+        parser.add_argument("--batch-size", type=int, default=CATALOG_IMPORT_BATCH_SIZE)
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=CATALOG_IMAGE_WORKERS,
+            help="Number of threads copying image files.",
+        )
+
+    def handle(self, *args, path, format, images_dir, batch_size, workers, **options):
+        fmt = format or ("csv" if path.endswith(".csv") else "jsonl")
+        importer = CatalogImporter(
+            images_dir=images_dir, batch_size=batch_size, workers=workers
+        )
+        # Only a file opened here is closed afterwards, never stdin
+        if path == "-":
+            opened = nullcontext(sys.stdin)
+        else:
+            opened = open(path, newline="", encoding="utf-8")
+        try:
+            with opened as stream:
+                stats = importer.run(read_records(stream, fmt))
+        except ValueError as error:
+            # CatalogError, or a line that isn't valid JSON
+            raise CommandError(
+                f"{error} ({importer.stats.rows} rows imported before the error)"
+            )
+
+        for name in stats.missing_images:
+            self.stderr.write(f"Image not found: {name}")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {stats.rows} rows ({stats.created} created, "
+                f"{stats.updated} updated, {stats.images} images copied) in "
+                f"{stats.elapsed:.2f}s, {stats.rows_per_second:.0f} rows/s."
+            )
+        )
+        if stats.images:
+            self.stdout.write("Run generate_image_renditions to render the new images.")
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from store.facets import rebuild_facet_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the catalog facet postings and facet counts from scratch."
+
+    def handle(self, *args, **options):
+        postings = rebuild_facet_index()
+        self.stdout.write(
+            self.style.SUCCESS(f"Rebuilt facet index ({postings} postings).")
+        )
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from store.ratings import rebuild_rating_stats
+
+
+class Command(BaseCommand):
+    help = "Recompute the stored rating average, count and histogram of every product."
+
+    def handle(self, *args, **options):
+        rated = rebuild_rating_stats()
+        self.stdout.write(
+            self.style.SUCCESS(f"Rebuilt rating stats ({rated} rated products).")
+        )
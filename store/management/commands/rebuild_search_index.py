@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from store.models import Product
+from store.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = "Rebuild the product search index from scratch."
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        started = time.monotonic()
+        products = Product.objects.select_related("category").order_by("id")
+        count = backend.rebuild(products.iterator(chunk_size=500))
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Indexed {count} products with {type(backend).__name__} "
+                f"in {elapsed:.2f}s."
+            )
+        )
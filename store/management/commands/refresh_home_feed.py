@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from store.feed import refresh_home_feed
+
+
+class Command(BaseCommand):
+    help = "Rebuild the cached home page feed sections."
+
+    def handle(self, *args, **options):
+        feed = refresh_home_feed()
+        for section in feed:
+            self.stdout.write(f"{section['key']}: {len(section['cards'])} products")
+        self.stdout.write(self.style.SUCCESS("Home feed refreshed."))
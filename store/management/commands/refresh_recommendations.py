@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from store.recommendations import refresh_recommendations
+
+
+class Command(BaseCommand):
+    help = (
+        "Count new orders into the co-purchase matrix and refresh the "
+        "frequently bought together recommendations they affect."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rebuild",
+            action="store_true",
+            help="Recount every placed order instead of only the new ones.",
+        )
+
+    def handle(self, *args, rebuild, **options):
+        started = time.monotonic()
+        orders, products = refresh_recommendations(rebuild=rebuild)
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Counted {orders} orders, refreshed {products} products "
+                f"in {elapsed:.2f}s."
+            )
+        )
@@ -0,0 +1,79 @@
+# Generated by Django 5.0.1 on 2026-10-18 08:27
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def backfill_rating_stats(apps, schema_editor):
+    Product = apps.get_model("store", "Product")
+    ReviewRating = apps.get_model("store", "ReviewRating")
+
+    rows = (
+        ReviewRating.objects.filter(status=True)
+        .values("product_id")
+        .annotate(
+            rating_count=Count("id"),
+            rating_sum=Sum("rating"),
+            rating_1_count=Count("id", filter=Q(rating__lt=2)),
+            rating_2_count=Count("id", filter=Q(rating__gte=2, rating__lt=3)),
+            rating_3_count=Count("id", filter=Q(rating__gte=3, rating__lt=4)),
+            rating_4_count=Count("id", filter=Q(rating__gte=4, rating__lt=5)),
+            rating_5_count=Count("id", filter=Q(rating__gte=5)),
+        )
+        .order_by()
+    )
+    for row in rows:
+        Product.objects.filter(pk=row.pop("product_id")).update(**row)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("store", "0005_productgallery"),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name="productgallery",
+            options={
+                "verbose_name": "productgallery",
+                "verbose_name_plural": "product gallery",
+            },
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="rating_1_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="rating_2_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="rating_3_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="rating_4_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="rating_5_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="rating_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="rating_sum",
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_rating_stats, migrations.RunPython.noop),
+    ]
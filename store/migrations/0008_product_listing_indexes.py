@@ -0,0 +1,49 @@
+# Generated by Django 5.0.1 on 2026-10-18 08:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("category", "0002_alter_category_slug"),
+        ("store", "0007_search_index"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                fields=["is_available", "price", "id"],
+                name="store_produ_is_avai_6898f1_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                fields=["is_available", "date_created", "id"],
+                name="store_produ_is_avai_7ebe6d_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                fields=["category", "is_available", "id"],
+                name="store_produ_categor_88d582_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                fields=["category", "is_available", "price", "id"],
+                name="store_produ_categor_9170be_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                fields=["category", "is_available", "date_created", "id"],
+                name="store_produ_categor_b7412e_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 5.0.1 on 2026-10-18 08:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("store", "0008_product_listing_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FacetCount",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("facet", models.CharField(max_length=20)),
+                ("value", models.CharField(max_length=100)),
+                ("label", models.CharField(max_length=100)),
+                ("count", models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="ProductFacet",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("facet", models.CharField(max_length=20)),
+                ("value", models.CharField(max_length=100)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="facetcount",
+            constraint=models.UniqueConstraint(
+                fields=("facet", "value"), name="unique_facet_count"
+            ),
+        ),
+        migrations.AddField(
+            model_name="productfacet",
+            name="product",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="+",
+                to="store.product",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="productfacet",
+            index=models.Index(
+                fields=["product", "facet"], name="store_produ_product_b6da97_idx"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="productfacet",
+            constraint=models.UniqueConstraint(
+                fields=("facet", "value", "product"), name="unique_product_facet"
+            ),
+        ),
+    ]
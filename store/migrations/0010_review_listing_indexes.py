@@ -0,0 +1,29 @@
+# Generated by Django 5.0.1 on 2026-10-18 08:33
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("store", "0009_facet_index"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="reviewrating",
+            index=models.Index(
+                fields=["product", "status", "updated_at", "id"],
+                name="store_revie_product_013e0f_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="reviewrating",
+            index=models.Index(
+                fields=["product", "status", "rating", "updated_at", "id"],
+                name="store_revie_product_cf3ca5_idx",
+            ),
+        ),
+    ]
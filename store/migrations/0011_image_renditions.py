@@ -0,0 +1,23 @@
+# Generated by Django 5.0.1 on 2026-10-18 08:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("store", "0010_review_listing_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="image_renditions",
+            field=models.JSONField(default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name="productgallery",
+            name="image_renditions",
+            field=models.JSONField(default=dict, editable=False),
+        ),
+    ]
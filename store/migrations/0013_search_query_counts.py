@@ -0,0 +1,29 @@
+# Generated by Django 5.0.1 on 2026-10-18 08:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("store", "0012_co_purchase_recommendations"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SearchQueryCount",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("query", models.CharField(max_length=100, unique=True)),
+                ("count", models.PositiveIntegerField(default=0)),
+            ],
+        ),
+    ]
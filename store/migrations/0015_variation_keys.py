@@ -0,0 +1,67 @@
+from django.db import migrations, models
+
+
+def backfill_variation_keys(apps, schema_editor):
+    """
+    Fills the normalized keys and merges variations that only differed in
+    case or surrounding spaces, moving cart and order references over to the
+    variation that is kept (the active one, else the oldest).
+    """
+    Variation = apps.get_model("store", "Variation")
+    CartItem = apps.get_model("carts", "CartItem")
+    OrderProduct = apps.get_model("orders", "OrderProduct")
+
+    kept, duplicates = {}, {}
+    for variation in Variation.objects.order_by("-is_active", "id"):
+        category_key = variation.variation_category.strip().lower()
+        value_key = variation.variation_value.strip().lower()
+        key = (variation.product_id, category_key, value_key)
+        if key in kept:
+            duplicates[variation.pk] = kept[key]
+            continue
+        kept[key] = variation.pk
+        Variation.objects.filter(pk=variation.pk).update(
+            category_key=category_key, value_key=value_key
+        )
+
+    for model, column in ((CartItem, "cartitem_id"), (OrderProduct, "orderproduct_id")):
+        through = model.variations.through
+        for old, new in duplicates.items():
+            for owner in through.objects.filter(variation_id=old).values_list(
+                column, flat=True
+            ):
+                through.objects.get_or_create(**{column: owner, "variation_id": new})
+            through.objects.filter(variation_id=old).delete()
+    Variation.objects.filter(pk__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("carts", "0006_cartitem_user_alter_cartitem_cart"),
+        ("orders", "0008_stock_reservations"),
+        ("store", "0014_product_stock_shards"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="variation",
+            name="category_key",
+            field=models.CharField(default="", editable=False, max_length=100),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="variation",
+            name="value_key",
+            field=models.CharField(default="", editable=False, max_length=100),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backfill_variation_keys, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="variation",
+            constraint=models.UniqueConstraint(
+                fields=("product", "category_key", "value_key"),
+                name="unique_variation",
+            ),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.0.1 on 2026-10-18 09:23
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("store", "0015_variation_keys"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="reviewrating",
+            index=models.Index(
+                fields=["product", "status", "rating", "-updated_at", "-id"],
+                name="store_revie_product_9a6999_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.1 on 2026-10-18 09:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("store", "0016_reviewrating_lowest_sort_index"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="searchposting",
+            index=models.Index(
+                fields=["term", "-frequency"], name="store_searc_term_32b3b6_idx"
+            ),
+        ),
+    ]
@@ -1,5 +1,7 @@
+import hashlib
 from decimal import Decimal
 
+from django.core.exceptions import ValidationError
 from django.db import models
 from django.urls import reverse
 
@@ -8,6 +10,20 @@ from category.models import Category
 
 from .config import VARIATION_CATEGORY_CHOICES
 
+# Rating aggregates are maintained by store.ratings with F() updates, so a
+# regular save() of a loaded product must never write its copy of them back.
+RATING_FIELDS = (
+    "rating_count",
+    "rating_sum",
+    "rating_1_count",
+    "rating_2_count",
+    "rating_3_count",
+    "rating_4_count",
+    "rating_5_count",
+)
+# Likewise maintained elsewhere and never written back by save()
+SAVE_EXCLUDED_FIELDS = RATING_FIELDS + ("stock_shards",)
+
 
 class Product(models.Model):
     product_name = models.CharField(max_length=200, unique=True)
@@ -23,6 +39,41 @@ class Product(models.Model):
     date_created = models.DateTimeField(auto_now_add=True)
     date_modified = models.DateTimeField(auto_now=True)
 
+    # Denormalized review statistics (active reviews only), see store.ratings
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.FloatField(default=0, editable=False)
+    rating_1_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_2_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_3_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_4_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_5_count = models.PositiveIntegerField(default=0, editable=False)
+
+    # Number of orders.StockShard rows holding this product's stock; 0 means
+    # the stock column itself is authoritative. See orders.inventory
+    stock_shards = models.PositiveSmallIntegerField(default=0, editable=False)
+
+    # Resized copies of the image, written by store.images
+    image_renditions = models.JSONField(default=dict, editable=False)
+
+    class Meta:
+        # Keyset pagination indexes for the listing sorts in store.config
+        indexes = [
+            models.Index(fields=["is_available", "price", "id"]),
+            models.Index(fields=["is_available", "date_created", "id"]),
+            models.Index(fields=["category", "is_available", "id"]),
+            models.Index(fields=["category", "is_available", "price", "id"]),
+            models.Index(fields=["category", "is_available", "date_created", "id"]),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in SAVE_EXCLUDED_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
     def get_url(self):
         return reverse("product_detail", args=[self.category.slug, self.slug])
 
@@ -30,22 +81,18 @@ class Product(models.Model):
         return self.product_name
 
     def get_average_rating(self):
-        result = ReviewRating.objects.filter(product=self, status=True).aggregate(
-            average_rating=models.Avg("rating")
-        )
-        average = 0
-        if result["average_rating"] is not None:
-            average = float(result["average_rating"])
-        return average
+        if not self.rating_count:
+            return 0
+        return self.rating_sum / self.rating_count
 
     def count_review(self):
-        result = ReviewRating.objects.filter(product=self, status=True).aggregate(
-            count=models.Count("id")
-        )
-        count = 0
-        if result["count"] is not None:
-            count = int(result["count"])
-        return count
+        return self.rating_count
+
+    def get_rating_histogram(self):
+        """
+        Returns the number of active reviews per star, from 5 stars down to 1.
+        """
+        return {star: getattr(self, f"rating_{star}_count") for star in range(5, 0, -1)}
 
 
 class VariationManager(models.Manager):
@@ -60,6 +107,23 @@ class VariationManager(models.Manager):
         )
 
 
+def variation_key(text):
+    return (text or "").strip().lower()
+
+
+def variation_signature(variations):
+    """
+    Canonical signature of a selection of variations (instances or ids): a
+    hash of the sorted ids, so cart and order lines holding the same
+    selection match on one indexed column.
+    """
+    ids = sorted({getattr(variation, "pk", variation) for variation in variations})
+    return hashlib.md5(",".join(map(str, ids)).encode()).hexdigest()
+
+
+EMPTY_VARIATION_SIGNATURE = variation_signature(())
+
+
 class Variation(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     variation_category = models.CharField(
@@ -69,8 +133,43 @@ class Variation(models.Model):
     is_active = models.BooleanField(default=True)
     date_created = models.DateTimeField(auto_now=True)
 
+    # Normalized copies of category and value, for exact indexed lookups of
+    # the case-insensitive (category, value) pairs a product offers
+    category_key = models.CharField(max_length=100, editable=False)
+    value_key = models.CharField(max_length=100, editable=False)
+
     objects = VariationManager()
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["product", "category_key", "value_key"],
+                name="unique_variation",
+            )
+        ]
+
+    def save(self, *args, **kwargs):
+        self.category_key = variation_key(self.variation_category)
+        self.value_key = variation_key(self.variation_value)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            kwargs["update_fields"] = {*update_fields, "category_key", "value_key"}
+        super().save(*args, **kwargs)
+
+    def clean(self):
+        # The unique constraint is on the non-editable keys, which form
+        # validation skips
+        super().clean()
+        duplicate = Variation.objects.filter(
+            product_id=self.product_id,
+            category_key=variation_key(self.variation_category),
+            value_key=variation_key(self.variation_value),
+        ).exclude(pk=self.pk)
+        if self.product_id is not None and duplicate.exists():
+            raise ValidationError(
+                {"variation_value": "The product already has this variation."}
+            )
+
     def __str__(self):
         return f"{self.product.product_name} - {self.variation_category} - {self.variation_value}"
 
@@ -86,6 +185,15 @@ class ReviewRating(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        # Keyset pagination indexes for the review sorts in store.config
+        indexes = [
+            models.Index(fields=["product", "status", "updated_at", "id"]),
+            models.Index(fields=["product", "status", "rating", "updated_at", "id"]),
+            # "lowest" sorts the rating up but its tie-breakers down
+            models.Index(fields=["product", "status", "rating", "-updated_at", "-id"]),
+        ]
+
     def __str__(self):
         return self.subject
 
@@ -93,6 +201,7 @@ class ReviewRating(models.Model):
 class ProductGallery(models.Model):
     product = models.ForeignKey(Product, default=None, on_delete=models.CASCADE)
     image = models.ImageField(upload_to="store/products", max_length=255)
+    image_renditions = models.JSONField(default=dict, editable=False)
 
     def __str__(self):
         return self.product.product_name
@@ -100,3 +209,138 @@ class ProductGallery(models.Model):
     class Meta:
         verbose_name = "productgallery"
         verbose_name_plural = "product gallery"
+
+
+class SearchDocument(models.Model):
+    """
+    Field-weighted length of a product's indexed text, used by the inverted
+    index search backend for BM25 length normalisation.
+    """
+
+    product = models.OneToOneField(
+        Product,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="search_document",
+    )
+    length = models.FloatField()
+
+
+class SearchPosting(models.Model):
+    """
+    One entry of the inverted index: a stemmed term and its field-weighted
+    frequency in a product.
+    """
+
+    term = models.CharField(max_length=100)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="+")
+    frequency = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["term", "product"], name="unique_search_posting"
+            )
+        ]
+        # Reads the most frequent postings of a term first, see
+        # InvertedIndexBackend.search
+        indexes = [models.Index(fields=["term", "-frequency"])]
+
+
+class ProductFacet(models.Model):
+    """
+    Facet index posting: an available product has ``value`` for ``facet``
+    (e.g. color=red). See store.facets.
+    """
+
+    facet = models.CharField(max_length=20)
+    value = models.CharField(max_length=100)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="+")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["facet", "value", "product"], name="unique_product_facet"
+            )
+        ]
+        indexes = [models.Index(fields=["product", "facet"])]
+
+
+class FacetCount(models.Model):
+    """
+    Number of available products per facet value, kept in step with
+    ProductFacet so unfiltered facet counts are a single small read.
+    """
+
+    facet = models.CharField(max_length=20)
+    value = models.CharField(max_length=100)
+    label = models.CharField(max_length=100)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["facet", "value"], name="unique_facet_count"
+            )
+        ]
+
+
+class CoPurchase(models.Model):
+    """
+    One non-zero cell of the sparse product x product co-purchase matrix:
+    the number of orders containing both products. Cells are stored in both
+    directions, and the diagonal (product == other) holds the number of
+    orders containing the product. See store.recommendations.
+    """
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="+")
+    other = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="+")
+    orders = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["product", "other"], name="unique_co_purchase"
+            )
+        ]
+
+
+class CoPurchaseOrder(models.Model):
+    """
+    Marks an order as counted into CoPurchase, so refreshes only read new
+    orders.
+    """
+
+    order = models.OneToOneField(
+        "orders.Order", on_delete=models.CASCADE, primary_key=True, related_name="+"
+    )
+
+
+class Recommendation(models.Model):
+    """
+    Precomputed "frequently bought together" list of a product, best first.
+    """
+
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name="recommendations"
+    )
+    recommended = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="+")
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["product", "rank"], name="unique_recommendation_rank"
+            )
+        ]
+
+
+class SearchQueryCount(models.Model):
+    """
+    How often a (normalized) search query that returned results was run,
+    used to suggest popular queries in the search typeahead.
+    """
+
+    query = models.CharField(max_length=100, unique=True)
+    count = models.PositiveIntegerField(default=0)
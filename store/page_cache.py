@@ -0,0 +1,125 @@
+import hashlib
+import re
+from functools import partial, wraps
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.contrib.messages.constants import DEFAULT_LEVELS
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.template.loader import render_to_string
+
+from abatua.versions import bump_version, get_version
+from carts.config import CART_ITEM_COUNT_PLACEHOLDER
+from carts.counter import get_cart_item_count
+
+from .config import CATALOG_VERSION_KEY, PAGE_CACHE_TIMEOUT
+
+ALERTS_PLACEHOLDER = "[[page-cache:alerts]]"
+CSRF_PLACEHOLDER = "[[page-cache:csrf-token]]"
+CSRF_INPUT_RE = re.compile(r'(name="csrfmiddlewaretoken" value=")[^"]*(")')
+
+
+def get_catalog_version():
+    return get_version(CATALOG_VERSION_KEY)
+
+
+def bump_catalog_version():
+    bump_version(CATALOG_VERSION_KEY)
+
+
+def has_session_cookie(request):
+    return settings.SESSION_COOKIE_NAME in request.COOKIES
+
+
+def is_anonymous(request, sessionless=False):
+    """
+    Visitors without a session cookie are anonymous without loading anything;
+    for everyone else the session has to be consulted.
+    """
+    if not has_session_cookie(request):
+        return True
+    return not sessionless and not request.user.is_authenticated
+
+
+def page_cache_key(request, params=()):
+    """
+    Keys a page by its path and the query parameters its view reads, sorted
+    by name, so other parameters (e.g. utm_source) or a different order
+    don't create new cache entries.
+    """
+    query = urlencode(
+        [
+            (name, value)
+            for name in sorted(params)
+            for value in request.GET.getlist(name)
+        ]
+    )
+    path = hashlib.md5(f"{request.path}?{query}".encode()).hexdigest()
+    return f"store:page:{get_catalog_version()}:{path}"
+
+
+def render_alerts(request):
+    storage = get_messages(request)
+    if not len(storage):
+        return ""
+    return render_to_string(
+        "includes/alerts.html",
+        {"messages": storage, "DEFAULT_MESSAGE_LEVELS": DEFAULT_LEVELS},
+    )
+
+
+def fill_holes(html, request):
+    """
+    Substitutes the per-visitor fragments of a cached page.
+    """
+    if CART_ITEM_COUNT_PLACEHOLDER in html:
+        # Without a session cookie the cart is empty; don't load a session
+        count = get_cart_item_count(request) if has_session_cookie(request) else 0
+        html = html.replace(CART_ITEM_COUNT_PLACEHOLDER, str(count))
+    if ALERTS_PLACEHOLDER in html:
+        html = html.replace(ALERTS_PLACEHOLDER, render_alerts(request))
+    if CSRF_PLACEHOLDER in html:
+        html = html.replace(CSRF_PLACEHOLDER, get_token(request))
+    return html
+
+
+def cache_anonymous_page(view=None, *, sessionless=False, params=()):
+    """
+    Caches the rendered HTML of a catalog page for anonymous GET requests,
+    keyed by path, catalog version and the query ``params`` the view reads.
+
+    The page is rendered once with placeholders for the cart badge, alerts
+    and CSRF tokens; every response (hit or miss) then fills those in for the
+    current visitor, so hits never run the view or its queries. Pages with
+    further per-visitor content (e.g. "in your cart") pass ``sessionless`` to
+    be cached only for visitors that have no session at all.
+    """
+    if view is None:
+        return partial(cache_anonymous_page, sessionless=sessionless, params=params)
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method != "GET" or not is_anonymous(request, sessionless):
+            return view(request, *args, **kwargs)
+
+        key = page_cache_key(request, params)
+        html = cache.get(key)
+        if html is None:
+            request.page_cache_capture = True
+            try:
+                response = view(request, *args, **kwargs)
+            finally:
+                request.page_cache_capture = False
+            if response.status_code != 200 or response.streaming:
+                return response
+            html = CSRF_INPUT_RE.sub(
+                rf"\g<1>{CSRF_PLACEHOLDER}\g<2>", response.content.decode()
+            )
+            cache.set(key, html, PAGE_CACHE_TIMEOUT)
+
+        return HttpResponse(fill_holes(html, request))
+
+    return wrapper
@@ -0,0 +1,80 @@
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+
+from .models import RATING_FIELDS, Product, ReviewRating
+
+REBUILD_BATCH_SIZE = 500
+
+
+def rating_star(rating):
+    """
+    Maps a rating (0.5 - 5 in half steps) onto the 1 - 5 star histogram.
+    """
+    return min(5, max(1, int(rating)))
+
+
+def apply_rating(product_id, rating, sign):
+    """
+    Adds (sign=1) or removes (sign=-1) a single active review from the stored
+    aggregates of a product in one atomic UPDATE.
+    """
+    star_field = f"rating_{rating_star(rating)}_count"
+    Product.objects.filter(pk=product_id).update(
+        rating_count=F("rating_count") + sign,
+        rating_sum=F("rating_sum") + sign * rating,
+        **{star_field: F(star_field) + sign},
+    )
+
+
+def review_changed(previous, review):
+    """
+    Moves the contribution of a review from its previous state to its current
+    one. Either side may be None (review created or deleted).
+    """
+    old = (previous["product_id"], previous["rating"]) if previous else None
+    if old and not previous["status"]:
+        old = None
+    new = (review.product_id, review.rating) if review and review.status else None
+
+    if old == new:
+        return
+
+    with transaction.atomic():
+        if old:
+            apply_rating(*old, sign=-1)
+        if new:
+            apply_rating(*new, sign=1)
+
+
+def rebuild_rating_stats():
+    """
+    Recomputes the rating aggregates of every product from ReviewRating.
+    Returns the number of products that have at least one active review.
+    """
+    star_counts = {
+        "rating_1_count": Count("id", filter=Q(rating__lt=2)),
+        "rating_2_count": Count("id", filter=Q(rating__gte=2, rating__lt=3)),
+        "rating_3_count": Count("id", filter=Q(rating__gte=3, rating__lt=4)),
+        "rating_4_count": Count("id", filter=Q(rating__gte=4, rating__lt=5)),
+        "rating_5_count": Count("id", filter=Q(rating__gte=5)),
+    }
+    rows = (
+        ReviewRating.objects.filter(status=True)
+        .values("product_id")
+        .annotate(rating_count=Count("id"), rating_sum=Sum("rating"), **star_counts)
+        .order_by()
+    )
+
+    with transaction.atomic():
+        Product.objects.update(**{field: 0 for field in RATING_FIELDS})
+        products = [
+            Product(
+                id=row["product_id"], **{field: row[field] for field in RATING_FIELDS}
+            )
+            for row in rows
+        ]
+        Product.objects.bulk_update(
+            products, RATING_FIELDS, batch_size=REBUILD_BATCH_SIZE
+        )
+
+    return len(products)
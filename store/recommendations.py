@@ -0,0 +1,238 @@
+import math
+import operator
+from collections import Counter, defaultdict
+from functools import reduce
+from itertools import combinations
+
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, F, OuterRef, Q
+
+from orders.models import OrderProduct
+
+from .config import (
+    RECOMMENDATION_BATCH_SIZE,
+    RECOMMENDATION_MIN_ORDERS,
+    RECOMMENDATIONS_PER_PRODUCT,
+)
+from .models import CoPurchase, CoPurchaseOrder, Recommendation
+from .page_cache import bump_catalog_version
+
+
+def new_baskets():
+    """
+    Returns {order_id: {product ids}} for the placed orders that are not yet
+    counted into the co-purchase matrix.
+    """
+    counted = CoPurchaseOrder.objects.filter(order=OuterRef("order_id"))
+    rows = (
+        OrderProduct.objects.filter(order__is_ordered=True)
+        .filter(~Exists(counted))
+        .values_list("order_id", "product_id")
+        .order_by("order_id")
+    )
+    baskets = defaultdict(set)
+    for order_id, product_id in rows.iterator(chunk_size=RECOMMENDATION_BATCH_SIZE):
+        baskets[order_id].add(product_id)
+    return baskets
+
+
+def claim_orders(order_ids):
+    """
+    Marks orders as counted and returns the ids of those this call marked.
+    Orders a concurrent refresh claimed first are left out, so each order is
+    counted once. Must run in a transaction.
+    """
+    order_ids = set(order_ids)
+    while order_ids:
+        try:
+            with transaction.atomic():
+                CoPurchaseOrder.objects.bulk_create(
+                    [CoPurchaseOrder(order_id=order_id) for order_id in order_ids],
+                    batch_size=RECOMMENDATION_BATCH_SIZE,
+                )
+            break
+        except IntegrityError:
+            # Another refresh inserted some of the markers first; they are
+            # visible once its transaction has committed
+            claimed = set(
+                CoPurchaseOrder.objects.filter(order_id__in=order_ids).values_list(
+                    "order_id", flat=True
+                )
+            )
+            if not claimed:
+                raise
+            order_ids -= claimed
+    return order_ids
+
+
+def co_occurrences(baskets):
+    """
+    Accumulates the sparse co-purchase counts of the given baskets as a
+    {(product, other): orders} Counter, symmetric and with the per-product
+    order counts on the diagonal.
+    """
+    counts = Counter()
+    for products in baskets.values():
+        for product in products:
+            counts[(product, product)] += 1
+        for a, b in combinations(products, 2):
+            counts[(a, b)] += 1
+            counts[(b, a)] += 1
+    return counts
+
+
+def add_co_occurrences(counts):
+    """
+    Adds counts to the CoPurchase cells in batches: the existing cells of a
+    batch are locked, incremented in Python and written back with one bulk
+    update, the others bulk created. Must run in a transaction.
+    """
+    cells = list(counts.items())
+    for i in range(0, len(cells), RECOMMENDATION_BATCH_SIZE):
+        batch = dict(cells[i : i + RECOMMENDATION_BATCH_SIZE])
+        others = defaultdict(set)
+        for product, other in batch:
+            others[product].add(other)
+        # Only the batch's own cells, not every product x other combination
+        pairs = reduce(
+            operator.or_,
+            (
+                Q(product_id=product, other_id__in=ids)
+                for product, ids in others.items()
+            ),
+        )
+        existing = {
+            (cell.product_id, cell.other_id): cell
+            for cell in CoPurchase.objects.select_for_update().filter(pairs)
+        }
+        changed = []
+        for key in batch.keys() & existing.keys():
+            existing[key].orders += batch[key]
+            changed.append(existing[key])
+        CoPurchase.objects.bulk_update(changed, ["orders"])
+        missing = [
+            CoPurchase(product_id=product, other_id=other, orders=n)
+            for (product, other), n in batch.items()
+            if (product, other) not in existing
+        ]
+        try:
+            with transaction.atomic():
+                CoPurchase.objects.bulk_create(missing)
+        except IntegrityError:
+            # A concurrent refresh created some of the cells first
+            for cell in missing:
+                updated = CoPurchase.objects.filter(
+                    product_id=cell.product_id, other_id=cell.other_id
+                ).update(orders=F("orders") + cell.orders)
+                if not updated:
+                    cell.save()
+
+
+def top_recommendations(product_ids):
+    """
+    Ranks the co-purchased products of each given product by cosine
+    similarity, orders(a, b) / sqrt(orders(a) * orders(b)), and returns
+    {product_id: [(other_id, score)]} limited to the configured top N.
+    """
+    rows = list(
+        CoPurchase.objects.filter(
+            product_id__in=product_ids, orders__gte=RECOMMENDATION_MIN_ORDERS
+        ).values_list("product_id", "other_id", "orders")
+    )
+    others = {other for product, other, n in rows}
+    totals = dict(
+        CoPurchase.objects.filter(
+            product_id__in=others | set(product_ids), other_id=F("product_id")
+        ).values_list("product_id", "orders")
+    )
+
+    ranked = defaultdict(list)
+    for product, other, n in rows:
+        if product != other:
+            score = n / math.sqrt(totals[product] * totals[other])
+            ranked[product].append((other, score))
+    for product, candidates in ranked.items():
+        candidates.sort(key=lambda item: (-item[1], item[0]))
+        del candidates[RECOMMENDATIONS_PER_PRODUCT:]
+    return ranked
+
+
+def store_recommendations(product_ids):
+    ranked = top_recommendations(product_ids)
+    with transaction.atomic():
+        Recommendation.objects.filter(product_id__in=product_ids).delete()
+        Recommendation.objects.bulk_create(
+            [
+                Recommendation(
+                    product_id=product, recommended_id=other, score=score, rank=rank
+                )
+                for product, candidates in ranked.items()
+                for rank, (other, score) in enumerate(candidates)
+            ]
+        )
+
+
+def affected_products(counts):
+    """
+    Products whose recommendations may change with the given new counts:
+    the products bought, plus everything bought together with them, since
+    their order totals enter those neighbours' scores.
+    """
+    bought = {product for product, other in counts}
+    neighbours = CoPurchase.objects.filter(other_id__in=bought).values_list(
+        "product_id", flat=True
+    )
+    return bought | set(neighbours)
+
+
+def refresh_recommendations(rebuild=False):
+    """
+    Counts the orders placed since the last refresh into the co-purchase
+    matrix and recomputes the recommendations of the affected products.
+    Orders are claimed and counted in one transaction. ``rebuild`` starts over from every placed order. Returns the number of
+    orders counted and of products updated.
+    """
+    if rebuild:
+        with transaction.atomic():
+            CoPurchaseOrder.objects.all().delete()
+            CoPurchase.objects.all().delete()
+            Recommendation.objects.all().delete()
+
+    baskets = new_baskets()
+    if not baskets:
+        return 0, 0
+    with transaction.atomic():
+        # Claim the orders before counting them, so overlapping refreshes
+        # count each order once
+        baskets = {order_id: baskets[order_id] for order_id in claim_orders(baskets)}
+        counts = co_occurrences(baskets)
+        add_co_occurrences(counts)
+    if not baskets:
+        return 0, 0
+
+    products = sorted(affected_products(counts))
+    for i in range(0, len(products), RECOMMENDATION_BATCH_SIZE):
+        store_recommendations(products[i : i + RECOMMENDATION_BATCH_SIZE])
+    bump_catalog_version()
+    return len(baskets), len(products)
+
+
+def recommendations_for(product_ids, exclude=(), limit=RECOMMENDATIONS_PER_PRODUCT):
+    """
+    Reads the precomputed recommendations of one or more products (e.g. the
+    cart contents) in a single indexed query, merged best score first.
+    """
+    rows = (
+        Recommendation.objects.filter(
+            product_id__in=product_ids, recommended__is_available=True
+        )
+        .exclude(recommended_id__in=set(exclude) | set(product_ids))
+        .select_related("recommended__category")
+        .order_by("-score", "rank")
+    )
+    products = {}
+    for row in rows:
+        products.setdefault(row.recommended_id, row.recommended)
+        if len(products) == limit:
+            break
+    return list(products.values())
@@ -0,0 +1,46 @@
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.utils.module_loading import import_string
+
+from store.config import (
+    DEFAULT_SEARCH_BACKEND,
+    SEARCH_FILTER_BATCH_SIZE,
+    STORE_PRODUCTS_PER_PAGE,
+)
+from store.facets import filter_products
+from store.models import Product
+
+
+@lru_cache(maxsize=None)
+def get_search_backend():
+    path = getattr(settings, "SEARCH_BACKEND", DEFAULT_SEARCH_BACKEND)
+    return import_string(path)()
+
+
+def search_products(query, page=None, per_page=STORE_PRODUCTS_PER_PAGE, filters=None):
+    """
+    Runs a ranked product search and returns the requested page, with the
+    page's object_list replaced by the Product instances in ranked order.
+    ``filters`` are facet filters as returned by store.facets.parse_filters;
+    the page's ``matched_ids`` are all the products matching the query
+    before they are applied, to count facets over.
+    """
+    ids = matched_ids = get_search_backend().search(query)
+    if filters:
+        # Only the matches are checked against the filters, in batches
+        allowed = set()
+        for i in range(0, len(ids), SEARCH_FILTER_BATCH_SIZE):
+            batch = Product.objects.filter(pk__in=ids[i : i + SEARCH_FILTER_BATCH_SIZE])
+            allowed.update(filter_products(batch, filters).values_list("pk", flat=True))
+        ids = [pk for pk in ids if pk in allowed]
+
+    paginator = Paginator(ids, per_page)
+    paged = paginator.get_page(page)
+
+    ids = list(paged.object_list)
+    products = Product.objects.select_related("category").in_bulk(ids)
+    paged.object_list = [products[pk] for pk in ids if pk in products]
+    paged.matched_ids = matched_ids
+    return paged
@@ -0,0 +1,64 @@
+import re
+import unicodedata
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+STOP_WORDS = frozenset(
+    """
+    a an and are as at be by for from has in is it its of on or that the this
+    to was were will with
+    """.split()
+)
+
+# (suffix, replacement, minimum stem length) tried in order, first match wins
+SUFFIX_RULES = (
+    ("sses", "ss", 2),
+    ("ies", "y", 2),
+    ("ness", "", 3),
+    ("ment", "", 4),
+    ("ing", "", 3),
+    ("edly", "", 3),
+    ("ed", "", 3),
+    ("ly", "", 3),
+    ("s", "", 3),
+)
+
+
+def normalize(text):
+    text = unicodedata.normalize("NFKD", text or "")
+    return text.encode("ascii", "ignore").decode("ascii").lower()
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(normalize(text))
+
+
+def stem(word):
+    """
+    Light suffix-stripping stemmer, good enough to conflate plural and verb
+    forms of product vocabulary ("shirts" / "shirt", "running" / "run").
+    """
+    if word.isdigit():
+        return word
+    for suffix, replacement, min_stem in SUFFIX_RULES:
+        if not word.endswith(suffix):
+            continue
+        if suffix == "s" and word.endswith(("ss", "us", "is")):
+            break
+        base = word[: -len(suffix)]
+        if len(base) < min_stem:
+            break
+        word = base + replacement
+        # "running" -> "runn" -> "run"
+        if suffix in ("ing", "ed", "edly") and word[-1] == word[-2]:
+            if word[-1] not in "lsz":
+                word = word[:-1]
+        break
+    return word
+
+
+def analyze(text):
+    """
+    Splits text into the list of stemmed, stop word free index terms.
+    """
+    return [stem(token) for token in tokenize(text) if token not in STOP_WORDS]
@@ -0,0 +1,20 @@
+class BaseSearchBackend:
+    """
+    Interface every product search backend implements.
+
+    ``search`` returns the ids of the matching products, best match first, as
+    a sliceable sequence (a list or a ``values_list`` queryset) so callers can
+    paginate it without loading every match.
+    """
+
+    def index_products(self, products):
+        raise NotImplementedError
+
+    def remove_products(self, product_ids):
+        raise NotImplementedError
+
+    def rebuild(self, products):
+        raise NotImplementedError
+
+    def search(self, query):
+        raise NotImplementedError
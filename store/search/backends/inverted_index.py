@@ -0,0 +1,170 @@
+import heapq
+import math
+from collections import Counter, defaultdict
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Avg, Count
+
+from store.config import (
+    SEARCH_FIELD_WEIGHTS,
+    SEARCH_INDEX_BATCH_SIZE,
+    SEARCH_MAX_POSTINGS_PER_TERM,
+    SEARCH_MAX_QUERY_TERMS,
+    SEARCH_MAX_RESULTS,
+    SEARCH_STATS_CACHE_KEY,
+)
+from store.models import SearchDocument, SearchPosting
+
+from ..analysis import analyze
+from .base import BaseSearchBackend
+
+# BM25 tuning constants
+K1 = 1.2
+B = 0.75
+
+
+def product_fields(product):
+    return {
+        "product_name": product.product_name,
+        "category": product.category.category_name,
+        "product_description": product.product_description,
+    }
+
+
+def weighted_terms(product):
+    """
+    Returns the field-weighted term frequencies and the weighted document
+    length of a product.
+    """
+    frequencies = Counter()
+    for field, text in product_fields(product).items():
+        weight = SEARCH_FIELD_WEIGHTS[field]
+        for term in analyze(text):
+            frequencies[term[:100]] += weight
+    return frequencies, sum(frequencies.values())
+
+
+class InvertedIndexBackend(BaseSearchBackend):
+    """
+    Portable backend keeping an inverted index in regular tables and ranking
+    matches with BM25 in Python. Works on SQLite as well as any other database.
+
+    A search scores the ``max_query_terms`` rarest terms of the query, reads
+    at most ``max_postings_per_term`` postings per term, those with the
+    highest frequency, and returns the ``max_results`` best ids, so neither
+    long queries nor common terms make a search unbounded. Only available
+    products are returned.
+    """
+
+    max_query_terms = SEARCH_MAX_QUERY_TERMS
+    max_postings_per_term = SEARCH_MAX_POSTINGS_PER_TERM
+    max_results = SEARCH_MAX_RESULTS
+
+    def _rows(self, products):
+        documents, postings = [], []
+        for product in products:
+            frequencies, length = weighted_terms(product)
+            documents.append(SearchDocument(product_id=product.id, length=length))
+            postings.extend(
+                SearchPosting(term=term, product_id=product.id, frequency=frequency)
+                for term, frequency in frequencies.items()
+            )
+        return documents, postings
+
+    def _write(self, products):
+        documents, postings = self._rows(products)
+        SearchDocument.objects.bulk_create(
+            documents, batch_size=SEARCH_INDEX_BATCH_SIZE
+        )
+        SearchPosting.objects.bulk_create(postings, batch_size=SEARCH_INDEX_BATCH_SIZE)
+
+    def index_products(self, products):
+        products = list(products)
+        with transaction.atomic():
+            self._delete([product.id for product in products])
+            self._write(products)
+        cache.delete(SEARCH_STATS_CACHE_KEY)
+
+    def remove_products(self, product_ids):
+        self._delete(product_ids)
+        cache.delete(SEARCH_STATS_CACHE_KEY)
+
+    def _delete(self, product_ids):
+        SearchPosting.objects.filter(product_id__in=product_ids).delete()
+        SearchDocument.objects.filter(product_id__in=product_ids).delete()
+
+    def rebuild(self, products):
+        count = 0
+        with transaction.atomic():
+            SearchPosting.objects.all().delete()
+            SearchDocument.objects.all().delete()
+            batch = []
+            for product in products:
+                batch.append(product)
+                if len(batch) >= SEARCH_INDEX_BATCH_SIZE:
+                    self._write(batch)
+                    count += len(batch)
+                    batch = []
+            self._write(batch)
+            count += len(batch)
+        cache.delete(SEARCH_STATS_CACHE_KEY)
+        return count
+
+    def _stats(self):
+        stats = cache.get(SEARCH_STATS_CACHE_KEY)
+        if stats is None:
+            stats = SearchDocument.objects.aggregate(
+                documents=Count("product"), average_length=Avg("length")
+            )
+            cache.set(SEARCH_STATS_CACHE_KEY, stats)
+        return stats
+
+    def search(self, query):
+        terms = set(analyze(query))
+        if not terms:
+            return []
+
+        # Document frequencies come from the whole index, only the postings
+        # scored are bounded
+        document_frequency = dict(
+            SearchPosting.objects.filter(term__in=terms)
+            .values_list("term")
+            .annotate(n=Count("id"))
+            .order_by()
+        )
+        # The rarest terms are the most selective, and score the highest
+        rarest = heapq.nsmallest(
+            self.max_query_terms,
+            document_frequency,
+            key=lambda term: (document_frequency[term], term),
+        )
+        by_term = {}
+        for term in rarest:
+            by_term[term] = list(
+                SearchPosting.objects.filter(term=term, product__is_available=True)
+                .order_by("-frequency")
+                .values_list(
+                    "product_id", "frequency", "product__search_document__length"
+                )[: self.max_postings_per_term]
+            )
+
+        stats = self._stats()
+        documents = stats["documents"] or 1
+        average_length = stats["average_length"] or 1
+
+        scores = defaultdict(float)
+        for term, matches in by_term.items():
+            n = document_frequency[term]
+            idf = math.log(1 + (documents - n + 0.5) / (n + 0.5))
+            for product_id, frequency, length in matches:
+                norm = K1 * (1 - B + B * (length or average_length) / average_length)
+                scores[product_id] += idf * frequency * (K1 + 1) / (frequency + norm)
+
+        # Products matching more of the query terms always come first
+        coverage = Counter(pid for matches in by_term.values() for pid, *_ in matches)
+        return heapq.nlargest(
+            self.max_results,
+            scores,
+            key=lambda pid: (coverage[pid], scores[pid], pid),
+        )
@@ -0,0 +1,45 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+
+from store.models import Product
+
+from .base import BaseSearchBackend
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """
+    Database-native backend using PostgreSQL full-text search. Ranking and
+    stemming happen in the database, so there is no separate index to keep in
+    sync and the index hooks are no-ops.
+
+    Enable with ``SEARCH_BACKEND = "store.search.backends.postgres.PostgresSearchBackend"``
+    and add a GIN expression index over the same vector for large catalogs.
+    """
+
+    config = "english"
+
+    def vector(self):
+        return (
+            SearchVector("product_name", weight="A", config=self.config)
+            + SearchVector("category__category_name", weight="B", config=self.config)
+            + SearchVector("product_description", weight="C", config=self.config)
+        )
+
+    def index_products(self, products):
+        pass
+
+    def remove_products(self, product_ids):
+        pass
+
+    def rebuild(self, products):
+        return 0
+
+    def search(self, query):
+        search_query = SearchQuery(query, search_type="websearch", config=self.config)
+        return (
+            Product.objects.annotate(
+                search=self.vector(), rank=SearchRank(self.vector(), search_query)
+            )
+            .filter(search=search_query, is_available=True)
+            .order_by("-rank", "-id")
+            .values_list("id", flat=True)
+        )
@@ -0,0 +1,273 @@
+import heapq
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from dataclasses import dataclass, field
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Case, F, Value, When
+from django.urls import reverse
+
+from category.cache import get_categories
+from store.config import (
+    TYPEAHEAD_MAX_AGE,
+    TYPEAHEAD_MAX_QUERIES,
+    TYPEAHEAD_MIN_QUERY_COUNT,
+    TYPEAHEAD_PRECOMPUTED_PREFIX,
+    TYPEAHEAD_QUERY_FLUSH_INTERVAL,
+    TYPEAHEAD_QUERY_FLUSH_SIZE,
+    TYPEAHEAD_RESULTS,
+)
+from store.models import CoPurchase, Product, SearchQueryCount
+from store.page_cache import get_catalog_version
+
+from .analysis import normalize
+
+WORD_START_RE = re.compile(r"(?<![a-z0-9])[a-z0-9]")
+SPACES_RE = re.compile(r"[^a-z0-9]+")
+
+
+def normalize_prefix(text):
+    return SPACES_RE.sub(" ", normalize(text)).lstrip()
+
+
+@dataclass(frozen=True)
+class Suggestion:
+    label: str
+    kind: str
+    url: str
+    weight: float
+
+    def as_dict(self):
+        return {"label": self.label, "kind": self.kind, "url": self.url}
+
+
+@dataclass(frozen=True)
+class TypeaheadIndex:
+    """
+    Suggestions indexed by every word start of their label: ``keys`` is the
+    sorted list of (label suffix, suggestion number), so all keys starting
+    with a prefix form one contiguous range found by bisection. Results of
+    short prefixes, whose ranges are long, are precomputed in ``top``.
+    """
+
+    suggestions: tuple
+    keys: list
+    top: dict = field(default_factory=dict)
+
+    @classmethod
+    def build(cls, suggestions):
+        keys = []
+        for number, suggestion in enumerate(suggestions):
+            label = normalize_prefix(suggestion.label)
+            for match in WORD_START_RE.finditer(label):
+                keys.append((label[match.start() :], number))
+        keys.sort()
+
+        index = cls(tuple(suggestions), keys)
+        for key, number in keys:
+            for length in range(1, TYPEAHEAD_PRECOMPUTED_PREFIX + 1):
+                index.top.setdefault(key[:length], set()).add(number)
+        for prefix, numbers in index.top.items():
+            index.top[prefix] = index.ranked(numbers)
+        return index
+
+    def ranked(self, numbers):
+        return tuple(
+            heapq.nlargest(
+                TYPEAHEAD_RESULTS,
+                numbers,
+                key=lambda number: (self.suggestions[number].weight, -number),
+            )
+        )
+
+    def lookup(self, prefix):
+        prefix = normalize_prefix(prefix)
+        if not prefix:
+            return []
+        if len(prefix) <= TYPEAHEAD_PRECOMPUTED_PREFIX:
+            numbers = self.top.get(prefix, ())
+        else:
+            numbers = set()
+            i = bisect_left(self.keys, (prefix,))
+            while i < len(self.keys) and self.keys[i][0].startswith(prefix):
+                numbers.add(self.keys[i][1])
+                i += 1
+            numbers = self.ranked(numbers)
+        return [self.suggestions[number] for number in numbers]
+
+
+def load_suggestions():
+    """
+    Collects the typeahead suggestions: available products weighted by how
+    often they were ordered and reviewed, categories by their product count
+    and popular search queries by how often they were searched.
+    """
+    orders = dict(
+        CoPurchase.objects.filter(other_id=F("product_id")).values_list(
+            "product_id", "orders"
+        )
+    )
+    products = Product.objects.filter(is_available=True).values_list(
+        "id", "product_name", "slug", "category__slug", "rating_count"
+    )
+    suggestions = [
+        Suggestion(
+            label=name,
+            kind="product",
+            url=reverse("product_detail", args=[category_slug, slug]),
+            weight=1 + orders.get(pk, 0) + rating_count,
+        )
+        for pk, name, slug, category_slug, rating_count in products
+    ]
+    suggestions.extend(
+        Suggestion(
+            label=category.category_name,
+            kind="category",
+            url=category.get_url(),
+            weight=category.product_count,
+        )
+        for category in get_categories()
+        if category.product_count
+    )
+    queries = SearchQueryCount.objects.filter(
+        count__gte=TYPEAHEAD_MIN_QUERY_COUNT
+    ).order_by("-count")[:TYPEAHEAD_MAX_QUERIES]
+    search_url = reverse("search")
+    suggestions.extend(
+        Suggestion(
+            label=query.query,
+            kind="query",
+            url=f"{search_url}?{urlencode({'keyword': query.query})}",
+            weight=query.count,
+        )
+        for query in queries
+    )
+    return suggestions
+
+
+@dataclass(frozen=True)
+class TypeaheadSnapshot:
+    version: int
+    built: float
+    index: TypeaheadIndex
+
+
+_snapshot = TypeaheadSnapshot(version=None, built=0, index=None)
+_lock = threading.Lock()
+_pending_queries = Counter()
+_pending_lock = threading.Lock()
+_last_flush = time.monotonic()
+
+
+def build_snapshot(version):
+    return TypeaheadSnapshot(
+        version=version,
+        built=time.monotonic(),
+        index=TypeaheadIndex.build(load_suggestions()),
+    )
+
+
+def _rebuild_in_background(version):
+    global _snapshot
+    try:
+        _snapshot = build_snapshot(version)
+    finally:
+        _lock.release()
+        close_old_connections()
+
+
+def get_typeahead_index():
+    """
+    Returns the in-process typeahead index, rebuilding it when the catalog
+    version changed or it is older than TYPEAHEAD_MAX_AGE.
+
+    One rebuild runs at a time, in a background thread unless
+    TYPEAHEAD_REBUILD_ASYNC is turned off, and requests are served the
+    previous index meanwhile. Only the first index of a process is built
+    on the request path.
+    """
+    global _snapshot
+    snapshot = _snapshot
+    version = get_catalog_version()
+    if (
+        snapshot.version == version
+        and time.monotonic() - snapshot.built < TYPEAHEAD_MAX_AGE
+    ):
+        return snapshot.index
+
+    if snapshot.index is None:
+        with _lock:
+            if _snapshot.index is None:
+                _snapshot = build_snapshot(version)
+            return _snapshot.index
+
+    if _lock.acquire(blocking=False):
+        if getattr(settings, "TYPEAHEAD_REBUILD_ASYNC", True):
+            threading.Thread(
+                target=_rebuild_in_background,
+                args=(version,),
+                name="typeahead-rebuild",
+                daemon=True,
+            ).start()
+        else:
+            try:
+                _snapshot = build_snapshot(version)
+            finally:
+                _lock.release()
+            return _snapshot.index
+    return snapshot.index
+
+
+def suggest(prefix):
+    return get_typeahead_index().lookup(prefix)
+
+
+def record_query(query):
+    """
+    Counts a search query (that returned results) towards the popular
+    queries offered by the typeahead. Counts are buffered in the process and
+    written by flush_query_counts every TYPEAHEAD_QUERY_FLUSH_SIZE searches
+    or TYPEAHEAD_QUERY_FLUSH_INTERVAL seconds.
+    """
+    query = normalize_prefix(query).strip()[:100]
+    if not query:
+        return
+    with _pending_lock:
+        _pending_queries[query] += 1
+        due = (
+            sum(_pending_queries.values()) >= TYPEAHEAD_QUERY_FLUSH_SIZE
+            or time.monotonic() - _last_flush >= TYPEAHEAD_QUERY_FLUSH_INTERVAL
+        )
+    if due:
+        flush_query_counts()
+
+
+def flush_query_counts():
+    """
+    Adds the buffered query counts to SearchQueryCount in two queries,
+    however many queries are pending.
+    """
+    global _last_flush
+    with _pending_lock:
+        pending = dict(_pending_queries)
+        _pending_queries.clear()
+        _last_flush = time.monotonic()
+    if not pending:
+        return
+    with transaction.atomic():
+        SearchQueryCount.objects.bulk_create(
+            [SearchQueryCount(query=query, count=0) for query in pending],
+            ignore_conflicts=True,
+        )
+        SearchQueryCount.objects.filter(query__in=pending).update(
+            count=F("count")
+            + Case(
+                *(When(query=query, then=Value(n)) for query, n in pending.items()),
+                default=Value(0),
+            )
+        )
@@ -0,0 +1,171 @@
+from django.db import transaction
+from django.db.models.query import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from category.cache import bump_category_version
+from category.models import Category
+
+from .facets import index_product_facets, remove_product_facets
+from .feed import invalidate_home_feed
+from .images import needs_renditions, schedule_renditions
+from .models import Product, ProductGallery, ReviewRating, Variation
+from .page_cache import bump_catalog_version
+from .ratings import review_changed
+from .search import get_search_backend
+from .variations import bump_variation_versions
+
+
+def deleting_catalog(origin):
+    """
+    True when a delete cascaded from a product or category, in which case the
+    product's derived data is going away with it and must not be rebuilt.
+    """
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return model in (Product, Category)
+
+
+@receiver(pre_save, sender=ReviewRating)
+def remember_previous_review(sender, instance, raw=False, **kwargs):
+    instance._previous_review = None
+    if instance.pk and not raw:
+        instance._previous_review = (
+            ReviewRating.objects.filter(pk=instance.pk)
+            .values("product_id", "rating", "status")
+            .first()
+        )
+
+
+@receiver(post_save, sender=ReviewRating)
+def update_rating_stats_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, "_previous_review", None)
+    review_changed(previous, instance)
+    index_product_facets(
+        list(
+            {instance.product_id, previous["product_id"] if previous else None} - {None}
+        )
+    )
+    transaction.on_commit(invalidate_home_feed)
+
+
+@receiver(post_delete, sender=ReviewRating)
+def update_rating_stats_on_delete(sender, instance, origin=None, **kwargs):
+    if deleting_catalog(origin):
+        return
+    review_changed(
+        {
+            "product_id": instance.product_id,
+            "rating": instance.rating,
+            "status": instance.status,
+        },
+        None,
+    )
+    index_product_facets([instance.product_id])
+    transaction.on_commit(invalidate_home_feed)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def catalog_changed(sender, **kwargs):
+    transaction.on_commit(invalidate_home_feed)
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, raw=False, **kwargs):
+    if not raw:
+        get_search_backend().index_products([instance])
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    get_search_backend().remove_products([instance.pk])
+
+
+@receiver(post_save, sender=Category)
+def reindex_category_products(sender, instance, created=False, raw=False, **kwargs):
+    if not created and not raw:
+        get_search_backend().index_products(
+            Product.objects.filter(category=instance).select_related("category")
+        )
+
+
+@receiver(post_save, sender=Product)
+def index_facets(sender, instance, raw=False, **kwargs):
+    if not raw:
+        index_product_facets([instance.pk])
+
+
+@receiver(pre_delete, sender=Product)
+def unindex_facets(sender, instance, **kwargs):
+    remove_product_facets(instance.pk)
+
+
+@receiver(post_save, sender=Variation)
+@receiver(post_delete, sender=Variation)
+def variation_changed(sender, instance, raw=False, origin=None, **kwargs):
+    if not raw and not deleting_catalog(origin):
+        index_product_facets([instance.product_id])
+
+
+@receiver(post_save, sender=Variation)
+@receiver(post_delete, sender=Variation)
+def expire_variation_map(sender, instance, raw=False, **kwargs):
+    if not raw:
+        transaction.on_commit(lambda: bump_variation_versions([instance.product_id]))
+
+
+@receiver(post_save, sender=Category)
+def reindex_category_facets(sender, instance, created=False, raw=False, **kwargs):
+    if not created and not raw:
+        index_product_facets(
+            list(Product.objects.filter(category=instance).values_list("pk", flat=True))
+        )
+
+
+@receiver(pre_save, sender=Product)
+def remember_menu_state(sender, instance, raw=False, **kwargs):
+    instance._previous_menu_state = None
+    if instance.pk and not raw:
+        instance._previous_menu_state = (
+            Product.objects.filter(pk=instance.pk)
+            .values_list("category_id", "is_available")
+            .first()
+        )
+
+
+@receiver(post_save, sender=Product)
+def update_category_counts(sender, instance, raw=False, **kwargs):
+    state = (instance.category_id, instance.is_available)
+    if not raw and getattr(instance, "_previous_menu_state", None) != state:
+        transaction.on_commit(bump_category_version)
+
+
+@receiver(post_delete, sender=Product)
+def update_category_counts_on_delete(sender, instance, **kwargs):
+    transaction.on_commit(bump_category_version)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Variation)
+@receiver(post_delete, sender=Variation)
+@receiver(post_save, sender=ProductGallery)
+@receiver(post_delete, sender=ProductGallery)
+@receiver(post_save, sender=ReviewRating)
+@receiver(post_delete, sender=ReviewRating)
+def expire_cached_pages(sender, raw=False, **kwargs):
+    if not raw:
+        transaction.on_commit(bump_catalog_version)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=ProductGallery)
+def render_image(sender, instance, raw=False, **kwargs):
+    if not raw and needs_renditions(instance):
+        schedule_renditions(instance)
@@ -0,0 +1,50 @@
+from django import template
+from django.utils.html import format_html
+
+from store.images import image_sources
+
+register = template.Library()
+
+
+def sources_of(obj, rendition):
+    # Cached product cards carry their sources precomputed
+    if isinstance(obj, dict):
+        return obj
+    return image_sources(obj.image, obj.image_renditions, rendition)
+
+
+@register.simple_tag
+def rendition_url(obj, rendition):
+    """
+    {% rendition_url product "detail" %} -> URL of the stored JPEG rendition,
+    or of the original image while renditions are missing.
+    """
+    return sources_of(obj, rendition)["src"]
+
+
+@register.simple_tag
+def responsive_image(obj, rendition, alt="", css_class=""):
+    """
+    {% responsive_image product "card" alt=product.product_name %} renders a
+    <picture> offering the WebP renditions with a JPEG fallback.
+    """
+    sources = sources_of(obj, rendition)
+    if not sources.get("srcset"):
+        return format_html(
+            '<img src="{}" alt="{}" class="{}" loading="lazy">',
+            sources["src"],
+            alt,
+            css_class,
+        )
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}" class="{}" loading="lazy">'
+        "</picture>",
+        sources["webp_srcset"],
+        sources["sizes"],
+        sources["src"],
+        sources["srcset"],
+        sources["sizes"],
+        alt,
+        css_class,
+    )
@@ -1,3 +1,975 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+from contextlib import redirect_stdout
+from decimal import Decimal
+from io import BytesIO, StringIO
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.template import Context, Template
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from PIL import Image
+
+from accounts.models import Account
+from category.models import Category
+from orders.models import Order, OrderProduct
+
+from .catalog_io import (
+    CatalogError,
+    CatalogImporter,
+    export_records,
+    read_records,
+    write_records,
+)
+from .config import HOME_FEED_CACHE_KEY, LISTING_SORTS
+from .facets import facet_counts, filter_products, rebuild_facet_index
+from .feed import get_home_feed
+from .images import image_sources, render_image_renditions
+from .listing import paginate
+from .loaders import ProductDetailLoader, load_reviews
+from .models import (
+    CoPurchase,
+    FacetCount,
+    Product,
+    ProductGallery,
+    ReviewRating,
+    SearchQueryCount,
+    Variation,
+)
+from .page_cache import get_catalog_version, page_cache_key
+from .ratings import rebuild_rating_stats
+from .recommendations import (
+    add_co_occurrences,
+    claim_orders,
+    co_occurrences,
+    recommendations_for,
+    refresh_recommendations,
+)
+from .search import get_search_backend, search_products, typeahead
+from .search.analysis import analyze
+from .search.backends.inverted_index import InvertedIndexBackend
+from .search.typeahead import (
+    Suggestion,
+    TypeaheadIndex,
+    flush_query_counts,
+    record_query,
+    suggest,
+)
+from .variations import resolve_variation_ids, resolve_variations, variation_map
+
+
+def create_user(username):
+    return Account.objects.create_user(
+        first_name=username,
+        last_name="Test",
+        username=username,
+        email=f"{username}@example.com",
+        password="password",
+    )
+
+
+def create_product(name, category=None, **kwargs):
+    if category is None:
+        category, created = Category.objects.get_or_create(
+            category_name="Shirts", slug="shirts"
+        )
+    kwargs.setdefault("price", 10)
+    kwargs.setdefault("stock", 10)
+    return Product.objects.create(
+        product_name=name,
+        slug=name.lower().replace(" ", "-"),
+        image="photos/products/test.jpg",
+        category=category,
+        **kwargs,
+    )
+
+
+class RatingStatsTest(TestCase):
+    def setUp(self):
+        self.product = create_product("Blue Shirt")
+        self.alice = create_user("alice")
+        self.bob = create_user("bob")
+
+    def review(self, user, rating, **kwargs):
+        return ReviewRating.objects.create(
+            product=self.product, user=user, rating=rating, **kwargs
+        )
+
+    def test_stats_follow_review_lifecycle(self):
+        first = self.review(self.alice, 4.5)
+        self.review(self.bob, 2)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.count_review(), 2)
+        self.assertEqual(self.product.get_average_rating(), 3.25)
+        self.assertEqual(self.product.get_rating_histogram()[4], 1)
+
+        first.rating = 5
+        first.save()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.get_average_rating(), 3.5)
+        self.assertEqual(self.product.rating_4_count, 0)
+        self.assertEqual(self.product.rating_5_count, 1)
+
+        first.status = False
+        first.save()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.count_review(), 1)
+        self.assertEqual(self.product.get_average_rating(), 2)
+
+        first.delete()
+        ReviewRating.objects.get(user=self.bob).delete()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.count_review(), 0)
+        self.assertEqual(self.product.get_average_rating(), 0)
+
+    def test_product_save_keeps_stats(self):
+        stale = Product.objects.get(pk=self.product.pk)
+        self.review(self.alice, 3)
+        stale.price = 12
+        stale.save()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.rating_count, 1)
+
+    def test_rating_methods_do_not_query(self):
+        self.review(self.alice, 3)
+        product = Product.objects.get(pk=self.product.pk)
+        with self.assertNumQueries(0):
+            product.get_average_rating()
+            product.count_review()
+
+    def test_rebuild(self):
+        self.review(self.alice, 1)
+        self.review(self.bob, 3, status=False)
+        Product.objects.update(rating_count=7, rating_sum=3)
+        self.assertEqual(rebuild_rating_stats(), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.rating_count, 1)
+        self.assertEqual(self.product.rating_1_count, 1)
+        self.assertEqual(self.product.get_average_rating(), 1)
+
+
+class HomeFeedTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def home_queries(self):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("home"))
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_feed_is_cached_and_invalidated(self):
+        product = create_product("Red Shirt")
+        feed = get_home_feed()
+        self.assertEqual(feed[0]["cards"][0]["name"], "Red Shirt")
+
+        with self.assertNumQueries(0):
+            get_home_feed()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product.product_name = "Green Shirt"
+            product.save()
+        self.assertEqual(get_home_feed()[0]["cards"][0]["name"], "Green Shirt")
+
+    def test_home_queries_do_not_grow_with_catalog(self):
+        create_product("Shirt 0")
+        self.home_queries()  # start the visitor's session
+        small = self.home_queries()
+        for i in range(1, 20):
+            create_product(f"Shirt {i}")
+        self.assertEqual(self.home_queries(), small)
+
+
+class SearchTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.jeans = create_product(
+            "Slim Jeans", product_description="Blue denim for running errands"
+        )
+        self.shirt = create_product(
+            "Blue Shirt", product_description="Cotton shirt with long sleeves"
+        )
+        self.shoes = create_product("Running Shoes", product_description="Light")
+
+    def search(self, query):
+        return [product.product_name for product in search_products(query)]
+
+    def test_analyze_stems_and_drops_stop_words(self):
+        self.assertEqual(analyze("The Running shirts"), ["run", "shirt"])
+
+    def test_ranks_by_field_weight(self):
+        self.assertEqual(self.search("running"), ["Running Shoes", "Slim Jeans"])
+        self.assertEqual(self.search("blue shirts")[0], "Blue Shirt")
+        self.assertEqual(self.search("sweater"), [])
+
+    def test_index_follows_product_changes(self):
+        self.shoes.product_name = "Trail Sneakers"
+        self.shoes.save()
+        self.assertEqual(self.search("sneakers"), ["Trail Sneakers"])
+        self.assertEqual(self.search("running"), ["Slim Jeans"])
+
+        self.jeans.delete()
+        self.assertEqual(self.search("denim"), [])
+
+    def test_rebuild_and_paginate(self):
+        backend = get_search_backend()
+        self.assertEqual(backend.rebuild(Product.objects.all()), 3)
+        page = search_products("blue", per_page=1)
+        self.assertEqual(page.paginator.count, 2)
+        self.assertEqual(len(page.object_list), 1)
+
+    def test_postings_and_results_are_bounded(self):
+        backend = InvertedIndexBackend()
+        backend.max_postings_per_term = 1
+        # Only the strongest "blue" posting, the name match, is scored
+        self.assertEqual(backend.search("blue"), [self.shirt.pk])
+        backend.max_postings_per_term = 10
+        backend.max_results = 1
+        self.assertEqual(backend.search("running"), [self.shoes.pk])
+
+    def test_long_queries_score_the_rarest_terms(self):
+        backend = InvertedIndexBackend()
+        backend.max_query_terms = 1
+        # "blue" matches two products, "cotton" only the shirt
+        self.assertEqual(backend.search("blue cotton"), [self.shirt.pk])
+        with self.assertNumQueries(2):
+            backend.search(" ".join(f"word{i}" for i in range(50)) + " blue cotton")
+
+    def test_unavailable_products_are_not_found(self):
+        self.shoes.is_available = False
+        self.shoes.save()
+        self.assertEqual(self.search("running"), ["Slim Jeans"])
+
+    def test_filters_apply_to_the_matches(self):
+        Variation.objects.create(
+            product=self.shoes, variation_category="color", variation_value="Red"
+        )
+        page = search_products("running", filters={"color": ["red"]})
+        self.assertEqual([product.product_name for product in page], ["Running Shoes"])
+        self.assertEqual(sorted(page.matched_ids), [self.jeans.pk, self.shoes.pk])
+
+    def test_search_view(self):
+        response = self.client.get(reverse("search"), {"keyword": "cotton"})
+        self.assertEqual(response.context["product_count"], 1)
+        self.assertContains(response, "Blue Shirt")
+
+
+class ListingTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        for i, price in enumerate([5, 3, 3, 8, 1, 3, 9]):
+            create_product(f"Shirt {i}", price=price)
+        self.products = Product.objects.filter(is_available=True)
+
+    def walk(self, sort):
+        names, token = [], None
+        while True:
+            page = paginate(self.products, sort=sort, token=token, per_page=2)
+            names.extend(p.product_name for p in page)
+            if not page.has_next:
+                return names, page
+            token = page.next_token
+
+    def test_walks_every_sort_in_order(self):
+        for sort, (label, ordering) in LISTING_SORTS.items():
+            expected = [p.product_name for p in self.products.order_by(*ordering)]
+            self.assertEqual(self.walk(sort)[0], expected, sort)
+
+    def test_previous_token_returns_previous_page(self):
+        first = paginate(self.products, sort="price", per_page=3)
+        second = paginate(
+            self.products, sort="price", token=first.next_token, per_page=3
+        )
+        back = paginate(
+            self.products, sort="price", token=second.prev_token, per_page=3
+        )
+        self.assertEqual(back.items, first.items)
+        self.assertFalse(back.has_previous)
+
+    def test_invalid_or_foreign_token_starts_over(self):
+        first = paginate(self.products, sort="price", per_page=2)
+        for token in ["garbage", first.next_token]:
+            page = paginate(self.products, sort="-price", token=token, per_page=2)
+            self.assertFalse(page.has_previous)
+
+    def test_deep_page_costs_one_query(self):
+        names, last = self.walk("-date_created")
+        with self.assertNumQueries(1):
+            paginate(self.products, sort="-date_created", token=last.prev_token)
+
+    def test_capped_count(self):
+        page = paginate(self.products, per_page=2, count=True)
+        self.assertEqual(page.estimated_total, 7)
+        self.assertFalse(page.total_is_capped)
+
+    def test_category_view(self):
+        response = self.client.get(reverse("products_by_category", args=["shirts"]))
+        self.assertEqual(response.context["product_count"], 7)
+        response = self.client.get(reverse("products_by_category", args=["missing"]))
+        self.assertEqual(response.status_code, 404)
+
+
+class FacetTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.cheap = create_product("Cheap Shirt", price=20)
+        self.pricey = create_product("Pricey Shirt", price=120)
+        for product, color in [(self.cheap, "Red"), (self.pricey, "red")]:
+            Variation.objects.create(
+                product=product, variation_category="color", variation_value=color
+            )
+        Variation.objects.create(
+            product=self.pricey, variation_category="size", variation_value="XL"
+        )
+
+    def counts(self, **kwargs):
+        return {
+            facet: {item["value"]: item["count"] for item in values}
+            for facet, title, values in facet_counts(**kwargs)
+        }
+
+    def names(self, filters):
+        products = filter_products(Product.objects.order_by("id"), filters)
+        return [product.product_name for product in products]
+
+    def test_counts_are_maintained_incrementally(self):
+        counts = self.counts()
+        self.assertEqual(counts["color"], {"red": 2})
+        self.assertEqual(counts["price"], {"0-50": 1, "100-200": 1})
+        self.assertEqual(counts["size"], {"xl": 1})
+
+        self.pricey.is_available = False
+        self.pricey.save()
+        counts = self.counts()
+        self.assertEqual(counts["color"], {"red": 1})
+        self.assertEqual(counts["size"], {})
+
+        self.cheap.delete()
+        self.assertFalse(FacetCount.objects.filter(count__gt=0).exists())
+
+    def test_filters_intersect_postings(self):
+        self.assertEqual(
+            self.names({"color": ["red"]}), ["Cheap Shirt", "Pricey Shirt"]
+        )
+        self.assertEqual(
+            self.names({"color": ["red"], "size": ["xl"]}), ["Pricey Shirt"]
+        )
+        self.assertEqual(
+            self.names({"price": ["0-50", "100-200"]}), ["Cheap Shirt", "Pricey Shirt"]
+        )
+
+        ReviewRating.objects.create(
+            product=self.cheap, user=create_user("carol"), rating=4
+        )
+        self.assertEqual(self.names({"rating": ["4"]}), ["Cheap Shirt"])
+
+    def test_filtered_counts_and_rebuild(self):
+        filtered = filter_products(Product.objects.all(), {"size": ["xl"]})
+        self.assertEqual(self.counts(queryset=filtered)["price"], {"100-200": 1})
+
+        before = self.counts()
+        FacetCount.objects.all().delete()
+        rebuild_facet_index()
+        self.assertEqual(self.counts(), before)
+
+    def test_selected_facet_keeps_its_other_values(self):
+        Variation.objects.create(
+            product=self.pricey, variation_category="color", variation_value="Blue"
+        )
+        filters = {"color": ["blue"]}
+        counts = self.counts(filters=filters)
+        self.assertEqual(counts["color"], {"red": 2, "blue": 1})
+        self.assertEqual(counts["price"], {"100-200": 1})
+
+        shirts = Product.objects.filter(category__slug="shirts")
+        self.assertEqual(self.counts(queryset=shirts, filters=filters), counts)
+        ids = [self.cheap.pk, self.pricey.pk]
+        self.assertEqual(self.counts(product_ids=ids, filters=filters), counts)
+
+    def test_store_view_filters(self):
+        response = self.client.get(reverse("store"), {"size": "xl"})
+        self.assertEqual(response.context["product_count"], 1)
+        self.assertContains(response, 'name="size" value="xl" checked')
+
+
+class ProductDetailTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.product = create_product("Blue Shirt")
+        self.url = self.product.get_url()
+
+    def add_related(self, n):
+        for i in range(self.product.rating_count, self.product.rating_count + n):
+            user = create_user(f"reviewer{i}")
+            ReviewRating.objects.create(product=self.product, user=user, rating=4)
+            ProductGallery.objects.create(product=self.product, image=f"g{i}.jpg")
+            for category in ("color", "size"):
+                Variation.objects.create(
+                    product=self.product,
+                    variation_category=category,
+                    variation_value=f"{category}{i}",
+                )
+        self.product.refresh_from_db()
+
+    def page_queries(self):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_loader_query_budget(self):
+        self.add_related(3)
+        request = self.client.get(self.url).wsgi_request
+        with self.assertNumQueries(5):
+            detail = ProductDetailLoader(request).load("shirts", "blue-shirt")
+        self.assertEqual(len(detail.reviews), 3)
+        self.assertEqual(len(detail.colors), 3)
+        self.assertEqual(len(detail.gallery), 3)
+        self.assertFalse(detail.in_cart)
+
+    def test_page_queries_do_not_grow(self):
+        self.add_related(1)
+        self.page_queries()  # start the visitor's session
+        baseline = self.page_queries()
+        self.add_related(5)
+        self.assertEqual(self.page_queries(), baseline)
+
+    def test_wrong_category_is_404(self):
+        response = self.client.get(
+            reverse("product_detail", args=["missing", "blue-shirt"])
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+class ReviewPaginationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.product = create_product("Blue Shirt")
+        for i, rating in enumerate([3, 5, 1, 4, 2]):
+            ReviewRating.objects.create(
+                product=self.product,
+                user=create_user(f"reviewer{i}"),
+                rating=rating,
+                subject=f"Review {i}",
+            )
+        self.url = reverse("product_reviews", args=[self.product.id])
+
+    def fetch_all(self, sort):
+        ratings, cursor = [], None
+        while True:
+            page = load_reviews(self.product.id, sort=sort, token=cursor, per_page=2)
+            ratings.extend(review.rating for review in page)
+            if not page.has_next:
+                return ratings
+            cursor = page.next_token
+
+    def test_sorted_pages(self):
+        self.assertEqual(self.fetch_all("highest"), [5, 4, 3, 2, 1])
+        self.assertEqual(self.fetch_all("lowest"), [1, 2, 3, 4, 5])
+        self.assertEqual(self.fetch_all("newest"), [2, 4, 1, 5, 3])
+
+    def test_page_joins_reviewer(self):
+        with self.assertNumQueries(1):
+            page = load_reviews(self.product.id, per_page=2)
+            names = [review.user.full_name() for review in page]
+        self.assertEqual(names, ["reviewer4 Test", "reviewer3 Test"])
+        self.assertTrue(page.has_next)
+
+    def test_endpoint(self):
+        data = self.client.get(self.url, {"sort": "highest"}).json()
+        self.assertEqual([review["rating"] for review in data["reviews"]][:2], [5, 4])
+        self.assertEqual(data["reviews"][0]["reviewer"], "reviewer1 Test")
+        self.assertIn("Review 1", data["html"])
+        self.assertIsNone(data["next"])
+
+
+class PageCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.product = create_product("Blue Shirt")
+
+    def test_anonymous_hit_runs_no_queries(self):
+        self.client.get(reverse("store"))
+        self.client.cookies.clear()
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("store"))
+        self.assertContains(response, "Blue Shirt")
+        self.assertNotContains(response, "[[page-cache:")
+
+    def test_holes_are_filled_per_visitor(self):
+        self.client.get(self.product.get_url())
+        self.client.cookies.clear()
+        response = self.client.get(self.product.get_url())
+        self.assertNotContains(response, "[[page-cache:")
+        token = response.cookies["csrftoken"].value
+        self.assertContains(response, 'name="csrfmiddlewaretoken" value="')
+        self.assertNotIn(token, cache.get(page_cache_key(response.wsgi_request)))
+
+    def test_only_the_parameters_read_are_keyed(self):
+        url = reverse("store")
+        self.client.get(url, {"sort": "price", "color": "red"})
+        self.client.cookies.clear()
+        with self.assertNumQueries(0):
+            self.client.get(f"{url}?utm_source=mail&color=red&sort=price")
+        with self.assertNumQueries(0):
+            self.client.get(url, {"sort": "price", "color": "red", "ref": "x"})
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url, {"sort": "-price", "color": "red"})
+        self.assertTrue(queries)
+
+    def test_catalog_change_expires_pages(self):
+        self.client.get(reverse("store"))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.product_name = "Green Shirt"
+            self.product.save()
+        self.assertContains(self.client.get(reverse("store")), "Green Shirt")
+
+    def test_logged_in_users_are_not_cached(self):
+        user = create_user("shopper")
+        user.is_active = True
+        user.save()
+        self.client.force_login(user)
+        response = self.client.get(reverse("store"))
+        self.assertContains(response, "shopper")
+        self.assertIsNone(cache.get(page_cache_key(response.wsgi_request)))
+
+
+def image_upload(name, width, height):
+    buffer = BytesIO()
+    Image.new("RGB", (width, height), "red").save(buffer, "JPEG")
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type="image/jpeg")
+
+
+class ImageRenditionTest(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings = override_settings(
+            MEDIA_ROOT=media_root, IMAGE_RENDITIONS_ASYNC=False
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def create_product(self, width, height, name="Blue Shirt", image="blue.jpg"):
+        with self.captureOnCommitCallbacks(execute=True):
+            product = create_product(name)
+            product.image = image_upload(image, width, height)
+            product.save()
+        product.refresh_from_db()
+        return product
+
+    def test_renditions_are_generated_on_upload(self):
+        product = self.create_product(1200, 900)
+        renditions = product.image_renditions
+        self.assertEqual(renditions["source"], product.image.name)
+        self.assertEqual(renditions["thumb"]["width"], 160)
+        self.assertEqual(renditions["detail"]["width"], 800)
+        self.assertTrue(renditions["card"]["webp"].endswith("blue.jpg-card.webp"))
+        storage = product.image.storage
+        with storage.open(renditions["card"]["jpeg"]) as rendition:
+            self.assertEqual(Image.open(rendition).size, (400, 300))
+
+    def test_images_with_the_same_stem_keep_their_own_renditions(self):
+        jpeg = self.create_product(400, 300)
+        png = self.create_product(300, 400, name="Blue Tie", image="blue.png")
+        storage = jpeg.image.storage
+        for product, size in ((jpeg, (400, 300)), (png, (300, 400))):
+            with storage.open(product.image_renditions["card"]["jpeg"]) as rendition:
+                self.assertEqual(Image.open(rendition).size, size)
+
+    def test_new_renditions_expire_cached_pages(self):
+        product = self.create_product(300, 300)
+        get_home_feed()
+        version = get_catalog_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(render_image_renditions("store.Product", product.pk))
+        self.assertNotEqual(get_catalog_version(), version)
+        self.assertIsNone(cache.get(HOME_FEED_CACHE_KEY))
+
+    def test_small_images_are_not_upscaled(self):
+        product = self.create_product(300, 300)
+        sources = image_sources(product.image, product.image_renditions, "detail")
+        self.assertEqual(product.image_renditions["detail"]["width"], 300)
+        self.assertEqual(sources["srcset"].count("w"), 2)
+
+    def test_srcset_tag(self):
+        product = self.create_product(1200, 900)
+        html = Template(
+            '{% load store_images %}{% responsive_image product "card" %}'
+        ).render(Context({"product": product}))
+        self.assertIn('type="image/webp"', html)
+        self.assertIn("blue.jpg-thumb.jpg 160w, ", html)
+        self.assertIn("blue.jpg-card.jpg 400w", html)
+        self.assertNotIn("blue.jpg-detail", html)
+
+    def test_missing_renditions_fall_back_to_original(self):
+        product = create_product("Red Shirt")
+        html = Template(
+            '{% load store_images %}{% responsive_image product "card" %}'
+        ).render(Context({"product": product}))
+        self.assertIn('src="/media/photos/products/test.jpg"', html)
+        self.assertNotIn("srcset", html)
+
+
+class CatalogImportTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.images_dir = tempfile.mkdtemp()
+        media_root = tempfile.mkdtemp()
+        for path in (self.images_dir, media_root):
+            self.addCleanup(shutil.rmtree, path)
+        settings = override_settings(MEDIA_ROOT=media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        Image.new("RGB", (10, 10)).save(f"{self.images_dir}/shirt.jpg")
+
+    def records(self, n, start=0, **overrides):
+        return [
+            {
+                "category": "Shirts",
+                "product_name": f"Shirt {start + i}",
+                "price": "19.99",
+                "stock": 5,
+                "colors": ["Red", "Blue"],
+                "sizes": ["M"],
+                **overrides,
+            }
+            for i in range(n)
+        ]
+
+    def import_records(self, records, **kwargs):
+        importer = CatalogImporter(images_dir=self.images_dir, **kwargs)
+        return importer.run(records)
+
+    def test_import_creates_and_updates(self):
+        stats = self.import_records(self.records(5), batch_size=2)
+        self.assertEqual((stats.rows, stats.created, stats.updated), (5, 5, 0))
+        self.assertEqual(Product.objects.count(), 5)
+        self.assertEqual(Variation.objects.count(), 15)
+        self.assertEqual(search_products("shirt").paginator.count, 5)
+
+        stats = self.import_records(self.records(5, price="9.50", colors=["Red"]))
+        self.assertEqual((stats.created, stats.updated), (0, 5))
+        self.assertEqual(Product.objects.filter(price=Decimal("9.50")).count(), 5)
+        self.assertEqual(Variation.objects.filter(is_active=True).count(), 10)
+        self.assertEqual(Category.objects.count(), 1)
+
+    def test_batches_use_constant_queries(self):
+        self.import_records(self.records(1))
+        with CaptureQueriesContext(connection) as small:
+            self.import_records(self.records(2, start=1))
+        with CaptureQueriesContext(connection) as large:
+            self.import_records(self.records(40, start=3))
+        self.assertEqual(len(small), len(large))
+
+    def test_images_are_copied_in(self):
+        stats = self.import_records(
+            self.records(2, image="shirt.jpg", gallery=["shirt.jpg", "missing.jpg"])
+        )
+        self.assertEqual(stats.missing_images, ["missing.jpg", "missing.jpg"])
+        product = Product.objects.get(slug="shirt-0")
+        self.assertEqual(product.image.name, "photos/products/shirt.jpg")
+        self.assertEqual(
+            list(product.productgallery_set.values_list("image", flat=True)),
+            ["store/products/shirt.jpg"],
+        )
+
+    def test_different_images_with_the_same_name_are_both_copied(self):
+        self.import_records(self.records(1, image="shirt.jpg"))
+        os.mkdir(f"{self.images_dir}/new")
+        with open(f"{self.images_dir}/shirt.jpg", "rb") as source:
+            data = bytearray(source.read())
+        data[-3] ^= 0xFF
+        with open(f"{self.images_dir}/new/shirt.jpg", "wb") as target:
+            target.write(data)
+
+        stats = self.import_records(self.records(1, image="new/shirt.jpg"))
+        self.assertEqual(stats.images, 1)
+        name = Product.objects.get(slug="shirt-0").image.name
+        self.assertNotEqual(name, "photos/products/shirt.jpg")
+        stats = self.import_records(self.records(1, image="shirt.jpg"))
+        self.assertEqual(stats.images, 0)
+
+    def test_blank_availability_keeps_the_current_value(self):
+        self.import_records(self.records(1, is_available="no"))
+        for value in (None, ""):
+            self.import_records(self.records(1, is_available=value))
+            self.assertFalse(Product.objects.get(slug="shirt-0").is_available)
+        self.import_records(self.records(1, start=1, is_available=None))
+        self.assertTrue(Product.objects.get(slug="shirt-1").is_available)
+        with self.assertRaisesMessage(CatalogError, "Record 1: invalid"):
+            self.import_records(self.records(1, is_available="maybe"))
+
+    def test_sharded_stock_is_left_alone(self):
+        self.import_records(self.records(1))
+        Product.objects.filter(slug="shirt-0").update(stock_shards=2)
+        self.import_records(self.records(1, stock=50, price="9.50"))
+        product = Product.objects.get(slug="shirt-0")
+        self.assertEqual((product.stock, product.price), (5, Decimal("9.50")))
+
+    def test_export_round_trip(self):
+        self.import_records(self.records(3, image="shirt.jpg"))
+        for fmt in ("csv", "jsonl"):
+            stream = StringIO()
+            write_records(stream, fmt, export_records())
+            stream.seek(0)
+            records = list(read_records(stream, fmt))
+            self.assertEqual(len(records), 3)
+            self.assertEqual(records[0]["colors"], ["Red", "Blue"])
+            self.assertEqual(records[0]["image"], "photos/products/shirt.jpg")
+            stats = self.import_records(records)
+            self.assertEqual((stats.created, stats.updated, stats.images), (0, 3, 0))
+
+    def test_commands_leave_standard_streams_open(self):
+        self.import_records(self.records(2))
+        stdout = StringIO()
+        with redirect_stdout(stdout):
+            call_command("export_catalog", "-", format="jsonl", stderr=StringIO())
+        self.assertFalse(stdout.closed)
+        self.assertEqual(len(stdout.getvalue().splitlines()), 2)
+
+    def test_conflicting_rows_are_reported(self):
+        self.import_records(self.records(1))
+        records = self.records(2, start=1) + self.records(1, slug="other-shirt")
+        with self.assertRaisesMessage(CatalogError, "Records 1-3"):
+            self.import_records(records)
+        self.assertEqual(Product.objects.count(), 1)
+
+
+class RecommendationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = create_user("shopper")
+        self.shirt, self.tie, self.socks, self.hat = [
+            create_product(name) for name in ("Shirt", "Tie", "Socks", "Hat")
+        ]
+
+    def place_order(self, *products, is_ordered=True):
+        order = Order.objects.create(
+            user=self.user, order_number="1", is_ordered=is_ordered, order_total=1
+        )
+        for product in products:
+            OrderProduct.objects.create(
+                order=order, user=self.user, product=product, quantity=1, ordered=True
+            )
+        return order
+
+    def test_ranked_by_co_purchase(self):
+        self.place_order(self.shirt, self.tie)
+        self.place_order(self.shirt, self.tie, self.socks)
+        self.place_order(self.shirt, self.socks)
+        self.place_order(self.hat, self.socks)
+        self.place_order(self.shirt, self.hat, is_ordered=False)
+        self.assertEqual(refresh_recommendations(), (4, 4))
+
+        # tie: 2 / sqrt(3 * 2), socks: 2 / sqrt(3 * 3)
+        self.assertEqual(recommendations_for([self.shirt.pk]), [self.tie, self.socks])
+        self.assertEqual(recommendations_for([self.tie.pk]), [self.shirt, self.socks])
+        self.assertEqual(recommendations_for([self.hat.pk]), [self.socks])
+
+    def test_incremental_refresh(self):
+        self.place_order(self.shirt, self.tie)
+        refresh_recommendations()
+        self.assertEqual(refresh_recommendations(), (0, 0))
+
+        self.place_order(self.shirt, self.hat)
+        self.place_order(self.shirt, self.hat)
+        self.assertEqual(refresh_recommendations()[0], 2)
+        self.assertEqual(recommendations_for([self.shirt.pk]), [self.hat, self.tie])
+        # the tie's only neighbour was bought again, so its list was refreshed
+        incremental = list(self.tie.recommendations.values_list("recommended", "score"))
+        refresh_recommendations(rebuild=True)
+        self.assertEqual(
+            list(self.tie.recommendations.values_list("recommended", "score")),
+            incremental,
+        )
+
+    def test_orders_are_claimed_once(self):
+        first = self.place_order(self.shirt, self.tie)
+        second = self.place_order(self.shirt, self.hat)
+        # e.g. an overlapping refresh that read the same new orders
+        claim_orders([first.pk])
+        self.assertEqual(claim_orders([first.pk, second.pk]), {second.pk})
+        self.assertEqual(claim_orders([second.pk]), set())
+
+    def test_counting_existing_pairs_takes_fixed_queries(self):
+        def queries(products):
+            add_co_occurrences(co_occurrences({1: products}))
+            with CaptureQueriesContext(connection) as captured:
+                add_co_occurrences(co_occurrences({2: products}))
+            return len(captured)
+
+        products = {self.shirt.pk, self.tie.pk, self.socks.pk, self.hat.pk}
+        self.assertEqual(queries({self.shirt.pk, self.tie.pk}), queries(products))
+        self.assertEqual(
+            CoPurchase.objects.get(product=self.shirt, other=self.tie).orders, 4
+        )
+
+    def test_cart_merges_recommendations(self):
+        self.place_order(self.shirt, self.tie, self.socks)
+        self.place_order(self.hat, self.socks)
+        refresh_recommendations()
+        self.hat.is_available = False
+        self.hat.save()
+        with self.assertNumQueries(1):
+            products = recommendations_for([self.shirt.pk, self.socks.pk])
+        self.assertEqual(products, [self.tie])
+
+    def test_product_page(self):
+        self.place_order(self.shirt, self.tie)
+        refresh_recommendations()
+        response = self.client.get(self.shirt.get_url())
+        self.assertEqual(response.context["recommendations"], (self.tie,))
+        self.assertContains(response, "Frequently bought together")
+
+
+@override_settings(TYPEAHEAD_REBUILD_ASYNC=False)
+class TypeaheadTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.url = reverse("search_suggestions")
+
+    def test_index_matches_word_starts_by_weight(self):
+        index = TypeaheadIndex.build(
+            [
+                Suggestion("Blue Shirt", "product", "/blue/", 1),
+                Suggestion("Shirts", "category", "/shirts/", 5),
+                Suggestion("Short Shorts", "product", "/short/", 3),
+                Suggestion("T-Shirt", "product", "/t/", 2),
+            ]
+        )
+
+        def labels(prefix):
+            return [suggestion.label for suggestion in index.lookup(prefix)]
+
+        self.assertEqual(
+            labels("sh"), ["Shirts", "Short Shorts", "T-Shirt", "Blue Shirt"]
+        )
+        self.assertEqual(labels("SHIR"), ["Shirts", "T-Shirt", "Blue Shirt"])
+        self.assertEqual(labels("blue sh"), ["Blue Shirt"])
+        self.assertEqual(labels("t shirt"), ["T-Shirt"])
+        self.assertEqual(labels("x"), [])
+        self.assertEqual(labels("  "), [])
+
+    def test_endpoint_answers_from_memory(self):
+        create_product("Blue Shirt")
+        self.client.get(self.url, {"q": "blu"})
+        with self.assertNumQueries(0):
+            data = self.client.get(self.url, {"q": "blu"}).json()
+        self.assertEqual(
+            data["suggestions"],
+            [
+                {
+                    "label": "Blue Shirt",
+                    "kind": "product",
+                    "url": "/store/category/shirts/blue-shirt/",
+                }
+            ],
+        )
+
+    def test_rebuilt_on_catalog_change(self):
+        create_product("Blue Shirt")
+        self.assertEqual(len(suggest("blue")), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            create_product("Blue Jeans")
+        self.assertEqual(len(suggest("blue")), 2)
+
+    def test_stale_index_is_served_during_a_rebuild(self):
+        create_product("Blue Shirt")
+        self.assertEqual(len(suggest("blue")), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            create_product("Blue Jeans")
+        with typeahead._lock, self.assertNumQueries(0):
+            # Another thread is rebuilding
+            self.assertEqual(len(suggest("blue")), 1)
+
+    def test_query_counts_are_written_in_batches(self):
+        flush_query_counts()
+        with self.assertNumQueries(0):
+            for query in ("cotton", "Cotton ", "linen"):
+                record_query(query)
+        # One insert and one update, in a savepoint
+        with self.assertNumQueries(4):
+            flush_query_counts()
+        record_query("cotton")
+        flush_query_counts()
+        self.assertEqual(
+            dict(SearchQueryCount.objects.values_list("query", "count")),
+            {"cotton": 3, "linen": 1},
+        )
+
+    def test_popular_queries(self):
+        create_product("Cotton Shirt", product_description="soft cotton")
+        for i in range(2):
+            self.client.get(reverse("search"), {"keyword": "Cotton"})
+        self.client.get(reverse("search"), {"keyword": "nothing matches"})
+        flush_query_counts()
+        with self.captureOnCommitCallbacks(execute=True):
+            create_product("Red Shirt")
+        kinds = [(s.label, s.kind) for s in suggest("cot")]
+        self.assertEqual(kinds, [("cotton", "query"), ("Cotton Shirt", "product")])
+        self.assertEqual(suggest("nothing"), [])
+
+
+class VariationMapTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.product = create_product("Shirt")
+        self.red, self.large = [
+            Variation.objects.create(
+                product=self.product, variation_category=category, variation_value=value
+            )
+            for category, value in (("color", " Red"), ("size", "L"))
+        ]
+
+    def test_keys_are_normalized_and_unique(self):
+        self.assertEqual((self.red.category_key, self.red.value_key), ("color", "red"))
+        with self.assertRaises(IntegrityError):
+            Variation.objects.create(
+                product=self.product, variation_category="color", variation_value="RED"
+            )
+
+    def test_resolve_from_cached_map(self):
+        variation_map(self.product.pk)
+        with self.assertNumQueries(0):
+            ids = resolve_variation_ids(
+                self.product.pk, [("Size", "l"), ("COLOR", "red "), ("color", "blue")]
+            )
+        self.assertEqual(ids, [self.large.pk, self.red.pk])
+        with self.assertNumQueries(1):
+            variations = resolve_variations(
+                self.product.pk, [("color", "Red"), ("size", "L")]
+            )
+        self.assertEqual(variations, [self.red, self.large])
+
+    def test_map_follows_variation_changes(self):
+        variation_map(self.product.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.red.is_active = False
+            self.red.save()
+        self.assertEqual(resolve_variation_ids(self.product.pk, [("color", "red")]), [])
+
+    def test_map_survives_other_catalog_changes(self):
+        variation_map(self.product.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.price = 12
+            self.product.save()
+            create_product("Tie")
+        with self.assertNumQueries(0):
+            variation_map(self.product.pk)
+
+    def test_duplicates_fail_validation(self):
+        duplicate = Variation(
+            product=self.product, variation_category="color", variation_value="RED "
+        )
+        with self.assertRaises(ValidationError):
+            duplicate.full_clean()
+        self.red.full_clean()
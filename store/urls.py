@@ -5,6 +5,7 @@ from . import views
 urlpatterns = [
     path("", views.store, name="store"),
     path("search/", views.search, name="search"),
+    path("suggest/", views.search_suggestions, name="search_suggestions"),
     path("category/<slug:category_slug>/", views.store, name="products_by_category"),
     path(
         "category/<slug:category_slug>/<slug:product_slug>/",
@@ -12,4 +13,5 @@ urlpatterns = [
         name="product_detail",
     ),
     path("submit_review/<int:product_id>", views.submit_review, name="submit_review"),
+    path("reviews/<int:product_id>/", views.product_reviews, name="product_reviews"),
 ]
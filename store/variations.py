@@ -0,0 +1,72 @@
+from django.core.cache import cache
+
+from abatua.versions import get_version
+
+from .config import VARIATION_MAP_TIMEOUT
+from .models import Variation, variation_key, variation_signature
+
+
+def variation_version_key(product_id):
+    return f"store:variations:version:{product_id}"
+
+
+def bump_variation_versions(product_ids):
+    # A missing version is reseeded with a fresh stamp on the next read
+    cache.delete_many([variation_version_key(pk) for pk in product_ids])
+
+
+def variation_map(product_id):
+    """
+    Returns {(category_key, value_key): variation id} of a product's active
+    variations. Maps are cached per product version, which only changes to
+    the product's variations bump.
+    """
+    version = get_version(variation_version_key(product_id))
+    key = f"store:variations:{version}:{product_id}"
+    variations = cache.get(key)
+    if variations is None:
+        variations = {
+            (category, value): pk
+            for pk, category, value in Variation.objects.filter(
+                product_id=product_id, is_active=True
+            ).values_list("pk", "category_key", "value_key")
+        }
+        cache.set(key, variations, VARIATION_MAP_TIMEOUT)
+    return variations
+
+
+def resolve_variation_ids(product_id, selections):
+    """
+    Maps (category, value) pairs, e.g. the fields of an add-to-cart form, to
+    variation ids in the order given, ignoring unknown pairs.
+    """
+    variations = variation_map(product_id)
+    ids = []
+    for category, value in selections:
+        pk = variations.get((variation_key(category), variation_key(value)))
+        if pk is not None and pk not in ids:
+            ids.append(pk)
+    return ids
+
+
+def resolve_variations(product_id, selections):
+    """
+    Like resolve_variation_ids, but loads the Variation instances in one
+    query (none when nothing was selected).
+    """
+    ids = resolve_variation_ids(product_id, selections)
+    if not ids:
+        return []
+    variations = Variation.objects.in_bulk(ids)
+    return [variations[pk] for pk in ids if pk in variations]
+
+
+def refresh_variation_signature(line):
+    """
+    Recomputes the signature of a cart or order line after its variations
+    changed other than through a signature-aware code path (e.g. the admin).
+    """
+    signature = variation_signature(line.variations.values_list("pk", flat=True))
+    if signature != line.variation_signature:
+        line.variation_signature = signature
+        type(line).objects.filter(pk=line.pk).update(variation_signature=signature)
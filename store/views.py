@@ -1,92 +1,142 @@
 from django.contrib import messages
-from django.core.paginator import Paginator
-from django.db.models import Q
-from django.shortcuts import get_list_or_404, get_object_or_404, redirect, render
+from django.db import transaction
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404, redirect, render
+from django.template.loader import render_to_string
 
 from accounts.config import REVIEW_SUBMITTED_MESSAGE, REVIEW_UPDATED_MESSAGE
-from carts.models import CartItem
-from carts.views import get_cart_id
 from category.models import Category
-from orders.models import OrderProduct
 
+from .config import LISTING_SORTS, REVIEW_SORTS
+from .facets import (
+    FILTER_FACETS,
+    facet_counts,
+    filter_products,
+    filter_query,
+    parse_filters,
+)
 from .forms import ReviewForm
-from .models import Product, ProductGallery, ReviewRating
+from .listing import paginate
+from .loaders import ProductDetailLoader, load_reviews
+from .models import Product, ReviewRating
+from .page_cache import cache_anonymous_page
+from .search import search_products
+from .search.typeahead import record_query, suggest
 
 
+@cache_anonymous_page(params=("sort", "cursor") + FILTER_FACETS)
 def store(request, category_slug=None):
+    products = Product.objects.filter(is_available=True).select_related("category")
     if category_slug:
-        categories = get_list_or_404(Category, slug=category_slug)
-        products = get_list_or_404(Product, is_available=True, category__in=categories)
-    else:
-        products = Product.objects.filter(is_available=True).order_by("id")
-
-    paginator = Paginator(products, 3)
-    page = request.GET.get("page")
-    paged_products = paginator.get_page(page)
-    product_count = len(products)
+        category = get_object_or_404(Category, slug=category_slug)
+        products = products.filter(category=category)
+
+    filters = parse_filters(request.GET)
+    unfiltered = products
+    products = filter_products(products, filters)
+    listing = paginate(
+        products,
+        sort=request.GET.get("sort"),
+        token=request.GET.get("cursor"),
+        count=True,
+    )
 
     context = {
-        "products": paged_products,
-        "product_count": product_count,
+        "products": listing,
+        "listing": listing,
+        "product_count": listing.estimated_total,
+        "product_count_capped": listing.total_is_capped,
+        "sorts": LISTING_SORTS,
+        "facets": facet_counts(unfiltered if category_slug else None, filters=filters),
+        "filter_query": filter_query(filters),
     }
     return render(request, "store/store.html", context)
 
 
+@cache_anonymous_page(sessionless=True, params=("review_sort",))
 def product_detail(request, category_slug=None, product_slug=None):
-    try:
-        product = get_object_or_404(Product, slug=product_slug)
-        reviews = ReviewRating.objects.filter(product=product, status=True)
-        category = get_object_or_404(Category, slug=category_slug)
-        in_cart = CartItem.objects.filter(
-            cart__cart_id=get_cart_id(request), product=product
-        ).exists()
-    except Exception as e:
-        raise e
-
-    if request.user.is_authenticated:
-        try:
-            order_product = OrderProduct.objects.filter(
-                user=request.user, product_id=product.id
-            ).exists()
-        except OrderProduct.DoesNotExist:
-            order_product = None
-    else:
-        order_product = None
-
-    # Get product gallery
-    product_gallery = ProductGallery.objects.filter(product_id=product.id)
+    detail = ProductDetailLoader(request).load(
+        category_slug, product_slug, review_sort=request.GET.get("review_sort")
+    )
 
     context = {
-        "product": product,
-        "category": category,
-        "in_cart": in_cart,
-        "order_product": order_product,
-        "reviews": reviews,
-        "product_gallery": product_gallery,
+        "product": detail.product,
+        "category": detail.category,
+        "in_cart": detail.in_cart,
+        "order_product": detail.order_product,
+        "reviews": detail.reviews,
+        "product_gallery": detail.gallery,
+        "colors": detail.colors,
+        "sizes": detail.sizes,
+        "review_sorts": REVIEW_SORTS,
+        "recommendations": detail.recommendations,
     }
 
     return render(request, "store/product_detail.html", context)
 
 
+def product_reviews(request, product_id):
+    """
+    JSON endpoint returning the next page of a product's reviews, both as
+    data and as a rendered HTML fragment the page can append.
+    """
+    reviews = load_reviews(
+        product_id, sort=request.GET.get("sort"), token=request.GET.get("cursor")
+    )
+    data = {
+        "reviews": [
+            {
+                "id": review.id,
+                "reviewer": review.user.full_name(),
+                "subject": review.subject,
+                "review": review.review,
+                "rating": review.rating,
+                "updated_at": review.updated_at.isoformat(),
+            }
+            for review in reviews
+        ],
+        "html": render_to_string("includes/reviews.html", {"reviews": reviews}),
+        "sort": reviews.sort,
+        "next": reviews.next_token,
+    }
+    return JsonResponse(data)
+
+
 def search(request):
     products = Product.objects.none()  # Initialize with an empty queryset
     product_count = 0
 
-    keyword = request.GET.get("keyword", "")  # Simplifies checking for 'keyword'
+    facets = []
+    filters = parse_filters(request.GET)
+
+    keyword = request.GET.get("keyword", "").strip()
     if keyword:
-        products = Product.objects.order_by("-date_created").filter(
-            Q(product_description__icontains=keyword)
-            | Q(product_name__icontains=keyword)
-        )
-        product_count = products.count()
+        products = search_products(keyword, request.GET.get("page"), filters=filters)
+        product_count = products.paginator.count
+        if product_count and not request.GET.get("page"):
+            record_query(keyword)
+        facets = facet_counts(product_ids=products.matched_ids, filters=filters)
 
     context = {
         "products": products,
         "product_count": product_count,
+        "keyword": keyword,
+        "facets": facets,
+        "filter_query": filter_query(filters),
     }
     return render(request, "store/store.html", context)
 
 
+def search_suggestions(request):
+    """
+    JSON typeahead for the navbar search box, answered from the in-process
+    typeahead index.
+    """
+    query = request.GET.get("q", "")
+    suggestions = [suggestion.as_dict() for suggestion in suggest(query)]
+    return JsonResponse({"query": query, "suggestions": suggestions})
+
+
 def submit_review(request, product_id):
     url = request.META.get("HTTP_REFERER")
     if request.method == "POST":
@@ -106,7 +156,8 @@ def submit_review(request, product_id):
             data.ip_address = request.META.get("REMOTE_ADDR")
             data.product_id = product_id
             data.user_id = request.user.id
-            data.save()
+            with transaction.atomic():
+                data.save()
 
             if "instance" in locals():
                 messages.success(request, "Your review has been updated!")